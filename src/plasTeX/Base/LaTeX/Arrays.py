@@ -87,11 +87,10 @@ class Array(Environment):
         """ Cell delimiter """
         macroName = 'active::&'
         def invoke(self, tex):
-            # Pop and push a new context for each cell, this keeps
+            # Start a new context for each cell, this keeps
             # any formatting changes from the previous cell from
             # leaking over into the next cell
-            self.ownerDocument.context.pop()
-            self.ownerDocument.context.push()
+            self.ownerDocument.context.renewGroup()
             # Add a phantom cell to absorb the appropriate tokens
             return [self, self.ownerDocument.createElement('ArrayCell')]
 
@@ -101,12 +100,18 @@ class Array(Environment):
         args = '* [ space ]'
 
         def invoke(self, tex):
-            # Pop and push a new context for each row, this keeps
+            # Start a new context for each row, this keeps
             # any formatting changes from the previous row from
-            # leaking over into the next row
-            self.ownerDocument.context.pop()
-            self.parse(tex)
-            self.ownerDocument.context.push()
+            # leaking over into the next row.  An untouched cell
+            # context can be reused as is.
+            context = self.ownerDocument.context
+            if context.isPristineGroup:
+                self.parse(tex)
+                context.renewGroup()
+            else:
+                context.pop()
+                self.parse(tex)
+                context.push()
             # Add a phantom row and cell to absorb the appropriate tokens
             return [self, self.ownerDocument.createElement('ArrayRow'),
                           self.ownerDocument.createElement('ArrayCell')]
@@ -30,8 +30,25 @@ class document(Environment, SectionUtils):
                 except TypeError:
                     self.ownerDocument.context.counters[name].setcounter(int(counters[name])-1)
 
+        if self.macroMode != Environment.MODE_END:
+            handler = getattr(self.ownerDocument, 'sectionHandler', None)
+            if handler is not None:
+                handler(self, None)
+
         return res
- 
+
+    def appendChild(self, newChild, setParent=True):
+        result = Environment.appendChild(self, newChild, setParent=setParent)
+
+        # Hand complete top-level sections to the streaming renderer
+        handler = getattr(self.ownerDocument, 'sectionHandler', None)
+        if handler is not None and \
+           newChild.nodeType == Environment.ELEMENT_NODE and \
+           newChild.level < Environment.ENDSECTIONS_LEVEL:
+            handler(self, newChild)
+
+        return result
+
     @property
     def index(self):
         idx = self.getElementsByTagName(['theindex','printindex'])
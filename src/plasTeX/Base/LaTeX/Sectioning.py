@@ -7,6 +7,7 @@ C.4 Sectioning and Table of Contents (p174)
 
 from plasTeX import Command
 from plasTeX.Logging import getLogger
+from plasTeX._util import documentSection
 
 log = getLogger()
 
@@ -18,17 +19,23 @@ from zope.cachedescriptors.property import Lazy as cachedproperty
 
 class TableOfContents(object):
     """
-    Table of Contents object
+    Table of Contents entry
 
-    The table of contents object is a proxy object that limits the
-    depth of a table of contents entry.  Each time the `tableofcontents'
-    attribute is accessed on the given node, the depth level is
-    increased.  Once the depth limit has been reached, no more
-    table of contents entries are returned.
+    Entries make up a depth-limited tree of the sections below a node.
+    The `tableofcontents' (or `fulltableofcontents') attribute of an
+    entry returns the entries one level down, until the depth limit
+    has been reached.  The tree is materialized on first access and
+    shared by the whole document, so repeated renderings of the same
+    table of contents (e.g. on every page) don't create new entries.
+
+    All other attributes are read from the section the entry refers to.
 
     """
 
-    def __init__(self, node, limit, level=1):
+    __slots__ = ('_toc_node', '_toc_limit', '_toc_level', '_toc_entries',
+                 '_toc_children')
+
+    def __init__(self, node, limit, level=1, entries=None):
         """
         Instantiate a table of contents object
 
@@ -36,34 +43,158 @@ class TableOfContents(object):
         node -- the node to retrieve the table of contents from
         limit -- the number of levels to display
         level -- the current level
+        entries -- dictionary of the entries already created for the
+            document, keyed by node id, limit and level
 
         """
         self._toc_node = node
         self._toc_limit = limit
         self._toc_level = level
+        self._toc_entries = entries if entries is not None else {}
+        self._toc_children = None
+
+    @classmethod
+    def entry(cls, node, limit, level, entries):
+        """ Return the shared entry for `node' at the given depth """
+        key = (id(node), limit, level)
+        toc = entries.get(key)
+        if toc is None:
+            toc = entries[key] = cls(node, limit, level, entries)
+        return toc
+
+    @property
+    def tableofcontents(self):
+        """ Entries of the next level, limited by the depth limit """
+        children = self._toc_children
+        if children is None:
+            if self._toc_level < self._toc_limit:
+                children = tuple(self.entry(x, self._toc_limit,
+                                            self._toc_level + 1,
+                                            self._toc_entries)
+                                 for x in self._toc_node.tocSections)
+            else:
+                children = ()
+            self._toc_children = children
+        return children
+
+    fulltableofcontents = tableofcontents
+
+    @property
+    def depth(self):
+        return self._toc_level
+
+    # Entries pass for the section they refer to
+    @property
+    def __class__(self):
+        return self._toc_node.__class__
+
+    def __getattr__(self, name):
+        return getattr(self._toc_node, name)
 
-    def __getattribute__(self, name):
-        """
-        Proxy all attributes to the real object except `tableofcontents'
+# Navigation keys that are always present in `links', most of them
+# are only filled in by the user or by packages
+_NAV_DEFAULTS = dict.fromkeys(['appendix', 'glossary', 'bibliography',
+    'help', 'index', 'search', 'bookmark', 'banner', 'copyright',
+    'trademark', 'disclaimer', 'publisher', 'editor', 'author', 'made',
+    'meta', 'script', 'shortcut icon'])
 
-        Each nested call to the tableofcontents should limit the
-        depth of the items displayed.
+class NavigationIndex(object):
+    """
+    Document-wide navigation information
 
+    The index is built once per document from the sections that
+    create files and is shared by the `links' property of every
+    section.  It contains the ordered list of file-producing sections
+    along with their positions, the breadcrumb trails of each section,
+    and the user-defined links from the configuration.
+
+    This must only be created once filenames have been assigned
+    (i.e. at render time).
+
+    """
+
+    def __init__(self, document):
         """
-        # Attributes that belong to the ToC object
-        if name.startswith('_toc_'):
-            return object.__getattribute__(self, name)
+        Required Arguments:
+        document -- the top-level (document) section
 
-        # Limit the number of ToC levels
-        if name in ('tableofcontents','fulltableofcontents'):
-            if self._toc_level < self._toc_limit:
-                return [type(self)(x._toc_node, self._toc_limit, self._toc_level + 1)
-                        for x in self._toc_node.fulltableofcontents]
+        """
+        self.sections = [x for x in document.documentSections if x.filename]
+        self.positions = dict((id(x), i) for i, x in enumerate(self.sections))
+        self._breadcrumbs = {}
 
-            return ()
+        # Navigation info from the linkTypes
+        self.navinfo = dict(document.ownerDocument.userdata.get('links', {}))
 
-        # All other attribute accesses get passed on
-        return getattr(self._toc_node, name)
+        # User-defined links
+        links = {}
+        config = document.config.snapshot
+        if 'links' in config:
+            for key, value in config['links'].items():
+                if '-' not in key:
+                    continue
+                newkey, type = key.strip().split('-',1)
+                if newkey not in links:
+                    links[newkey] = {}
+                links[newkey][type] = value
+        self.userlinks = links
+
+    def breadcrumbs(self, node):
+        """ Return the list of sections from the top of the document to `node' """
+        key = id(node)
+        try:
+            return self._breadcrumbs[key]
+        except KeyError:
+            pass
+        parent = node.parentNode
+        if node.level > Command.DOCUMENT_LEVEL and parent is not None:
+            crumbs = self.breadcrumbs(parent) + [node]
+        else:
+            crumbs = [node]
+        self._breadcrumbs[key] = crumbs
+        return crumbs
+
+    def neighbors(self, node):
+        """ Return the previous and next file-producing sections of `node' """
+        sections = self.sections
+        try:
+            i = self.positions[id(node)]
+        except KeyError:
+            return (sections[-1] if sections else None), None
+        prev = sections[i-1] if i > 0 else None
+        next = sections[i+1] if i + 1 < len(sections) else None
+        return prev, next
+
+def _bucketBySection(entries, owners):
+    """
+    Group entries by the closest enclosing section that creates a file
+
+    Required Arguments:
+    entries -- iterable of nodes (e.g. footnotes)
+    owners -- dictionary used to memoize the owning section of each
+        section that doesn't create a file (keyed by id())
+
+    Returns:
+    dictionary mapping the id() of a section to the list of its entries
+    in document order.  Entries without such a section are dropped.
+
+    """
+    buckets = {}
+    for entry in entries:
+        s = entry.currentSection
+        chain = []
+        while s is not None and not s.filename:
+            key = id(s)
+            if key in owners:
+                s = owners[key]
+                break
+            chain.append(key)
+            s = s.currentSection
+        for key in chain:
+            owners[key] = s
+        if s is not None:
+            buckets.setdefault(id(s), []).append(entry)
+    return buckets
 
 class SectionUtils(object):
     """ General utilities for getting information about sections """
@@ -72,28 +203,45 @@ class SectionUtils(object):
 
     @cachedproperty
     def footnotes(self):
-        output = []
-        for f in self.ownerDocument.userdata.get('footnotes', ()):
-            s = f.currentSection
-            while s is not None and not s.filename:
-                s = s.currentSection
-            if s is self:
-                output.append(f)
-        for i, f in enumerate(output):
-            f.mark.attributes['num'] = i+1
-        return tuple(output)
+        return tuple(self.sectionEntries['footnotes'].get(id(self), ()))
 
     # SAJ: Allows fetching of only the glossary entries for the current section
     @cachedproperty
     def glossary(self):
-        output = []
-        for f in self.ownerDocument.userdata.get('glossary', ()):
-            s = f.currentSection
-            while s is not None and not s.filename:
-                s = s.currentSection
-            if s is self:
-                output.append(f)
-        return tuple(output)
+        return tuple(self.sectionEntries['glossary'].get(id(self), ()))
+
+    @cachedproperty
+    def sectionEntries(self):
+        """
+        Footnotes and glossary entries of the document grouped by section
+
+        Each entry belongs to the closest enclosing section that creates
+        a file.  The grouping is done once for the whole document in a
+        single pass over the entries; footnotes are numbered within their
+        section in the same pass.
+
+        Returns:
+        dictionary with the keys `footnotes' and `glossary', each
+        mapping the id() of a section to a list of entries
+
+        """
+        document = self._documentSection()
+        if document is not None and document is not self:
+            return document.sectionEntries
+
+        userdata = self.ownerDocument.userdata
+        owners = {}
+        footnotes = _bucketBySection(userdata.get('footnotes', ()), owners)
+        for entries in footnotes.values():
+            for i, f in enumerate(entries):
+                if f.mark is not None:
+                    f.mark.attributes['num'] = i+1
+        glossary = _bucketBySection(userdata.get('glossary', ()), owners)
+        return {'footnotes': footnotes, 'glossary': glossary}
+
+    def _documentSection(self):
+        """ Return the document-level section containing this one """
+        return documentSection(self)
 
     @cachedproperty
     def subsections(self):
@@ -116,19 +264,33 @@ class SectionUtils(object):
         if require_a_file and not (x for x in self.subsections if x.filename):
             return ()
 
+        entries = self.tocEntries
+        return tuple((TableOfContents.entry(x, tocdepth, 1, entries)
+                      for x in self.tocSections))
+
+    @cachedproperty
+    def tocSections(self):
+        """ Subsections that appear in the table of contents """
         # Include sections that don't create files in the ToC?
-        toc_non_files = self.config['document']['toc-non-files']
-        return tuple((TableOfContents(x, tocdepth)
-                      for x in self.subsections
+        toc_non_files = self.config.snapshot.document.toc_non_files
+        return tuple((x for x in self.subsections
                       if toc_non_files or x.filename))
 
+    @cachedproperty
+    def tocEntries(self):
+        """ The table of contents entries shared by the document """
+        document = self._documentSection()
+        if document is not None and document is not self:
+            return document.tocEntries
+        return {}
+
     @cachedproperty
     def tableofcontents(self):
         """ Return a toble of contents object limited to toc-depth """
         if self.tocdepth is not None:
             tocdepth = self.tocdepth
         else:
-            tocdepth = self.config['document']['toc-depth']
+            tocdepth = self.config.snapshot.document.toc_depth
 
         return self._gen_toc( tocdepth, True )
 
@@ -150,11 +312,9 @@ class SectionUtils(object):
     @cachedproperty
     def documentSections(self):
         """ Retrieve a list of all sections in the document """
-        document = self
-        while document.level is not Command.DOCUMENT_LEVEL:
-            document = document.parentNode
-            if document is None:
-                return ()
+        document = documentSection(self)
+        if document is None:
+            return ()
         return document.allSections
 
     def containedChildNodesImplementing(self, iface):
@@ -188,31 +348,17 @@ class SectionUtils(object):
         See http://fantasai.tripod.com/qref/Appendix/LinkTypes/ltdef.html
 
         """
-        sections = [x for x in self.documentSections if x.filename]
+        index = self.navigationIndex
+        sections = index.sections
 
-        breadcrumbs = [self]
+        breadcrumbs = list(index.breadcrumbs(self))
         parent = None
         if self.level > Command.DOCUMENT_LEVEL:
-            item = parent = self.parentNode
-            while item is not None and item.level > Command.DOCUMENT_LEVEL:
-                breadcrumbs.append(item)
-                item = item.parentNode
-            if item is not None:
-                breadcrumbs.append(item)
-        breadcrumbs.reverse()
+            parent = self.parentNode
 
         first = top = breadcrumbs[0]
-        last = sections[-1]
-        prev = next = None
-        breaknext = False
-        for item in sections:
-            if item is self:
-                breaknext = True
-                continue
-            if breaknext:
-                next = item
-                break
-            prev = item
+        last = sections[-1] if sections else None
+        prev, next = index.neighbors(self)
 
         document = part = chapter = section = subsection = None
         for item in breadcrumbs:
@@ -227,7 +373,7 @@ class SectionUtils(object):
             elif item.level == Command.SUBSECTION_LEVEL:
                 subsection = item
 
-        nav = {}
+        nav = dict(_NAV_DEFAULTS)
         nav['home'] = top
         nav['start'] = top
         nav['begin'] = nav['first'] = first
@@ -248,56 +394,33 @@ class SectionUtils(object):
         nav['chapter'] = chapter
         nav['section'] = section
         nav['subsection'] = subsection
-        nav['appendix'] = None
-        nav['glossary'] = None
-        nav['bibliography'] = None
-        nav['help'] = None
         nav['navigator'] = top
         nav['toc'] = nav['contents'] = top
-        nav['index'] = None
-        nav['search'] = None
-        nav['bookmark'] = None
-        nav['banner'] = None
-        nav['copyright'] = None
-        nav['trademark'] = None
-        nav['disclaimer'] = None
-        nav['publisher'] = None
-        nav['editor'] = None
-        nav['author'] = None
-        nav['made'] = None
-        nav['meta'] = None
-        nav['script'] = None
         nav['stylesheet'] = []
         nav['alternate'] = []
         nav['translation'] = []
 
         # Additional related entries
-        nav['shortcut icon'] = None
         nav['breadcrumbs'] = breadcrumbs
 
         # Get navigation info from the linkTypes
-        navinfo = self.ownerDocument.userdata.get('links', {})
-        for key, value in list(navinfo.items()):
-            nav[key] = value
-
-        # Get user-defined links
-        links = {}
-        if 'links' in self.config:
-            for key in list(self.config['links'].keys()):
-                if '-' not in key:
-                    continue
-                newkey, type = key.strip().split('-',1)
-                if newkey not in links:
-                    links[newkey] = {}
-                links[newkey][type] = self.config['links'][key]
+        nav.update(index.navinfo)
 
-        # Set links in nav object
-        for key, value in list(links.items()):
+        # Set user-defined links in nav object
+        for key, value in index.userlinks.items():
             if key not in nav or nav[key] is None:
                 nav[key] = value
 
         return nav
 
+    @cachedproperty
+    def navigationIndex(self):
+        """ The NavigationIndex shared by all sections of the document """
+        document = self._documentSection()
+        if document is not None and document is not self:
+            return document.navigationIndex
+        return NavigationIndex(self)
+
     def digest(self, tokens):
         # Absorb the tokens that belong to us
 #       text = []
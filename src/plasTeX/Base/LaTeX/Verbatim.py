@@ -9,6 +9,8 @@ from plasTeX import Macro, Environment, Command, sourceArguments, sourceChildren
 from plasTeX.Base.TeX.Text import bgroup, egroup
 from plasTeX.Tokenizer import Other
 
+from six import text_type
+
 class verbatim(Environment):
     blockType = True
     captionable = True
@@ -35,44 +37,44 @@ class verbatim(Environment):
             name = self.ownerDocument.context.currenvir
 
         # If we were invoke by a \begin{...} look for an \end{...}
-        endpattern = list(r'%send%s%s%s' % (escape, bgroup, name, egroup))
+        endpattern = r'%send%s%s%s' % (escape, bgroup, name, egroup)
+        endpatterns = [endpattern]
 
         # If we were invoked as a command (i.e. \verbatim) look
-        # for an end without groupings (i.e. \endverbatim)
-        endpattern2 = list(r'%send%s' % (escape, name))
-
-        endlength = len(endpattern)
-        endlength2 = len(endpattern2)
-        # Iterate through tokens until the endpattern is found
-        for tok in tex:
-            tokens.append(tok)
-            if len(tokens) >= endlength:
-                if tokens[-endlength:] == endpattern:
-                    tokens = tokens[:-endlength]
-                    self.ownerDocument.context.pop(self)
-                    # Expand the end of the macro
-                    end = self.ownerDocument.createElement(name)
-                    end.parentNode = self.parentNode
-                    end.macroMode = Environment.MODE_END
-                    res = end.invoke(tex)
-                    if res is None:
-                        res = [end]
-                    tex.pushTokens(res)
-                    break
-            elif len(tokens) >= endlength2:
-                if tokens[-endlength2:] == endpattern2:
-                    tokens = tokens[:-endlength2]
-                    self.ownerDocument.context.pop(self)
-                    # Expand the end of the macro
-                    end = self.ownerDocument.createElement(name)
-                    end.parentNode = self.parentNode
-                    end.macroMode = Environment.MODE_END
-                    res = end.invoke(tex)
-                    if res is None:
-                        res = [end]
-                    tex.pushTokens(res)
+        # for an end without groupings (i.e. \endverbatim) as well
+        if self.macroMode != Environment.MODE_BEGIN:
+            endpatterns.append(r'%send%s' % (escape, name))
+
+        # Find the end in the raw text of the current input
+        text, found = tex.readRaw(endpatterns)
+        if text:
+            tokens.append(Other(text))
+
+        # The end is in a later input, so iterate through tokens
+        # until the endpattern is found
+        if found is None:
+            for tok in tex:
+                tokens.append(tok)
+                for pattern in endpatterns:
+                    if len(tokens) >= len(pattern) and \
+                       tokens[-len(pattern):] == list(pattern):
+                        tokens = tokens[:-len(pattern)]
+                        found = pattern
+                        break
+                if found is not None:
                     break
 
+        if found is not None:
+            self.ownerDocument.context.pop(self)
+            # Expand the end of the macro
+            end = self.ownerDocument.createElement(name)
+            end.parentNode = self.parentNode
+            end.macroMode = Environment.MODE_END
+            res = end.invoke(tex)
+            if res is None:
+                res = [end]
+            tex.pushTokens(res)
+
         return tokens
 
     def normalize(self, charsubs=[]):
@@ -108,10 +110,16 @@ class verb(Command):
             break
         tokens = [self, endpattern]
         # Parse until this delimiter is seen again
-        for tok in tex:
-            tokens.append(tok)
-            if tok == endpattern:
-                break
+        text, found = tex.readRaw([text_type(endpattern)])
+        if text:
+            tokens.append(Other(text))
+        if found is not None:
+            tokens.append(Other(found))
+        else:
+            for tok in tex:
+                tokens.append(tok)
+                if tok == endpattern:
+                    break
         self.ownerDocument.context.pop(self)
         return tokens
 
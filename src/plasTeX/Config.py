@@ -156,9 +156,84 @@ def newConfig(read_files=True):
         callback = _ReadConfig(config)
     )
 
+    general['diagnostics-file'] = StringOption(
+        """
+        Write a JSON summary of the warnings produced in each phase
+        (parsing, rendering) to this file
+
+        """,
+        options = '--diagnostics-file',
+        default = '',
+    )
+
+    general['warning-limit'] = IntegerOption(
+        """ Number of times each distinct warning is displayed """,
+        options = '--warning-limit',
+        default = 1,
+    )
+
+    general['jobs'] = IntegerOption(
+        """
+        Number of worker processes for work that can be done in parallel,
+        like syntax highlighting.  0 means one for each CPU, 1 means the
+        work is done in this process.
+
+        """,
+        options = '--jobs -j',
+        default = 0,
+    )
+
+    general['highlight-cache'] = BooleanOption(
+        """ Keep syntax highlighted listings in .cache/listings between runs """,
+        options = '--enable-highlight-cache !--disable-highlight-cache',
+        default = False,
+    )
+
+    general['stream'] = BooleanOption(
+        """
+        Render one top-level section at a time to bound memory use
+
+        The document is parsed twice: the first pass only collects the
+        labels, filenames and table of contents, the second pass renders
+        and releases each top-level section as soon as it is complete.
+
+        """,
+        options = '--stream !--no-stream',
+        default = False,
+    )
+
+    general['incremental'] = BooleanOption(
+        """
+        Only render the top-level sections that changed since the last run
+
+        Implies --stream.  What each section was built from is recorded
+        in the file *.pdep in the working directory, and the image cache
+        is enabled so that the images of the other sections are kept.
+
+        """,
+        options = '--incremental !--no-incremental',
+        default = False,
+    )
+
+    general['label-store'] = StringOption(
+        """
+        Name of the database that cross-document labels are written to,
+        e.g. plastex-labels.db
+
+        The database is written in the working directory and read from
+        there and from the --paux-dirs directories.  Labels are only
+        read when they are referenced.  By default, no database is
+        used: the labels are written to the file *.paux and all the
+        *.paux files are read.
+
+        """,
+        options = '--label-store',
+        default = '',
+    )
+
     general['paux-dirs'] = MultiOption(
         """
-        Directories where *.paux files should be loaded from.
+        Directories where *.paux files or label stores should be loaded from.
 
         """,
         options = '--paux-dirs',
@@ -325,6 +400,52 @@ def newConfig(read_files=True):
         category = 'images',
     )
 
+    images['static-cache'] = BooleanOption(
+        """
+        Cache images that are copied or converted from the graphics
+        included in the document between runs, in .cache/static-images
+
+        """,
+        options = '--enable-static-image-cache !--disable-static-image-cache',
+        default = False,
+        category = 'images',
+    )
+
+    images['static-resolutions'] = MultiOption(
+        """
+        Scale factors of other resolutions to write included graphics
+        in, e.g. 2 writes img@2x.png next to img.png
+
+        """,
+        options = '--static-image-resolutions',
+        template = FloatOption,
+        category = 'images',
+    )
+
+    images['batch-size'] = IntegerOption(
+        """
+        Number of images that are compiled and converted together while
+        the document is still being rendered.  0 means that all of the
+        images are compiled and converted when rendering is done.
+
+        """,
+        options = '--image-batch-size',
+        default = 200,
+        category = 'images',
+    )
+
+    images['batch-time'] = FloatOption(
+        """
+        Seconds after which a batch of images is compiled and converted
+        even if it has fewer than --image-batch-size images.  0 means
+        that batches only depend on their size.
+
+        """,
+        options = '--image-batch-time',
+        default = 10.0,
+        category = 'images',
+    )
+
     images['save-file'] = BooleanOption(
         """ Should the temporary images.tex file be saved for debugging? """,
         options = '--save-image-file !--delete-image-file',
@@ -339,6 +460,50 @@ def newConfig(read_files=True):
         category = 'images',
     )
 
+    images['transparent-color'] = StringOption(
+        """ Color of the image background that is made transparent """,
+        options = '--transparent-image-color',
+        default = 'white',
+        category = 'images',
+    )
+
+    images['grayscale'] = BooleanOption(
+        """
+        Write images that only have shades of gray, like anti-aliased
+        equations, with one channel instead of three
+
+        """,
+        options = '--grayscale-images !--no-grayscale-images',
+        default = False,
+        category = 'images',
+    )
+
+    images['palette'] = IntegerOption(
+        """
+        Number of colors in the adaptive palette that images are
+        reduced to.  Anti-aliased equations rarely need more than 16
+        shades of gray.  0 keeps all of the colors.
+
+        """,
+        options = '--image-palette',
+        default = 0,
+        category = 'images',
+    )
+
+    images['compression'] = IntegerOption(
+        """ PNG compression level of images, from 0 (none) to 9 (smallest) """,
+        options = '--image-compression',
+        default = 6,
+        category = 'images',
+    )
+
+    images['optimize'] = BooleanOption(
+        """ Make extra passes to find the smallest PNG encoding of images """,
+        options = '--optimize-images !--no-optimize-images',
+        default = False,
+        category = 'images',
+    )
+
     images['resolution'] = IntegerOption(
         """ Resolution of images document """,
         options = '--image-resolution',
@@ -615,6 +615,21 @@ class GenericOption(object):
                 return 1
         return 0
 
+    def _get_data(self):
+        return self.__dict__.get('data')
+    def _set_data(self, value):
+        self.__dict__['data'] = value
+        self.invalidate()
+    data = property(_get_data, _set_data,
+                    doc=""" Current value of the option.  Setting it
+                    invalidates the configuration snapshot """)
+
+    def invalidate(self):
+        """ Discard any configuration snapshot that includes this option """
+        parent = self.__dict__.get('parent')
+        if parent is not None and hasattr(parent, 'invalidate'):
+            parent.invalidate()
+
     def clearValue(self):
         """ Reset the option value to None """
         self.data = None
@@ -28,7 +28,7 @@ from textwrap import wrap
 from six import string_types
 from six import text_type
 
-__all__ = ['ConfigManager','BooleanOption','IntegerOption','CompoundOption',
+__all__ = ['ConfigManager','ConfigSnapshot','FrozenSection','BooleanOption','IntegerOption','CompoundOption',
            'MultiOption','GenericOption','FloatOption','StringOption',
            'InputFileOption','OutputFileOption','InputDirectoryOption',
            'OutputDirectoryOption','CountedOption',
@@ -218,12 +218,18 @@ class ConfigSection(UserDict, object):
             setattr(newcopy, key, value)
         for key, value in self.data.items():
             newcopy.data[key] = value.copy()
+            newcopy.data[key].setParent(newcopy)
         return newcopy
 
     def setParent(self, parent):
         """ Set the parent ConfigManager instance """
         self.parent = parent
 
+    def invalidate(self):
+        """ Discard the parent's configuration snapshot """
+        if self.parent is not None:
+            self.parent.invalidate()
+
     def defaults(self):
         """ Return the dictionary of defaults """
         return self.parent.defaults()
@@ -266,6 +272,8 @@ class ConfigSection(UserDict, object):
                    list: MultiOption,
                    tuple: MultiOption}
 
+        self.invalidate()
+
         if option in self.data:
             if self.data[option].source <= source:
                 self.data[option].source = source
@@ -298,6 +306,11 @@ class ConfigSection(UserDict, object):
         """ Set the item in the dictionary """
         self.set(key, value, source=BUILTIN)
 
+    def __delitem__(self, key):
+        """ Remove an option """
+        del self.data[key]
+        self.invalidate()
+
     def getint(self, option):
         """ Get the option value and cast it to an integer """
         return int(self[option])
@@ -464,6 +477,67 @@ class ConfigSection(UserDict, object):
         return self.to_string(ALL)
 
 
+class FrozenSection(dict):
+    """
+    Read-only section of a configuration snapshot
+
+    Options can be accessed as items using their real names or as
+    attributes with dashes replaced by underscores.
+
+    """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            pass
+        try:
+            return self[name.replace('_', '-')]
+        except KeyError:
+            raise AttributeError(name)
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('configuration snapshots are read-only')
+
+    __setitem__ = __delitem__ = __setattr__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+
+class ConfigSnapshot(object):
+    """
+    Read-only view of all configuration sections
+
+    See ConfigManager.snapshot.
+
+    """
+
+    __slots__ = ('_sections',)
+
+    def __init__(self, sections):
+        object.__setattr__(self, '_sections', sections)
+
+    def __getitem__(self, key):
+        return self._sections[key]
+
+    def __getattr__(self, name):
+        try:
+            return self._sections[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self, key):
+        return key in self._sections
+
+    def __setattr__(self, name, value):
+        raise TypeError('configuration snapshots are read-only')
+
+    def __reduce__(self):
+        return (type(self), (self._sections,))
+
+
 class ConfigManager(UserDict, object):
 
     # Regular expressions for parsing section headers and options.
@@ -500,6 +574,7 @@ class ConfigManager(UserDict, object):
            make up the section by the name DEFAULTSECT.
 
         """
+        self._snapshot = None
         UserDict.__init__(self)
         self[DEFAULTSECT] = ConfigSection(DEFAULTSECT, defaults)
         self.strict = 1     # Raise exception for unknown options
@@ -515,8 +590,58 @@ class ConfigManager(UserDict, object):
             setattr(newcopy, key, value)
         for key, value in list(self.data.items()):
             newcopy.data[key] = value.copy()
+            newcopy.data[key].setParent(newcopy)
+        newcopy._snapshot = None
         return newcopy
 
+    @property
+    def snapshot(self):
+        """
+        Immutable, fully resolved copy of all configuration values
+
+        The snapshot is built on first access and reused until an
+        option or section is changed.  Values are interpolated and
+        cast exactly as returned by ``config[section][option]``, lists
+        are converted to tuples.  Sections are available both as
+        items and attributes, with dashes in option names replaced by
+        underscores for attribute access (e.g.
+        ``config.snapshot.files.input_encoding``).
+
+        Only changes made by assigning or setting options are noticed.
+        The values of options with several values are lists that may
+        be changed in place (e.g.
+        ``config['general']['paux-dirs'].append(path)``); call
+        `invalidate' after doing so, or the snapshot keeps the old
+        values.
+
+        """
+        snapshot = self.__dict__.get('_snapshot')
+        if snapshot is None:
+            sections = {}
+            for name, section in self.data.items():
+                values = {}
+                for key, option in list(section.data.items()):
+                    # Reading an option may change where it is said to
+                    # come from, which decides whether later
+                    # assignments are kept, so keep that as it was
+                    source, file = option.source, option.file
+                    try:
+                        value = section[key]
+                    except ConfigError:
+                        continue
+                    finally:
+                        option.source, option.file = source, file
+                    if isinstance(value, list):
+                        value = tuple(value)
+                    values[key] = value
+                sections[name] = FrozenSection(values)
+            snapshot = self.__dict__['_snapshot'] = ConfigSnapshot(sections)
+        return snapshot
+
+    def invalidate(self):
+        """ Discard the current configuration snapshot """
+        self.__dict__['_snapshot'] = None
+
     def set_prefixes(cls, arg1, arg2=None):
         """
         Set the command-line option prefixes
@@ -723,6 +848,7 @@ class ConfigManager(UserDict, object):
 
     def __setitem__(self, key, value):
         """ Add a section to the configuration """
+        self.invalidate()
         if isinstance(value, ConfigSection):
            self.data[key] = value
            self.data[key].setParent(self)
@@ -730,6 +856,11 @@ class ConfigManager(UserDict, object):
            self.data[key] = ConfigSection(str(key))
            self.data[key].setParent(self)
 
+    def __delitem__(self, key):
+        """ Remove a section """
+        del self.data[key]
+        self.invalidate()
+
     def __getitem__(self, key):
         """
         Return section with given name
@@ -102,6 +102,52 @@ class Counters(dict):
         return c
 
 
+class Labels(dict):
+    """
+    Labeled objects by label
+
+    Labels that are not in the dictionary are looked up in the label
+    stores of other documents (see `Context.addLabelStore'), and the
+    labeled object is only created the first time its label is used.
+
+    """
+
+    def __init__(self, context):
+        dict.__init__(self)
+        self.context = context
+        # (store, rtype, exclude) tuples
+        self.stores = []
+        # Labels that none of the stores have
+        self.missing = set()
+
+    def load(self, key):
+        """ Return the labeled object for `key' from the stores, or None """
+        if not self.stores or key in self.missing:
+            return None
+        for store, rtype, exclude in self.stores:
+            data = store.lookup(key, rtype, exclude)
+            if data is not None:
+                node = self.context.restoreLabel(data)
+                dict.__setitem__(self, key, node)
+                return node
+        self.missing.add(key)
+        return None
+
+    def __missing__(self, key):
+        node = self.load(key)
+        if node is None:
+            raise KeyError(key)
+        return node
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or self.load(key) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
 class LanguageParser(object):
     """ Parser for language commands """
 
@@ -188,7 +234,7 @@ class Context(object):
         self.currentlabel = None
 
         # Labeled objects
-        self.labels = {}
+        self.labels = Labels(self)
         self.persistentLabels = {}
 
         # Unresolved refs
@@ -328,22 +374,80 @@ class Context(object):
         else:
             stream = filename_or_stream
 
-        wou = self.warnOnUnrecognized
         try:
             d = pickle.load(stream)
-            data = d.get(rtype, {})
+            self.restoreLabels(d.get(rtype, {}))
+        finally:
+            if needs_close:
+                stream.close()
 
+    def restoreLabels(self, data):
+        """
+        Create labels from persisted cross-document information
 
-            self.warnOnUnrecognized = False
-            for key, value in list(data.items()):
-                n = self[value.get('macroName','Macro')]()
-                n.restore(value)
-                self.labels[key] = n
+        Required Arguments:
+        data -- dictionary mapping labels to the attributes returned
+            by the `persist' method of the labeled nodes
+
+        """
+        for key, value in list(data.items()):
+            self.labels[key] = self.restoreLabel(value)
+
+    def restoreLabel(self, value):
+        """
+        Create a labeled object from persisted cross-document information
+
+        Required Arguments:
+        value -- the attributes returned by the `persist' method of
+            the labeled node
+
+        Returns:
+        macro instance
 
+        """
+        wou = self.warnOnUnrecognized
+        try:
+            self.warnOnUnrecognized = False
+            n = self[value.get('macroName','Macro')]()
+            n.restore(value)
+            return n
         finally:
             self.warnOnUnrecognized = wou
-            if needs_close:
-                stream.close()
+
+    def addLabelStore(self, store, rtype='none', exclude=None):
+        """
+        Look up the labels that are not defined in a label store
+
+        Labels are only read from the store when they are first used.
+
+        Required Arguments:
+        store -- `plasTeX.LabelStore.LabelStore' instance
+
+        Keyword Arguments:
+        rtype -- the name of the renderer whose labels are used
+        exclude -- the name of a document whose labels are ignored,
+            usually the one being processed
+
+        """
+        self.labels.stores.append((store, rtype, exclude))
+        self.labels.missing.clear()
+
+    def persistLabels(self, store, document, rtype='none'):
+        """
+        Write cross-document information for labeled nodes to a label store
+
+        Required Arguments:
+        store -- `plasTeX.LabelStore.LabelStore' instance
+        document -- the name of the document, usually its jobname
+
+        Keyword Arguments:
+        rtype -- the name of the renderer used
+
+        """
+        store.update(document,
+                     dict((key, value.persist())
+                          for key, value in list(self.persistentLabels.items())),
+                     rtype)
 
     @property
     def isMathMode(self):
@@ -721,6 +825,38 @@ class Context(object):
 
         return newcontext
 
+    @property
+    def isPristineGroup(self):
+        """
+        Is the innermost context an untouched anonymous grouping?
+
+        An anonymous grouping that has had no local macros defined
+        and no category codes changed is indistinguishable from a
+        freshly pushed one.
+
+        """
+        contexts = self.contexts
+        if len(contexts) < 2:
+            return False
+        top = contexts[-1]
+        return top.obj is None and not dict.__len__(top) and \
+               top.categories is contexts[-2].categories
+
+    def renewGroup(self):
+        """
+        Replace the innermost anonymous grouping with a new one
+
+        This is equivalent to calling pop() followed by push(), but
+        when the current grouping is still pristine (see isPristineGroup),
+        the grouping is simply reused rather than rebuilt.  This keeps
+        frequent group boundaries (e.g. table cells) cheap.
+
+        """
+        if self.isPristineGroup:
+            return
+        self.pop()
+        self.push()
+
     def importMacros(self, context):
         """
         Import macros from given context into the global namespace
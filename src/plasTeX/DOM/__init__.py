@@ -398,8 +398,13 @@ class NamedNodeMap(dict):
 
         """
         self._resetPosition(value)
+        _invalidateNormalized(self.parentNode)
         dict.__setitem__(self, name, value)
 
+    def __delitem__(self, name):
+        _invalidateNormalized(self.parentNode)
+        dict.__delitem__(self, name)
+
     def _resetPosition(self, value, parent=None):
         """
         Set the parent node and owner document of the value
@@ -450,6 +455,153 @@ class NamedNodeMap(dict):
             self[key] = value
 
 
+#: Number of nodes that `Node.normalize' rebuilt and the number of
+#: unchanged subtrees that it skipped
+normalizeStatistics = {'rebuilt': 0, 'skipped': 0}
+
+def _invalidateNormalized(node):
+    """
+    Mark `node' and its ancestors as needing normalization
+
+    A normalized node only contains normalized nodes, so we can stop
+    at the first ancestor that isn't normalized.  Document fragments
+    don't keep their state and are passed through.
+
+    """
+    while node is not None:
+        if node._dom_normalized is not None:
+            node._dom_normalized = None
+        elif node.nodeType != Node.DOCUMENT_FRAGMENT_NODE:
+            return
+        node = node.parentNode
+
+def _isNormalized(node):
+    """ Has `node' been normalized since it was last changed? """
+    return node.nodeType != Node.ELEMENT_NODE or node._dom_normalized is not None
+
+
+class _CharsubTable(object):
+    """
+    Character substitution table compiled for repeated use
+
+    The substitutions are grouped by the first character of their
+    source string.  A string is scanned once for each of those
+    characters and only the groups whose first character occurs in it
+    are applied, in the original order.  When a replacement string
+    could introduce the first character of a source string, the
+    substitutions are simply applied one after another.
+
+    """
+
+    __slots__ = ('source', 'charsubs', 'pairs', 'initials', 'grouped')
+
+    def __init__(self, charsubs, reverse=False):
+        self.source = charsubs
+        self.charsubs = charsubs[:]
+        if reverse:
+            self.pairs = tuple((dest, src) for src, dest in charsubs if dest)
+        else:
+            self.pairs = tuple((src, dest) for src, dest in charsubs if src)
+        initials = []
+        for src, dest in self.pairs:
+            if src[0] not in initials:
+                initials.append(src[0])
+        self.initials = tuple(initials)
+        self.grouped = not [dest for src, dest in self.pairs
+                            if any(c in dest for c in initials)]
+
+    def __call__(self, value):
+        if self.grouped:
+            present = [c for c in self.initials if c in value]
+            if not present:
+                return value
+            for src, dest in self.pairs:
+                if src[0] in present:
+                    value = value.replace(src, dest)
+            return value
+        for src, dest in self.pairs:
+            value = value.replace(src, dest)
+        return value
+
+def applyCharsubs(value, charsubs, reverse=False, document=None):
+    """
+    Apply character substitutions (e.g. ligatures) to a string
+
+    The substitutions are compiled once per table and document, and
+    compiled again only when the table changes.  The result is the
+    same as applying each substitution with `replace' in the order of
+    the table.
+
+    Required Arguments:
+    value -- the string to apply the substitutions to
+    charsubs -- a list of two-element tuples that contain string
+        replacements.  The first element in each tuple is the source
+        string.  The second element is the string to convert the
+        source to.
+
+    Keyword Arguments:
+    reverse -- boolean indicating that the substitutions should be
+        reverted (i.e. the second element is replaced by the first)
+    document -- the document that keeps the compiled substitutions.
+        Without one, they are compiled for this call only.
+
+    Returns:
+    the new string
+
+    """
+    if not charsubs:
+        return value
+    tables = getattr(document, '_dom_charsubs', None)
+    if tables is None:
+        tables = {}
+        if document is not None:
+            document._dom_charsubs = tables
+    key = (id(charsubs), reverse)
+    table = tables.get(key)
+    if table is None or table.source is not charsubs or table.charsubs != charsubs:
+        table = tables[key] = _CharsubTable(charsubs, reverse)
+    return table(value)
+
+
+def _childIndex(parent, child):
+    """
+    Return the position of `child` in the child list of `parent`
+
+    Positions are cached on the parent in a dictionary keyed by the
+    id() of each child.  Since the child lists are plain lists that
+    are also modified directly, a cached position is only trusted if
+    `child` is still found at that position; any other lookup rebuilds
+    the cache.  Appending children leaves the cache valid, while
+    insertions and removals invalidate it for the shifted children.
+
+    Required Arguments:
+    parent -- the node whose children are searched
+    child -- the node to look for
+
+    Returns:
+    the index of `child` or None if it isn't a child of `parent`
+
+    """
+    nodes = parent.childNodes
+    positions = getattr(parent, '_dom_positions', None)
+    if positions is not None:
+        i = positions.get(id(child))
+        if i is not None and i < len(nodes) and nodes[i] is child:
+            return i
+    positions = {}
+    setdefault = positions.setdefault
+    for i, item in enumerate(nodes):
+        setdefault(id(item), i)
+    try:
+        parent._dom_positions = positions
+    except AttributeError:
+        pass
+    i = positions.get(id(child))
+    if i is not None and nodes[i] is child:
+        return i
+    return None
+
+
 def _compareDocumentPosition(self, other):
     """
     Compare the position of the current node to `other`
@@ -469,45 +621,38 @@ def _compareDocumentPosition(self, other):
     if self.ownerDocument is not other.ownerDocument:
         return Node.DOCUMENT_POSITION_DISCONNECTED
 
-    if self.previousSibling is other:
-        return Node.DOCUMENT_POSITION_PRECEDING
-
-    if self.nextSibling is other:
-        return Node.DOCUMENT_POSITION_FOLLOWING
-
     if self is other:
         return Node.DOCUMENT_POSITION_IMPLEMENTATION_SPECIFIC
 
-    sparents = []
-    parent = self
+    # Map each ancestor of `self' to the child on the path down to `self'
+    sparents = {}
+    child = self
+    parent = self.parentNode
     while parent is not None:
         if parent is other:
             return Node.DOCUMENT_POSITION_CONTAINS
-        sparents.append(parent)
+        sparents[id(parent)] = child
+        child = parent
         parent = parent.parentNode
 
-    oparents = []
-    parent = other
+    # Walk up from `other' until we hit a common ancestor
+    child = other
+    parent = other.parentNode
     while parent is not None:
         if parent is self:
             return Node.DOCUMENT_POSITION_CONTAINED_BY
-        oparents.append(parent)
+        s = sparents.get(id(parent))
+        if s is not None:
+            sindex = _childIndex(parent, s)
+            oindex = _childIndex(parent, child)
+            if sindex is None or oindex is None:
+                break
+            if sindex < oindex:
+                return Node.DOCUMENT_POSITION_FOLLOWING
+            return Node.DOCUMENT_POSITION_PRECEDING
+        child = parent
         parent = parent.parentNode
 
-    sparents.reverse()
-    oparents.reverse()
-
-    for i, sparent in enumerate(sparents):
-        for j, oparent in enumerate(oparents):
-            if sparent is oparent:
-                s = sparents[i+1]
-                o = oparents[j+1]
-                for item in sparent:
-                   if item is s:
-                       return Node.DOCUMENT_POSITION_FOLLOWING
-                   if item is o:
-                       return Node.DOCUMENT_POSITION_PRECEDING
-
     return Node.DOCUMENT_POSITION_DISCONNECTED
 
 
@@ -515,42 +660,38 @@ def _previousSibling(self):
     """
     Return the previous sibling
 
-    NOTE: This is fairly inefficient.  The reason that it has
-    to be done this way is because Text nodes are a subclass of
-    `unicode` which is an immutable object.  This means that
-    we can't have two references to the same Text object (i.e.
-    `previousSibling` and `nextSibling` can't be variables).
+    Text nodes are a subclass of `unicode` which is an immutable
+    object.  This means that we can't have two references to the same
+    Text object (i.e. `previousSibling` and `nextSibling` can't be
+    variables), so the sibling is looked up through the position of
+    this node in its parent (see `_childIndex`).
 
     """
-    if not self.parentNode:
+    parent = self.parentNode
+    if not parent:
         return None
-    previous = None
-    for i, item in enumerate(self.parentNode):
-        if item is self:
-            return previous
-        previous = item
-    return None
+    i = _childIndex(parent, self)
+    if not i:
+        return None
+    return parent.childNodes[i-1]
 
 
 def _nextSibling(self):
     """
     Return the next sibling
 
-    NOTE: This is fairly inefficient.  The reason that it has
-    to be done this way is because Text nodes are a subclass of
-    `unicode` which is an immutable object.  This means that
-    we can't have two references to the same Text object (i.e.
-    `previousSibling` and `nextSibling` can't be variables).
+    See `_previousSibling`.
 
     """
-    if not self.parentNode:
+    parent = self.parentNode
+    if not parent:
         return None
-    next = False
-    for i, item in enumerate(self.parentNode):
-        if next:
-            return item
-        if item is self:
-            next = True
+    i = _childIndex(parent, self)
+    if i is None:
+        return None
+    nodes = parent.childNodes
+    if i+1 < len(nodes):
+        return nodes[i+1]
     return None
 
 def xmlstr(obj):
@@ -646,6 +787,9 @@ class Node(object):
     # Common values are: glossary, bibliography, contents, index, search, etc.
     linkType = None
 
+    # State of the last normalization; reset whenever the node changes
+    _dom_normalized = None
+
     def toXML(self, debug=False):
         """
         Dump the object as XML
@@ -819,12 +963,11 @@ class Node(object):
         except NotFoundErr: pass
 
         # Insert the new item
-        for i, item in enumerate(self):
-            if item is refChild:
-                self.insert(i, newChild)
-                return newChild
-
-        raise NotFoundErr
+        i = _childIndex(self, refChild)
+        if i is None:
+            raise NotFoundErr
+        self.insert(i, newChild)
+        return newChild
 
     def insertAfter(self, newChild, refChild):
         """
@@ -842,12 +985,11 @@ class Node(object):
         except NotFoundErr: pass
 
         # Insert the new item
-        for i, item in enumerate(self):
-            if item is refChild:
-                self.insert(i+1, newChild)
-                return newChild
-
-        raise NotFoundErr
+        i = _childIndex(self, refChild)
+        if i is None:
+            raise NotFoundErr
+        self.insert(i+1, newChild)
+        return newChild
 
     def replaceChild(self, newChild, oldChild):
         """
@@ -865,13 +1007,12 @@ class Node(object):
         except NotFoundErr: pass
 
         # Do the replacement
-        for i, item in enumerate(self):
-            if item is oldChild:
-                self.pop(i)
-                self.insert(i, newChild)
-                return oldChild
-
-        raise NotFoundErr
+        i = _childIndex(self, oldChild)
+        if i is None:
+            raise NotFoundErr
+        self.pop(i)
+        self.insert(i, newChild)
+        return oldChild
 
     def removeChild(self, oldChild):
         """
@@ -884,10 +1025,10 @@ class Node(object):
         `oldChild`
 
         """
-        for i, item in enumerate(self):
-            if item is oldChild:
-                return self.pop(i)
-        raise NotFoundErr
+        i = _childIndex(self, oldChild)
+        if i is None:
+            raise NotFoundErr
+        return self.pop(i)
 
     remove = removeChild
 
@@ -902,6 +1043,7 @@ class Node(object):
         the item removed from the list
 
         """
+        _invalidateNormalized(self)
         try: return self.childNodes.pop(index)
         except: raise IndexError('object has no childNodes')
 
@@ -922,6 +1064,7 @@ class Node(object):
             for item in newChild:
                 self.append(item, setParent=setParent)
         else:
+            _invalidateNormalized(self)
             self.childNodes.append(newChild)
         if setParent:
             if self.nodeType == self.DOCUMENT_FRAGMENT_NODE:
@@ -952,6 +1095,7 @@ class Node(object):
                 self.insert(i, item, setParent=setParent)
                 i += 1
         else:
+            _invalidateNormalized(self)
             self.childNodes.insert(i, newChild)
         if setParent:
             if self.nodeType == self.DOCUMENT_FRAGMENT_NODE:
@@ -1000,9 +1144,7 @@ class Node(object):
         """ Append a list of text nodes as one node """
         if not text:
             return
-        value = u''.join(text)
-        for src, dest in charsubs:
-            value = value.replace(src, dest)
+        value = applyCharsubs(u''.join(text), charsubs, document=self.ownerDocument)
         text[:] = []
         value = self.ownerDocument.createTextNode(value)
         if setParent:
@@ -1075,26 +1217,47 @@ class Node(object):
             source to.
 
         """
+        # Nothing has changed since the last normalization
+        state = self._dom_normalized
+        if state is not None and state[0] is charsubs:
+            nodes = self.childNodes if self.hasChildNodes() else None
+            if state[1] is nodes and (nodes is None or state[2] == len(nodes)):
+                normalizeStatistics['skipped'] += 1
+                return
+
+        normalizeStatistics['rebuilt'] += 1
+        clean = True
+
         if self.hasAttributes():
             for value in self.attributes.values():
                 if isinstance(value, Node):
                     value.normalize(charsubs)
+                    clean = clean and _isNormalized(value)
 
-        if not self.hasChildNodes():
-            return
-
-        nodes = list(self.childNodes)
-        while self.childNodes:
-            self.childNodes.pop()
-        text = []
-        for item in nodes:
-            if item.nodeType == item.TEXT_NODE:
-                text.append(item)
-                continue
+        if self.hasChildNodes():
+            nodes = list(self.childNodes)
+            while self.childNodes:
+                self.childNodes.pop()
+            text = []
+            for item in nodes:
+                if item.nodeType == item.TEXT_NODE:
+                    text.append(item)
+                    continue
+                self.appendText(text, charsubs)
+                self.appendChild(item)
+                item.normalize(charsubs)
+                clean = clean and _isNormalized(item)
             self.appendText(text, charsubs)
-            self.appendChild(item)
-            item.normalize(charsubs)
-        self.appendText(text, charsubs)
+            nodes = self.childNodes
+            state = (charsubs, nodes, len(nodes))
+        else:
+            state = (charsubs, None, 0)
+
+        # Only mark ourselves as normalized if everything below us is,
+        # otherwise changes below us wouldn't be seen.
+        if clean:
+            try: self._dom_normalized = state
+            except AttributeError: pass
 
     def isSupported(self, feature, version):
         """ Is the requested feature supported? """
@@ -1371,7 +1534,7 @@ class DocumentFragment(Node):
     """
     nodeName = '#document-fragment'
     nodeType = Node.DOCUMENT_FRAGMENT_NODE
-    __slots__ = Node.NODE_SLOTS
+    __slots__ = Node.NODE_SLOTS + ('_dom_positions',)
 
     def getElementsByTagNameNS(self, namespaceURI, localName):
         """
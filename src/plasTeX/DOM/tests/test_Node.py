@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+# -*- coding: utf-8 -*-
 
 import unittest
 from unittest import TestCase
@@ -6,11 +7,14 @@ from plasTeX.DOM import Node
 from plasTeX.DOM import CharacterData
 from plasTeX.DOM import Document
 from plasTeX.DOM import Text
+from plasTeX.DOM import applyCharsubs
+from plasTeX.DOM import normalizeStatistics
 
 from hamcrest import assert_that
 from hamcrest import is_
 from hamcrest import same_instance
 from hamcrest import is_not
+from hamcrest import none
 
 
 class NodeTest(TestCase):
@@ -540,6 +544,148 @@ class NodeTest(TestCase):
         res = node.getUserData('foo')
         assert res == 'bar'
 
+    def testSiblingsAfterMutation(self):
+        doc = Document()
+        node = doc.createElement('node')
+        one = doc.createElement('one')
+        two = doc.createTextNode('two')
+        three = doc.createElement('three')
+        node.append(one)
+        node.append(two)
+        node.append(three)
+        assert_that( two.nextSibling, is_( same_instance( three ) ) )
+
+        four = doc.createElement('four')
+        node.insertBefore(four, one)
+        assert_that( one.previousSibling, is_( same_instance( four ) ) )
+        assert_that( three.previousSibling, is_( same_instance( two ) ) )
+
+        node.removeChild(two)
+        assert_that( three.previousSibling, is_( same_instance( one ) ) )
+        assert_that( two.previousSibling, is_( None ) )
+
+        # Direct changes to the child list are picked up as well
+        node.childNodes.reverse()
+        assert_that( three.nextSibling, is_( same_instance( one ) ) )
+        assert_that( four.nextSibling, is_( None ) )
+        self._checkPositions(node)
+
+        rc = four.compareDocumentPosition(three)
+        assert_that( rc, is_( Node.DOCUMENT_POSITION_PRECEDING ) )
+
+    def testSiblingsInFragment(self):
+        doc = Document()
+        frag = doc.createDocumentFragment()
+        one = doc.createElement('one')
+        two = doc.createElement('two')
+        frag.append(one, setParent=False)
+        frag.append(two, setParent=False)
+        one.parentNode = two.parentNode = frag
+        assert_that( one.nextSibling, is_( same_instance( two ) ) )
+        assert_that( two.previousSibling, is_( same_instance( one ) ) )
+
+
+class NormalizeTest(TestCase):
+
+    def _tree(self):
+        doc = Document()
+        top = doc.createElement('top')
+        child = doc.createElement('child')
+        top.append(child)
+        child.append(doc.createTextNode('a'))
+        child.append(doc.createTextNode('b'))
+        return doc, top, child
+
+    def testCleanSubtreesAreSkipped(self):
+        doc, top, child = self._tree()
+        top.normalize()
+        assert_that( list(child), is_( ['ab'] ) )
+
+        skipped = normalizeStatistics['skipped']
+        top.normalize()
+        assert_that( normalizeStatistics['skipped'], is_( skipped + 1 ) )
+
+    def testChangesBelowAreSeen(self):
+        doc, top, child = self._tree()
+        top.normalize()
+        child.append(doc.createTextNode('c'))
+        top.normalize()
+        assert_that( list(child), is_( ['abc'] ) )
+
+        # Direct changes to the child list
+        child.childNodes.append(doc.createTextNode('d'))
+        child.normalize()
+        assert_that( list(child), is_( ['abcd'] ) )
+
+    def testDifferentCharsubs(self):
+        doc, top, child = self._tree()
+        top.normalize()
+        top.normalize([(u'ab', u'x')])
+        assert_that( list(child), is_( ['x'] ) )
+
+    def testAttributeChanges(self):
+        doc, top, child = self._tree()
+        top.normalize()
+        frag = doc.createDocumentFragment()
+        frag.append(doc.createTextNode('e'))
+        frag.append(doc.createTextNode('f'))
+        top.attributes['arg'] = frag
+        top.normalize()
+        assert_that( list(frag), is_( ['ef'] ) )
+
+
+class CharsubsTest(TestCase):
+
+    charsubs = [(u'``', u'“'), (u"''", u'”'), (u'"`', u'„'),
+                (u'`', u'‘'), (u"'", u'’'),
+                (u'---', u'—'), (u'--', u'–')]
+
+    def _sequential(self, value, charsubs):
+        for src, dest in charsubs:
+            value = value.replace(src, dest)
+        return value
+
+    def testSameAsSequentialReplace(self):
+        for value in [u'plain text', u"don't", u"``quoted''", u'"``', u'-----',
+                      u"'''", u'a---b--c-d', u'']:
+            assert_that( applyCharsubs(value, self.charsubs),
+                         is_( self._sequential(value, self.charsubs) ) )
+
+    def testReverse(self):
+        value = applyCharsubs(u"``a'' --- b", self.charsubs)
+        assert_that( applyCharsubs(value, self.charsubs, reverse=True),
+                     is_( u"``a'' --- b" ) )
+
+    def testCascadingTable(self):
+        # A replacement that creates the source of a later substitution
+        charsubs = [(u'a', u'-'), (u'--', u'=')]
+        assert_that( applyCharsubs(u'aa-', charsubs), is_( u'=-' ) )
+
+    def testTableChanges(self):
+        doc = Document()
+        charsubs = [(u'--', u'–')]
+        assert_that( applyCharsubs(u'a--b', charsubs, document=doc), is_( u'a–b' ) )
+        charsubs.insert(0, (u'---', u'—'))
+        assert_that( applyCharsubs(u'a---b', charsubs, document=doc), is_( u'a—b' ) )
+
+    def testTablesBelongToDocument(self):
+        doc = Document()
+        applyCharsubs(u'a--b', self.charsubs, document=doc)
+        table = doc._dom_charsubs[(id(self.charsubs), False)]
+        applyCharsubs(u'c--d', self.charsubs, document=doc)
+        assert_that( doc._dom_charsubs[(id(self.charsubs), False)], is_( same_instance( table ) ) )
+        # A new list is never mistaken for the old one
+        assert_that( table.source, is_( same_instance( self.charsubs ) ) )
+        assert_that( getattr(Document(), '_dom_charsubs', None), is_( none() ) )
+
+    def testNormalize(self):
+        doc = Document()
+        node = doc.createElement('node')
+        node.append(doc.createTextNode(u'``a'))
+        node.append(doc.createTextNode(u"''"))
+        node.normalize(self.charsubs)
+        assert_that( list(node), is_( [u'“a”'] ) )
+
 
 if __name__ == '__main__':
     unittest.main()
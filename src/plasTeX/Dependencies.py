@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Records of what a build of a document read and wrote
+
+A `BuildRecord' is written by an incremental `DocumentStream' (see
+plasTeX.Streaming) in the working directory.  For every top-level section
+it lists the input files that were read while the section was digested,
+the counters at its start, the labels it references and the files it was
+rendered to.  Together with the labels and the outline of the whole
+document, that is enough for the next build to tell which sections have
+to be rendered again.
+
+"""
+from __future__ import absolute_import
+
+import io
+import os
+from hashlib import md5
+
+from six.moves import cPickle as pickle
+
+from plasTeX.Logging import getLogger
+
+log = getLogger(__name__)
+
+def fileDigest(path):
+    """
+    Return a digest of the content of the file `path', or None if
+    the file can't be read
+
+    """
+    try:
+        with io.open(path, 'rb') as f:
+            return md5(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+class BuildRecord(object):
+    """ What a build of a document depended on and produced """
+
+    # Records of other versions are ignored
+    version = 1
+
+    def __init__(self):
+        # Digest of the content of every input file, by absolute path
+        self.files = {}
+
+        # Digest of the renderer and the configuration
+        self.settings = None
+
+        # Files read before the document environment began
+        self.preamble = []
+
+        # Files written for the document environment itself
+        self.outputs = []
+
+        # Nested tuples describing the sections of the document,
+        # see `SectionStub.outline'
+        self.outline = None
+
+        # Persisted attributes of the labels, by label
+        self.labels = {}
+
+        # One dictionary for each top-level section, in document order,
+        # with the keys `name', `inputs', `counters', `refs' and `outputs'
+        self.sections = []
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read a record written by `save'
+
+        Returns:
+        `BuildRecord' instance, or None if there is no usable record
+
+        """
+        if not os.path.isfile(filename):
+            return None
+        try:
+            with io.open(filename, 'rb') as f:
+                data = pickle.load(f)
+        except Exception as msg:
+            log.warning('Ignoring the build record %s (%s)', filename, msg)
+            return None
+        if not isinstance(data, dict) or data.get('version') != cls.version:
+            return None
+        record = cls()
+        for key, value in data.items():
+            if key != 'version':
+                setattr(record, key, value)
+        return record
+
+    def save(self, filename):
+        """ Write the record to `filename' """
+        data = dict(vars(self))
+        data['version'] = self.version
+        with io.open(filename, 'wb') as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+
+    def changedFiles(self, digests=None):
+        """
+        Return the set of recorded input files whose content changed
+
+        Keyword Arguments:
+        digests -- dictionary used to cache the current digests of
+            the files, by path
+
+        """
+        if digests is None:
+            digests = {}
+        changed = set()
+        for path, digest in self.files.items():
+            if path not in digests:
+                digests[path] = fileDigest(path)
+            if digests[path] != digest:
+                changed.add(path)
+        return changed
+
+    def allOutputs(self):
+        """ Return the list of all the files that were written """
+        outputs = list(self.outputs)
+        for section in self.sections:
+            outputs.extend(section['outputs'])
+        return outputs
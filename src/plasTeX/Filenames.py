@@ -144,6 +144,21 @@ class Filenames(object):
 
 
 
+# Locate all key names and formats in a filename template
+_keysre = re.compile(r'\$\{(\w+)(?:\.(\d+))?}')
+_formatre = re.compile(r'(\$\{\w+)\.\d+(\})')
+
+def _compileTemplate(item):
+    """
+    Compile a single filename template
+
+    Returns:
+    two-element tuple containing a string.Template with the formats
+    stripped and a list of (key, format) pairs used in the template
+
+    """
+    return string.Template(_formatre.sub(r'\1\2', item)), _keysre.findall(item)
+
 def _addExtension(filename, extension, forceExtension):
     """ Add a file extension to the filename if none exists """
     ext = os.path.splitext(filename)[-1]
@@ -163,6 +178,39 @@ class _FilenameGenerator(object):
         self.vars = vars
         self.extension = extension
         self.invalid = invalid
+        # Compiled templates, keyed by the template source
+        self._compiled = {}
+
+    def _compile(self, item):
+        try:
+            return self._compiled[item]
+        except KeyError:
+            compiled = self._compiled[item] = _compileTemplate(item)
+            return compiled
+
+    def _namespace(self, keys, num):
+        """ Build the substitution namespace for one filename attempt """
+        currentns = self.vars.copy()
+        if self.charsub:
+            bad, sub = self.charsub
+            for key, value in list(currentns.items()):
+                for char in bad:
+                    value = value.replace(char, sub)
+                currentns[key] = value
+        for key, format in keys:
+            # Supply a file number as needed
+            if key == 'num':
+                currentns['num'] = ('%%.%sd' % format) % num
+            # Limit other variables to specified number of words
+            elif format and key in currentns:
+                value = currentns[key].split()
+                newvalue = []
+                for _ in range(int(format)):
+                    newvalue.append(value.pop(0))
+                    if not value:
+                        break
+                currentns[key] = ' '.join(newvalue)
+        return currentns
 
 
     def filenames(self):
@@ -187,35 +235,13 @@ class _FilenameGenerator(object):
         # Initialize file number counter
         num = 1
 
-        # Locate all key names and formats in the string
-        keysre = re.compile(r'\$\{(\w+)(?:\.(\d+))?}')
-
         # Return static filenames
         for item in static:
-            currentns = self.vars.copy()
-            for key, value in list(currentns.items()):
-                if self.charsub:
-                    for char in self.charsub[0]:
-                        value = value.replace(char, self.charsub[1])
-                currentns[key] = value
-            for key, format in keysre.findall(item):
-                # Supply a file number as needed
-                if key == 'num':
-                    currentns['num'] = ('%%.%sd' % format) % num
-                # Limit other variables to specified number of words
-                elif format and key in currentns:
-                    value = currentns[key].split()
-                    newvalue = []
-                    for _ in range(int(format)):
-                        newvalue.append(value.pop(0))
-                        if not value:
-                            break
-                    currentns[key] = ' '.join(newvalue)
+            template, keys = self._compile(item)
+            currentns = self._namespace(keys, num)
             try:
-                # Strip formats
-                item = re.sub(r'(\$\{\w+)\.\d+(\})', r'\1\2', item)
                 # Do variable substitution
-                result = string.Template(item).substitute(currentns)
+                result = template.substitute(currentns)
                 if 'num' in currentns:
                     num += 1
                 self.vars.clear()
@@ -230,34 +256,15 @@ class _FilenameGenerator(object):
         # We've reached the wildcard stage.  The wildcard gives us
         # multiple alternatives of filenames to choose from.  Keep trying
         # each one with the current namespace until one works.
+        wildcard = [self._compile(x) for x in wildcard]
         passes = 0
         while 1:
             passes += 1
-            for item in wildcard:
-                currentns = self.vars.copy()
-                for key, value in list(currentns.items()):
-                    if self.charsub:
-                        for char in self.charsub[0]:
-                            value = value.replace(char, self.charsub[1])
-                    currentns[key] = value
-                for key, format in keysre.findall(item):
-                    # Supply a file number as needed
-                    if key == 'num':
-                        currentns['num'] = ('%%.%sd' % format) % num
-                    # Limit other variables to specified number of words
-                    elif format and key in currentns:
-                        value = currentns[key].split()
-                        newvalue = []
-                        for _ in range(int(format)):
-                            newvalue.append(value.pop(0))
-                            if not value:
-                                break
-                        currentns[key] = ' '.join(newvalue)
+            for template, keys in wildcard:
+                currentns = self._namespace(keys, num)
                 try:
-                    # Strip formats
-                    item = re.sub(r'(\$\{\w+)\.\d+(\})', r'\1\2', item)
                     # Do variable substitution
-                    result = string.Template(item).substitute(currentns)
+                    result = template.substitute(currentns)
                     if 'num' in currentns:
                         num += 1
                     self.vars.clear()
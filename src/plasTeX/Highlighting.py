@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+"""
+Syntax highlighting of program listings with Pygments
+
+"""
+from __future__ import absolute_import
+
+import io
+import os
+import multiprocessing
+from hashlib import md5
+
+from six import text_type
+
+from plasTeX.Logging import getLogger
+
+try: import pygments
+except ImportError: pygments = None
+
+log = getLogger(__name__)
+
+def highlight(source, language, linenos):
+    """
+    Return the XHTML of `source' highlighted by Pygments
+
+    Required Arguments:
+    source -- the text of the listing
+    language -- name of the Pygments lexer.  Plain text is used if
+        there is no such lexer.
+    linenos -- the `linenos' option of the Pygments HTML formatter
+
+    """
+    from pygments import lexers, formatters
+    try:
+        lexer = lexers.get_lexer_by_name(language)
+    except Exception:
+        lexer = lexers.TextLexer()
+    return pygments.highlight(source, lexer, formatters.HtmlFormatter(linenos=linenos))
+
+class Highlighter(object):
+    """
+    Highlights the listings of a document
+
+    Highlighting is slow, so documents with more than `poolThreshold'
+    listings highlight them in a pool of worker processes while the
+    document is parsed, and the `value' of each `Highlight' waits for
+    the result when the listing is rendered.  Other documents highlight
+    each listing in this process when it is rendered.  If the
+    `highlight-cache' option is set, results are kept in the directory
+    .cache/listings, keyed by a digest of the listing, the language and
+    the options, so listings that did not change are not highlighted
+    again in later runs.
+
+    The highlighter of a document is made by `forDocument', and the
+    renderer closes it when it is done with the document.
+
+    """
+
+    # Number of listings highlighted in this process before the pool
+    # of worker processes is started, since starting it takes longer
+    # than highlighting a few listings
+    poolThreshold = 8
+
+    def __init__(self, config):
+        self.config = config
+
+        # Highlights by key, so repeated listings share one
+        self._highlights = {}
+
+        # Highlights that are neither cached nor sent to the pool
+        self._waiting = []
+
+        # Pool of worker processes, or False if it could not be created
+        self._pool = None
+
+    @classmethod
+    def forDocument(cls, document):
+        """ Return the highlighter of a document, making it if needed """
+        if document.highlighter is None:
+            document.highlighter = cls(document.config)
+        return document.highlighter
+
+    def get(self, source, language, linenos):
+        """
+        Return the highlight of a listing, starting it if needed
+
+        Required Arguments:
+        source -- the text of the listing
+        language -- name of the Pygments lexer
+        linenos -- the `linenos' option of the Pygments HTML formatter
+
+        Returns:
+        `Highlight' instance
+
+        """
+        args = (source, language, linenos)
+        key = md5(u'\0'.join([pygments.__version__, language, text_type(linenos),
+                              source]).encode('utf-8')).hexdigest()
+        if key in self._highlights:
+            return self._highlights[key]
+
+        path = None
+        if self.config['general']['highlight-cache']:
+            path = os.path.abspath(os.path.join('.cache', 'listings', key + '.html'))
+        result = self._highlights[key] = Highlight(key, args, path)
+
+        if path is not None and os.path.isfile(path):
+            try:
+                with io.open(path, 'r', encoding='utf-8') as f:
+                    result._value = f.read()
+                return result
+            except (IOError, OSError):
+                pass
+
+        self._waiting.append(result)
+        pool = self.getPool()
+        if pool is not None:
+            for waiting in self._waiting:
+                if waiting._value is None:
+                    waiting._result = pool.apply_async(highlight, waiting.args)
+            self._waiting = []
+        return result
+
+    def getPool(self):
+        """
+        Return the pool of worker processes, or None to highlight
+        in this process
+
+        The number of processes is the `jobs' option, 0 for one for
+        each CPU.  There is no pool if that is one process, or until
+        more than `poolThreshold' listings are waiting.  The pool is
+        created while the document is parsed, when other threads (e.g.
+        the diagnostics writer) may already be running, so the workers
+        are spawned rather than forked.
+
+        """
+        jobs = self.config['general']['jobs']
+        if not jobs:
+            try:
+                jobs = multiprocessing.cpu_count()
+            except NotImplementedError:
+                jobs = 1
+        if jobs == 1:
+            return None
+        if self._pool is None:
+            if len(self._waiting) <= self.poolThreshold:
+                return None
+            try:
+                if hasattr(multiprocessing, 'get_context'):
+                    context = multiprocessing.get_context('spawn')
+                else: # Python 2
+                    context = multiprocessing
+                self._pool = context.Pool(jobs)
+            except Exception as msg:
+                log.warning('Listings are highlighted in this process: %s', msg)
+                self._pool = False
+        return self._pool or None
+
+    def close(self):
+        """
+        Stop the worker processes
+
+        Listings that are still being highlighted are dropped, since
+        renderers that do not read them should not wait for them.  A
+        listing read later is highlighted in this process.
+
+        """
+        for result in self._highlights.values():
+            result._result = None
+        self._waiting = []
+        if self._pool:
+            self._pool.terminate()
+            self._pool.join()
+        self._pool = None
+
+class Highlight(object):
+    """ The highlighted XHTML of a listing (see `Highlighter') """
+
+    def __init__(self, key, args, path=None):
+        self.key = key
+        self.args = args
+        self.path = path
+        self._value = self._result = None
+
+    @property
+    def value(self):
+        """ The highlighted XHTML, waiting for it if needed """
+        if self._value is None:
+            if self._result is not None:
+                try:
+                    self._value = self._result.get()
+                except Exception as msg:
+                    log.warning('Could not highlight a listing in a worker process: %s', msg)
+                self._result = None
+            if self._value is None:
+                self._value = highlight(*self.args)
+            if self.path is not None:
+                self._write()
+        return self._value
+
+    def _write(self):
+        """ Write the highlighted XHTML to the cache """
+        temp = '%s.%s' % (self.path, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            with io.open(temp, 'w', encoding='utf-8') as f:
+                f.write(self._value)
+            os.rename(temp, self.path)
+        except (IOError, OSError) as msg:
+            log.warning('Could not cache a highlighted listing in %s: %s', self.path, msg)
+
+    def __getstate__(self):
+        return {'key': self.key, 'args': self.args, 'path': None,
+                '_value': self.value, '_result': None}
@@ -2,7 +2,9 @@
 from __future__ import division, unicode_literals
 
 import os
+import inspect
 
+import io
 import tempfile
 import shutil
 import re
@@ -13,9 +15,17 @@ from hashlib import md5
 from plasTeX.Logging import getLogger
 from io import StringIO
 from plasTeX.Filenames import Filenames
+from plasTeX.Tokenizer import Tokenizer, Token
+from plasTeX.DOM import applyCharsubs
 from collections import OrderedDict as ordereddict
 import subprocess
+import time
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from xml.etree import ElementTree
 
+from six import text_type
 from six.moves import cPickle as pickle
 
 log = getLogger()
@@ -26,8 +36,12 @@ imagelog = getLogger('imager')
 try:
     from PIL import Image as PILImage
     from PIL import ImageChops as PILImageChops
+    from PIL import ImageColor as PILImageColor
 except ImportError:
-    PILImage = PILImageChops = None
+    PILImage = PILImageChops = PILImageColor = None
+
+# Pillow renamed ANTIALIAS to LANCZOS
+ANTIALIAS = getattr(PILImage, 'LANCZOS', None) or getattr(PILImage, 'ANTIALIAS', None)
 
 def autoCrop(im, bgcolor=None, margin=0):
     """
@@ -171,9 +185,146 @@ class DimensionPlaceholder(str):
             return
         return str.__setattribute__(self, name, value)
 
+_svgLength = re.compile(r'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*(\w*)\s*$')
+
+def svgSize(path):
+    """
+    Return the width and height of an SVG image
+
+    Only the start of the file is read: the dimensions are taken from
+    the attributes of the root element, without their units.  The
+    viewBox is used for a dimension that is missing or relative.
+
+    Required Arguments:
+    path -- the name of the SVG file
+
+    Returns:
+    tuple of the width and height, 0 for a dimension that is unknown
+
+    """
+    try:
+        with open(path, 'rb') as f:
+            for _, root in ElementTree.iterparse(f, events=('start',)):
+                break
+            else:
+                return 0, 0
+    except (ElementTree.ParseError, IOError, OSError) as msg:
+        log.warning('Could not read the size of %s (%s)', path, msg)
+        return 0, 0
+
+    box = (root.get('viewBox') or '').replace(',', ' ').split()
+    size = []
+    for index, name in ((2, 'width'), (3, 'height')):
+        match = _svgLength.match(root.get(name) or '')
+        if match is not None:
+            size.append(float(match.group(1)))
+        elif len(box) == 4 and _svgLength.match(box[index]):
+            size.append(float(box[index]))
+        else:
+            size.append(0)
+    return tuple(size)
+
+def isGray(im):
+    """ Are all of the pixels of an RGB image shades of gray? """
+    if im.mode == 'L':
+        return True
+    if im.mode != 'RGB':
+        return False
+    red, green, blue = im.split()
+    return PILImageChops.difference(red, green).getbbox() is None and \
+           PILImageChops.difference(green, blue).getbbox() is None
+
+def _nearestColor(palette, color):
+    """ Return the index of the palette entry closest to an RGB color """
+    best, index = None, 0
+    for i in range(len(palette) // 3):
+        entry = palette[i*3:i*3+3]
+        distance = sum([(a - b) ** 2 for a, b in zip(entry, color)])
+        if best is None or distance < best:
+            best, index = distance, i
+            if not distance:
+                break
+    return index
+
+def saveImage(im, path, config):
+    """
+    Encode an image and write it to a file
+
+    The encoding is set in the [images] section of the configuration.
+    The `grayscale' option writes images that only have shades of gray,
+    such as anti-aliased equations, with one channel instead of three.
+    The `palette' option reduces images to an adaptive palette,
+    `compression' and `optimize' control the PNG encoder, and
+    `transparent-color' is the color that is made transparent when
+    `transparent' is set.
+
+    Required Arguments:
+    im -- PIL image to write
+    path -- file to write the image to
+    config -- the [images] section of the configuration
+
+    """
+    options = {}
+    if os.path.splitext(path)[-1].lower() == '.png':
+        options['compress_level'] = config['compression']
+        options['optimize'] = config['optimize']
+
+    if config['grayscale'] and im.mode == 'RGB' and isGray(im):
+        im = im.convert('L')
+
+    colors = config['palette']
+    if colors and im.mode in ['L', 'RGB']:
+        # Median cut averages the colors that share an entry, which
+        # would tint the background.  Give it back its exact color.
+        if im.mode == 'L':
+            histogram = im.histogram()
+            background = (histogram.index(max(histogram)),) * 3
+        else:
+            background = max(im.getcolors(im.size[0] * im.size[1]))[1]
+        im = im.quantize(max(2, min(colors, 256)))
+        palette = im.getpalette()
+        index = _nearestColor(palette, background)
+        palette[index*3:index*3+3] = background
+        im.putpalette(palette)
+
+    if config['transparent']:
+        color = config['transparent-color'] or 'white'
+        if im.mode == 'L':
+            options['transparency'] = PILImageColor.getcolor(color, 'L')
+        else:
+            if im.mode != 'P':
+                im = im.convert('P')
+            options['transparency'] = _nearestColor(im.getpalette(),
+                                                    PILImageColor.getrgb(color)[:3])
+
+    im.save(path, **options)
+
+def workerCount(config):
+    """
+    Return the number of jobs that may run at the same time
+
+    Required Arguments:
+    config -- the document config.  Its `jobs' option gives the
+        number, or 0 for one job for each CPU.
+
+    """
+    jobs = config['general']['jobs']
+    if jobs > 0:
+        return jobs
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
 class Image(object):
     """ Generic image object """
 
+    # The LaTeX source the image was first generated from
+    source = None
+
+    # Other resolutions of the image, as (scale factor, Image) pairs
+    resolutions = ()
+
     def __init__(self, filename, config, width=None, height=None, alt=None,
                        depth=None, longdesc=None):
         self.filename = filename
@@ -186,6 +337,7 @@ class Image(object):
         self.longdesc = longdesc
         self.config = config
         self._cropped = False
+        self._vectorDepth = False
         self.bitmap = self
         self.checksum = None
 
@@ -237,33 +389,76 @@ class Image(object):
             return '%s/%s' % (base, self.filename)
         return self.filename
 
-    def crop(self):
-        """ Do the actual cropping """
+    @property
+    def srcset(self):
+        """
+        The srcset attribute of an img element for all of the
+        resolutions, or None if the image only has one
+
+        """
+        if not self.resolutions:
+            return None
+        return ', '.join(['%s %sx' % (image.url, '%g' % factor)
+                          for factor, image in [(1, self)] + list(self.resolutions)])
+
+    def setVectorDepth(self):
+        """ Set the depth of a vector image from its bitmap """
+        self._vectorDepth = False
+        self.depth = 0
+        if self.bitmap is not self and not self.bitmap._cropped:
+            log.warning('The depth of %s is unknown, since its bitmap %s was not generated',
+                        self.filename, self.bitmap.filename)
+            return
+        if self.bitmap and self.height:
+            depth = (self.height / self.bitmap.height) * self.bitmap.depth
+            if abs(depth - int(depth)) > 0.1:
+                self.depth = depth - 1
+            else:
+                self.depth = depth
+
+    def crop(self, source=None, process=None):
+        """
+        Do the actual cropping
+
+        The image is decoded once; `process', the removal of the
+        baseline mark, cropping and transparency are all applied in
+        memory, and the result is written once to `path'.  Nothing
+        depends on the current directory, so images can be cropped in
+        several threads at the same time.
+
+        Keyword Arguments:
+        source -- the file that the converter wrote.  By default, the
+            image is cropped in place.
+        process -- function that takes the decoded image and returns
+            the image to crop, e.g. to scale it
+
+        """
         if self._cropped:
             return
 
+        if source is None:
+            source = self.path
+        elif source != self.path:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError:
+                    # Another batch may have just made it
+                    if not os.path.isdir(directory):
+                        raise
+
         # Crop an SVG image
         if os.path.splitext(self.path)[-1] in ['.svg']:
-            with open(self.path,'r') as f:
-                svg = f.read()
-
-            self.width = 0
-            width = re.search(r'width=(?:\'|")([^\d\.]+)\w*(?:\'|")', svg)
-            if width:
-                self.width = float(width)
-
-            self.height = 0
-            height = re.search(r'height=(?:\'|")([^\d\.]+)\w*(?:\'|")', svg)
-            if height:
-                self.height = float(height)
+            if source != self.path:
+                shutil.copyfile(source, self.path)
+            self.width, self.height = svgSize(self.path)
 
+            # The depth comes from the bitmap, which is converted by
+            # another imager, possibly at the same time.  That imager
+            # is closed first, then Imager.close() sets the depth.
             self.depth = 0
-            if self.bitmap and self.height:
-                depth = (self.height / self.bitmap.height) * self.bitmap.depth
-                if abs(depth - int(depth)) > 0.1:
-                    self.depth = depth - 1
-                else:
-                    self.depth = depth
+            self._vectorDepth = True
 
             self._cropped = True
             return
@@ -271,12 +466,19 @@ class Image(object):
         padbaseline = self.config['baseline-padding']
 
         try:
-            im, self.depth = self._stripBaseline(PILImage.open(self.path),
-                                             padbaseline)
+            if PILImage is None:
+                raise IOError('PIL is not installed')
+            im = PILImage.open(source)
+            if process is not None:
+                im = process(im)
+            im, self.depth = self._stripBaseline(im, padbaseline)
             self.width, self.height = im.size
         except IOError as msg:
 #           import traceback
 #           traceback.print_exc()
+            # Use the image as it is
+            if source != self.path:
+                shutil.copyfile(source, self.path)
             self._cropped = True
             log.warning(msg)
             return
@@ -284,14 +486,7 @@ class Image(object):
         if padbaseline and self.depth > padbaseline:
             log.warning('depth of image %s (%d) is greater than the baseline padding (%s).  This may cause the image to be misaligned with surrounding text.', self.filename, self.depth, padbaseline)
 
-        if self.config['transparent']:
-            im = im.convert("P")
-            lut = im.resize((256,1))
-            lut.putdata(range(256))
-            index = list(lut.convert("RGB").getdata()).index((255,255,255))
-            im.save(self.path, transparency=index)
-        else:
-            im.save(self.path)
+        saveImage(im, self.path, self.config)
 
         self._cropped = True
 
@@ -453,6 +648,9 @@ class Imager(object):
         # Dictionary that makes sure each image is only generated once.
         # The key is the LaTeX source and the value is the image instance.
         self._cache = {}
+        # Number of image requests that were satisfied by an existing
+        # image whose source differed only in its formatting
+        self.deduplicated = 0
         usednames = {}
         # JAM: FIXME: This writes into some arbitrary directory that may or
         # may not be related to the document we are processing. It at least
@@ -469,6 +667,7 @@ class Imager(object):
 
         # Images that are simply copied from the source directory
         self.staticimages = ordereddict()
+        self._staticcache = os.path.abspath(os.path.join('.cache', 'static-images'))
 
         # Filename generator
         self.newFilename = Filenames(self.config['images'].get('filenames', raw=True),
@@ -486,6 +685,27 @@ class Imager(object):
         #Documentation suggests that we could just set the TEXINPUTS environment variable but it does not work
         self.source.write('\\graphicspath{{%s/}}\n' % (self.ownerDocument.userdata['working-dir']))
 
+        # Images are compiled and converted in batches in the background
+        # while the document is rendered, see flush().  Each batch is
+        # a document of its own that starts with this preamble.
+        self._preamble = self.source.getvalue()
+        self._batch = []
+        self._batchStart = self.source.tell()
+        self._batchTime = None
+        self._pipelined = None
+        self._pool = None
+        self._jobs = []
+
+        # (external image, path) of the static images that could not
+        # be written in the background
+        self._staticFailures = []
+
+        # Bytes of converter output and of finished images, for the
+        # batches that are done
+        self._lock = threading.Lock()
+        self._converted = 0
+        self._written = 0
+
         # Set up additional options
         self._configOptions = self.formatConfigOptions(self.config['images'])
 
@@ -555,14 +775,15 @@ class Imager(object):
 
     @property
     def enabled(self):
-        if self.config['images']['enabled'] and \
+        if self.config.snapshot.images.enabled and \
            (self.command or (type(self) is not Imager and type(self) is not VectorImager)):
             return True
         return False
 
     def close(self):
         """ Invoke the rendering code """
-        # Finish the document
+        # Start on the last batch of images, then finish the document
+        self.flush()
         self.source.write('\n\\end{document}\\endinput')
 
         for value in list(self._cache.values()):
@@ -573,24 +794,134 @@ class Imager(object):
                     log.warning('The image data for "%s" on the disk has changed. You may want to clear the image cache.',
                                 value.filename)
 
-        # Bail out if there are no images
-        if not self.images:
+        if self.deduplicated:
+            log.info('%d equivalent image(s) were deduplicated', self.deduplicated)
+
+        generated = bool(self.images) and self.enabled
+
+        if generated and self.config['images']['save-file']:
+            with codecs.open('images.tex', 'w', self.config['files']['input-encoding']) as f:
+                f.write(self.source.getvalue())
+
+        if generated and not self.pipelined:
+            if not self.convertsInDirectory:
+                # Static images must be done before the directory changes
+                self.join()
+            self.convertBatch(self.source.getvalue(), list(self.images.values()))
+
+        # Wait for the batches of images and the static images that
+        # are still running
+        self.join()
+
+        for source, path in self._staticFailures:
+            log.error('Image "%s" was not written to %s; see the warnings above',
+                      source, path)
+
+        # The bitmaps of vector images are done now
+        for image in list(self.images.values()):
+            if getattr(image, '_vectorDepth', False):
+                image.setVectorDepth()
+
+        if self._converted:
+            log.info('Images were written in %d bytes, %d bytes less than the converter output',
+                     self._written, self._converted - self._written)
+
+        if generated and self.config['images']['cache']:
+            self._write_cache()
+
+    def join(self):
+        """ Wait for all of the images that are made in the background """
+        if self._pool is None:
             return
+        try:
+            for job in self._jobs:
+                job.get()
+        finally:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._jobs = []
 
-        if not self.enabled:
+    @property
+    def pool(self):
+        """ Threads that compile and convert images in the background """
+        if self._pool is None:
+            self._pool = ThreadPool(workerCount(self.config))
+        return self._pool
+
+    @property
+    def pipelined(self):
+        """ Are images compiled and converted while the document is rendered? """
+        if self._pipelined is None:
+            self._pipelined = bool(self.config.snapshot.images.batch_size and
+                                   self.enabled and self.convertsInDirectory)
+        return self._pipelined
+
+    @property
+    def convertsInDirectory(self):
+        """
+        Does executeConverter() take the directory to work in?
+
+        Before images were pipelined, executeConverter() only took the
+        output and worked in the current directory.  Imagers that
+        still override it that way keep working, without pipelining.
+
+        """
+        try:
+            getargspec = inspect.getfullargspec
+        except AttributeError: # Python 2
+            getargspec = inspect.getargspec
+        spec = getargspec(self.executeConverter)
+        return len(spec.args) > 2 or spec.varargs is not None
+
+    @property
+    def converterProcesses(self):
+        """
+        Number of processes that one run of the converter may start
+
+        When images are pipelined, batches are already converted by a
+        pool of `jobs' threads, so each run gets one process.
+
+        """
+        if self.pipelined:
+            return 1
+        return workerCount(self.config)
+
+    def flush(self):
+        """
+        Compile and convert the images written since the last flush
+        in the background
+
+        The images are written to a document of their own, which is
+        compiled and converted by a pool of threads.  close() waits
+        for all of them.
+
+        """
+        if not self._batch:
             return
+        images, self._batch = self._batch, []
+        self.source.seek(self._batchStart)
+        source = self._preamble + self.source.read() + '\n\\end{document}\\endinput'
+        self._batchStart = self.source.tell()
+        self._jobs.append(self.pool.apply_async(self.convertBatch, (source, images)))
 
-        # Compile LaTeX source, then convert the output
-        self.source.seek(0)
-        output = self.compileLatex(self.source.read())
+    def convertBatch(self, source, images):
+        """
+        Compile LaTeX source, then convert the output into images
+
+        Arguments:
+        source -- the LaTeX source of a document with one image per page
+        images -- the Image instances of the pages, in order
+
+        """
+        output = self.compileLatex(source)
         if output is None:
             log.error('Compilation of the document containing the images failed.  No output file was found.')
             return
-
-        self.convert(output)
-
-        if self.config['images']['cache']:
-            self._write_cache()
+        try:
+            self.convert(output, images)
+        finally:
+            output.close()
 
     def _write_cache(self):
         for value in list(self._cache.values()):
@@ -634,21 +965,14 @@ class Imager(object):
         file object corresponding to the output from LaTeX
 
         """
-        cwd = os.getcwd()
-
         # Make a temporary directory to work in
         tempdir = tempfile.mkdtemp()
 
         filename = 'images.tex'
 
         # Write LaTeX source file
-        if self.config['images']['save-file']:
-            self.source.seek(0)
-            with codecs.open(os.path.join(cwd,filename), 'w', self.config['files']['input-encoding']) as f:
-                f.write(self.source.read())
-        self.source.seek(0)
         with codecs.open(os.path.join( tempdir, filename ), 'w', self.config['files']['input-encoding']) as f:
-            f.write(self.source.read())
+            f.write(source)
 
         # Run LaTeX
         #os.environ['SHELL'] = '/bin/sh'
@@ -716,12 +1040,19 @@ class Imager(object):
 
         return output
 
-    def executeConverter(self, output):
+    def executeConverter(self, output, directory):
         """
         Execute the actual image converter
 
+        Batches of images may be converted at the same time in different
+        threads, so converters must work in `directory' instead of
+        changing the current directory.  Overrides that only take
+        `output' and work in the current directory are still called,
+        but their images are not pipelined (see `convertsInDirectory').
+
         Arguments:
         output -- file object pointing to the rendered LaTeX output
+        directory -- the temporary directory to write the images to
 
         Returns:
         two-element tuple.  The first element is the return code of the
@@ -730,7 +1061,7 @@ class Imager(object):
         used, you can simply return None.
 
         """
-        with open('images.out', 'wb') as f:
+        with open(os.path.join(directory, 'images.out'), 'wb') as f:
             f.write(output.read())
         options = ''
         if self._configOptions:
@@ -739,7 +1070,8 @@ class Imager(object):
                 if ' ' in value:
                     value = '"%s"' % value
                 options += '%s %s ' % (opt, value)
-        return os.system('%s %s%s' % (self.command, options, 'images.out')), None
+        return subprocess.call('%s %s%s' % (self.command, options, 'images.out'),
+                               shell=True, cwd=directory), None
         # cmd = r'%s %s%s' % (self.command, options, 'images.out')
         # p = subprocess.Popen(shlex.split(cmd),
         #                    stdout=subprocess.PIPE,
@@ -755,69 +1087,95 @@ class Imager(object):
         #       break
         # return done, None
 
-    def convert(self, output):
+    def processImage(self, im):
+        """
+        Transform a converted image before it is cropped
+
+        The images are cropped as they are moved to their final
+        location, so imagers that need to scale or filter them can do
+        it here without decoding and encoding every image again.
+
+        Required Arguments:
+        im -- the PIL image decoded from the converter output
+
+        Returns:
+        the image to crop
+
+        """
+        return im
+
+    def convert(self, output, images=None):
         """
         Convert the output from LaTeX into images
 
         Arguments:
         output -- output file object
+        images -- the Image instances of the pages of the output, in
+            order.  By default, these are all of the images.
 
         """
+        if images is None:
+            images = list(self.images.values())
+
         if not self.command and self.executeConverter is Imager.executeConverter:
             log.warning('No imager command is configured.  ' +
                         'No images will be created.')
             return
 
-        cwd = os.getcwd()
-
         # Make a temporary directory to work in
         tempdir = tempfile.mkdtemp()
-        os.chdir(tempdir)
 
         # Execute converter
-        rc, images = self.executeConverter(output)
+        if self.convertsInDirectory:
+            rc, files = self.executeConverter(output, tempdir)
+        else:
+            # Converters written for the old API work in the current
+            # directory.  They are not pipelined (see `pipelined'),
+            # so nothing else runs while the directory is changed.
+            cwd = os.getcwd()
+            os.chdir(tempdir)
+            try:
+                rc, files = self.executeConverter(output)
+            finally:
+                os.chdir(cwd)
         if rc:
             log.warning('Image converter did not exit properly.  ' +
                         'Images may be corrupted or missing.')
 
         # Get a list of all of the image files
-        if images is None:
-            images = [f for f in os.listdir('.')
+        if files is None:
+            files = [f for f in os.listdir(tempdir)
                             if re.match(r'^img\d+\.\w+$', f)]
-        if len(images) != len(self.images):
-            log.warning('The number of images generated (%d) and the number of images requested (%d) is not the same.' % (len(images), len(self.images)))
+        if len(files) != len(images):
+            log.warning('The number of images generated (%d) and the number of images requested (%d) is not the same.' % (len(files), len(images)))
 
         # Sort by creation date
         #images.sort(lambda a,b: cmp(os.stat(a)[9], os.stat(b)[9]))
 
-        images.sort(key=lambda a: int(re.search(r'(\d+)\.\w+$',a).group(1)))
-
-        os.chdir(cwd)
+        files.sort(key=lambda a: int(re.search(r'(\d+)\.\w+$',a).group(1)))
 
         if PILImage is None:
             log.warning('PIL (Python Imaging Library) is not installed.  ' +
                         'Images will not be cropped.')
 
-        # Move images to their final location
-        for src, dest in zip(images, list(self.images.values())):
-            # Move the image
-            directory = os.path.dirname(dest.path)
-            if directory and not os.path.isdir(directory):
-                os.makedirs(directory)
-            try:
-                shutil.copy2(os.path.join(tempdir,src), dest.path)
-            except OSError:
-                shutil.copy(os.path.join(tempdir,src), dest.path)
-
-            # Crop the image
+        # Crop the images and write them to their final location
+        converted = written = 0
+        for src, dest in zip(files, images):
+            src = os.path.join(tempdir, src)
             try:
-                dest.crop()
+                dest.crop(src, self.processImage)
+                converted += os.path.getsize(src)
+                written += os.path.getsize(dest.path)
                 status.dot()
             except Exception as msg:
                 import traceback
                 traceback.print_exc()
                 log.warning('failed to crop %s (%s)', dest.path, msg)
 
+        with self._lock:
+            self._converted += converted
+            self._written += written
+
         # Remove temporary directory
         shutil.rmtree(tempdir, True)
 
@@ -833,6 +1191,205 @@ class Imager(object):
         """
         self.source.write('%s\n\\begin{plasTeXimage}{%s}\n%s\n\\end{plasTeXimage}\n' % (context, filename, code))
 
+    # Tokens around which whitespace in math mode never changes the
+    # rendered output
+    _tightCatcodes = frozenset([Token.CC_BGROUP, Token.CC_EGROUP,
+                                Token.CC_MATHSHIFT, Token.CC_SUPER,
+                                Token.CC_SUB, Token.CC_ALIGNMENT])
+    _mathDelimiters = frozenset(['[', ']', '(', ')'])
+
+    # Environments whose bodies are typeset in math mode
+    _mathEnvironments = frozenset(['math', 'displaymath', 'equation',
+                                   'eqnarray', 'align', 'alignat', 'flalign',
+                                   'gather', 'multline', 'split', 'array'])
+
+    # Macros whose arguments are typeset in text mode, even in math mode
+    _textMacros = frozenset(['text', 'mbox', 'hbox', 'vbox', 'fbox',
+                             'makebox', 'framebox', 'parbox', 'raisebox',
+                             'intertext', 'emph', 'textnormal', 'textrm',
+                             'textsf', 'texttt', 'textup', 'textit',
+                             'textsl', 'textsc', 'textbf', 'textmd'])
+
+    def canonicalSource(self, text):
+        """
+        Return a canonical form of the given LaTeX source
+
+        The source is tokenized using the document's context so that
+        comments are dropped and runs of whitespace are collapsed, as
+        TeX does.  Leading and trailing whitespace is removed, since the
+        image environment ignores it.  In math mode, whitespace next to
+        grouping, math shift, alignment, superscript, and subscript
+        tokens is removed, and braces around a single token used as a
+        superscript or subscript are dropped.  This allows sources such
+        as `$x^2$', `$x^{2}$' and `$ x^2 $' to share a single image.
+        Whitespace in text mode, including the arguments of \\text,
+        \\mbox and the like, is kept, so `a $x$' and `a$x$' do not.
+
+        Sources that contain verbatim material are returned unchanged
+        since whitespace is significant there.
+
+        Required Arguments:
+        text -- the LaTeX source of the image
+
+        Returns:
+        string containing the canonical source
+
+        """
+        tokens = [x for x in Tokenizer(text, self.ownerDocument.context)]
+
+        if self._hasVerbatim(tokens):
+            return text
+
+        # Strip leading and trailing whitespace and paragraphs
+        def isblank(tok):
+            return tok.catcode == Token.CC_SPACE or \
+                   (tok.catcode == Token.CC_ESCAPE and tok == 'par')
+        while tokens and isblank(tokens[0]):
+            tokens.pop(0)
+        while tokens and isblank(tokens[-1]):
+            tokens.pop()
+
+        tight = self._tightCatcodes
+        delims = self._mathDelimiters
+
+        def istight(tok):
+            if tok.catcode in tight:
+                return True
+            return tok.catcode == Token.CC_ESCAPE and tok in delims
+
+        # `math' is what ends the current math mode, or None in text
+        # mode.  Each group saves it, and whether the group is the
+        # argument of a text macro, on `groups'.  Spans that can't be
+        # told apart for sure are treated as text, which only means
+        # that fewer images are shared.
+        math = None
+        groups = []
+        textarg = False
+        optional = 0
+        output = []
+        i, length = 0, len(tokens)
+        while i < length:
+            tok = tokens[i]
+            code = tok.catcode
+
+            if code == Token.CC_SPACE:
+                if math is not None and \
+                   ((output and istight(output[-1])) or
+                    (i + 1 < length and istight(tokens[i+1]))):
+                    i += 1
+                    continue
+                output.append(tok)
+                i += 1
+                continue
+
+            # Keep \begin{...} and \end{...} as they are, and follow
+            # math environments
+            if code == Token.CC_ESCAPE and tok in ('begin', 'end'):
+                name, end = self._environmentName(tokens, i + 1)
+                if name is not None:
+                    output.extend(tokens[i:end])
+                    i = end
+                    name = name.rstrip('*')
+                    if name in self._mathEnvironments:
+                        if tok == 'begin' and math is None:
+                            math = 'env:' + name
+                        elif tok == 'end' and math == 'env:' + name:
+                            math = None
+                    continue
+
+            if code == Token.CC_MATHSHIFT:
+                display = i + 1 < length and tokens[i+1].catcode == Token.CC_MATHSHIFT
+                shift = '$$' if display else '$'
+                if math is None:
+                    math = shift
+                elif math == shift:
+                    math = None
+                else:
+                    shift = '$'
+                output.extend(tokens[i:i+len(shift)])
+                i += len(shift)
+                continue
+
+            if code == Token.CC_ESCAPE and tok in delims:
+                if tok in ('[', '(') and math is None:
+                    math = text_type(tok)
+                elif (tok == ']' and math == '[') or (tok == ')' and math == '('):
+                    math = None
+
+            elif code == Token.CC_ESCAPE and tok in self._textMacros:
+                textarg = True
+                optional = 0
+
+            elif code == Token.CC_BGROUP:
+                groups.append((math, textarg))
+                if textarg:
+                    math = None
+                textarg = False
+
+                # Drop the braces in `^{2}' and `_{\alpha}'
+                if groups[-1][0] is not None and output and \
+                   output[-1].catcode in (Token.CC_SUPER, Token.CC_SUB) and \
+                   i + 2 < length and tokens[i+2].catcode == Token.CC_EGROUP and \
+                   tokens[i+1].catcode not in (Token.CC_SPACE, Token.CC_BGROUP):
+                    groups.pop()
+                    output.append(tokens[i+1])
+                    i += 3
+                    continue
+
+            elif code == Token.CC_EGROUP:
+                if groups:
+                    math, textarg = groups.pop()
+
+            elif textarg:
+                # Optional arguments like \makebox[2cm]{...} keep the
+                # following group in text mode.  Anything else ends it.
+                if code == Token.CC_OTHER and tok == '[':
+                    optional += 1
+                elif code == Token.CC_OTHER and tok == ']' and optional:
+                    optional -= 1
+                elif not optional:
+                    textarg = False
+
+            output.append(tok)
+            i += 1
+
+        return ''.join([x.source for x in output])
+
+    def _environmentName(self, tokens, i):
+        """
+        Read the environment name in `{name}' starting at tokens[i]
+
+        Returns:
+        (name, index after the closing brace), or (None, i)
+
+        """
+        if i >= len(tokens) or tokens[i].catcode != Token.CC_BGROUP:
+            return None, i
+        name = []
+        for j in range(i + 1, min(len(tokens), i + 40)):
+            if tokens[j].catcode == Token.CC_EGROUP:
+                return ''.join(name), j + 1
+            if tokens[j].catcode not in (Token.CC_LETTER, Token.CC_OTHER):
+                break
+            name.append(text_type(tokens[j]))
+        return None, i
+
+    def _hasVerbatim(self, tokens):
+        """ Do the tokens use verbatim macros or environments? """
+        from plasTeX.Base.LaTeX.Verbatim import verb, verbatim
+        macros = self.ownerDocument.context.top
+        for i, tok in enumerate(tokens):
+            if tok.catcode != Token.CC_ESCAPE:
+                continue
+            if tok == 'begin':
+                name = self._environmentName(tokens, i + 1)[0]
+            else:
+                name = text_type(tok)
+            cls = macros.get(name) if name else None
+            if isinstance(cls, type) and issubclass(cls, (verb, verbatim)):
+                return True
+        return False
+
     def newImage(self, text, context='', filename=None):
         """
         Invoke a new image
@@ -850,14 +1407,17 @@ class Imager(object):
 
         """
         # Convert ligatures back to original string
-        for dest, src in self.ownerDocument.charsubs:
-            text = text.replace(src, dest)
+        text = applyCharsubs(text, self.ownerDocument.charsubs, reverse=True,
+                             document=self.ownerDocument)
 
-        key = text
+        key = self.canonicalSource(text)
 
         # See if this image has been cached
         if key in self._cache:
-            return self._cache[key]
+            img = self._cache[key]
+            if img.source is not None and img.source != text:
+                self.deduplicated += 1
+            return img
 
         # Generate a filename
         if not filename:
@@ -868,6 +1428,7 @@ class Imager(object):
         self.writeImage(filename, text, context)
 
         img = Image(filename, self.config['images'])
+        img.source = text
 
         # Populate image attrs that will be bound later
         if self.imageAttrs:
@@ -881,6 +1442,18 @@ class Imager(object):
                     setattr(img, name, value)
 
         self.images[filename] = self._cache[key] = img
+
+        # Start on a batch of images that is big or old enough
+        if self.pipelined:
+            if not self._batch:
+                self._batchTime = time.time()
+            self._batch.append(img)
+            images = self.config.snapshot.images
+            seconds = images.batch_time
+            if len(self._batch) >= images.batch_size or \
+               (seconds and time.time() - self._batchTime >= seconds):
+                self.flush()
+
         return img
 
     def getImage(self, node):
@@ -893,6 +1466,11 @@ class Imager(object):
         images directory.  If no image is available, or there was
         a problem in getting the image, an image is generated.
 
+        Only the size of the image is read here.  It is copied or
+        converted in the background, see convertStatic(), and close()
+        waits for it and reports the images that could not be written
+        as errors.
+
         Arguments:
         node -- the node to create the image from
 
@@ -916,39 +1494,38 @@ class Imager(object):
             if directory and not os.path.isdir(directory):
                 os.makedirs(directory)
 
-            # If PIL isn't available or no conversion is necessary,
-            # just copy the image to the new location
-            if newext == oldext or oldext in self.imageTypes:
+            # If no conversion is necessary, the image can be copied
+            # to the new location
+            copy = newext == oldext or oldext in self.imageTypes
+            if copy:
                 path = os.path.splitext(path)[0] + os.path.splitext(name)[-1]
-                if PILImage is None:
-                    shutil.copyfile(name, path)
-                    tmpl = string.Template(self.imageAttrs)
-                    width = DimensionPlaceholder(tmpl.substitute({'filename':path, 'attr':'width'}))
-                    height = DimensionPlaceholder(tmpl.substitute({'filename':path, 'attr':'height'}))
-                    height.imageUnits = width.imageUnits = self.imageUnits
-                else:
-                    img = PILImage.open(name)
-                    width, height = img.size
-                    scale = self.config['images']['scale-factor']
-                    if scale != 1:
-                        width = int(width * scale)
-                        height = int(height * scale)
-                        img.resize((width,height))
-                        img.save(path)
-                    else:
-                        shutil.copyfile(name, path)
-
-            # If PIL is available, convert the image to the appropriate type
-            else:
-                img = PILImage.open(name)
-                width, height = img.size
-                scale = self.config['images']['scale-factor']
+
+            # If PIL is available, the image can be scaled or converted
+            # to the appropriate type.  Opening it only reads its header.
+            if PILImage is not None:
+                width, height = PILImage.open(name).size
+                scale = self.config.snapshot.images.scale_factor
                 if scale != 1:
                     width = int(width * scale)
                     height = int(height * scale)
-                    img.resize((width,height))
-                img.save(path)
-            img = Image(path, self.ownerDocument.config['images'], width=width, height=height)
+            elif copy:
+                tmpl = string.Template(self.imageAttrs)
+                width = DimensionPlaceholder(tmpl.substitute({'filename':path, 'attr':'width'}))
+                height = DimensionPlaceholder(tmpl.substitute({'filename':path, 'attr':'height'}))
+                height.imageUnits = width.imageUnits = self.imageUnits
+            else:
+                return self.newImage(node.source)
+
+            config = self.ownerDocument.config['images']
+            img = Image(path, config, width=width, height=height)
+            if PILImage is not None:
+                base, ext = os.path.splitext(path)
+                img.resolutions = [(factor, Image('%s@%sx%s' % (base, '%g' % factor, ext), config,
+                                                  width=int(width * factor),
+                                                  height=int(height * factor)))
+                                   for factor in self.config.snapshot.images.static_resolutions
+                                   if factor != 1]
+            self._jobs.append(self.pool.apply_async(self.convertStatic, (name, img)))
             self.staticimages[name] = img
             return img
 
@@ -958,6 +1535,72 @@ class Imager(object):
             pass
         return self.newImage(node.source)
 
+    def convertStatic(self, source, image):
+        """
+        Copy or convert an external image, in all of its resolutions
+
+        If the `static-cache' option is set, the results are cached in
+        .cache/static-images, keyed by a digest of the content of
+        `source' and the format and size of the result, so later runs
+        only copy them.
+
+        Arguments:
+        source -- the path of the external image
+        image -- the Image instance to write
+
+        """
+        with open(source, 'rb') as f:
+            data = f.read()
+        digest = md5(data).hexdigest()
+        sourceext = os.path.splitext(source)[-1]
+        im = None
+        for target in [image] + [x[1] for x in image.resolutions]:
+            ext = os.path.splitext(target.path)[-1]
+            size = None
+            if PILImage is not None:
+                size = (int(target.width), int(target.height))
+            try:
+                cache = None
+                if self.config.snapshot.images.static_cache:
+                    key = md5(('%s\0%s\0%s' % (digest, ext, size)).encode('ascii')).hexdigest()
+                    cache = os.path.join(self._staticcache, key + ext)
+                    if os.path.isfile(cache):
+                        shutil.copyfile(cache, target.path)
+                        continue
+
+                if PILImage is not None and im is None:
+                    im = PILImage.open(io.BytesIO(data))
+                if im is not None and im.size != size:
+                    im.resize(size, ANTIALIAS).save(target.path)
+                elif im is not None and ext != sourceext:
+                    im.save(target.path)
+                else:
+                    with open(target.path, 'wb') as f:
+                        f.write(data)
+
+                if cache is not None:
+                    self._cacheStatic(target.path, cache)
+            except Exception as msg:
+                log.warning('Could not convert image "%s" to %s: %s', source, target.path, msg)
+                self._staticFailures.append((source, target.path))
+            else:
+                status.dot()
+
+    def _cacheStatic(self, path, cache):
+        """ Copy a converted external image into the cache """
+        temp = '%s.%s.%s' % (cache, os.getpid(), threading.current_thread().ident)
+        try:
+            if not os.path.isdir(self._staticcache):
+                try:
+                    os.makedirs(self._staticcache)
+                except OSError:
+                    if not os.path.isdir(self._staticcache):
+                        raise
+            shutil.copyfile(path, temp)
+            os.rename(temp, cache)
+        except (IOError, OSError) as msg:
+            log.warning('Could not cache image %s in %s: %s', path, cache, msg)
+
 
 class VectorImager(Imager):
     fileExtension = '.svg'
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
 import os, re
+import struct
+import subprocess
 import plasTeX.Imagers
 
 class DVISVGM(plasTeX.Imagers.VectorImager):
@@ -8,20 +10,87 @@ class DVISVGM(plasTeX.Imagers.VectorImager):
     fileExtension = '.svg'
     verification = 'dvisvgm --help'
     compiler = 'latex'
+    command = 'dvisvgm --scale=1.6 --output=img%p.svg'
 
-    def executeConverter(self, output):
+    # Fewest pages converted by each dvisvgm process, since every
+    # process reads the DVI file and the fonts again
+    pagesPerProcess = 50
+
+    def pageRanges(self, pages, processes):
+        """
+        Split the pages of the DVI file into ranges of consecutive pages
+
+        Required Arguments:
+        pages -- the number of pages
+        processes -- the most ranges to return
+
+        Returns:
+        list of values for the --page option of dvisvgm.  The last range
+        is open, so that it includes any pages beyond `pages'.
+
+        """
+        processes = max(1, min(processes, pages // self.pagesPerProcess))
+        size = max(1, -(-pages // processes))
+        firsts = list(range(1, pages + 1, size)) or [1]
+        ranges = ['%d-%d' % (first, first + size - 1) for first in firsts[:-1]]
+        ranges.append('%d-' % firsts[-1])
+        return ranges
+
+    def executeConverter(self, output, directory):
+        dvi = os.path.join(directory, 'images.dvi')
+        with open(dvi, 'wb') as f:
+            f.write(output.read())
+
+        # Convert all of the pages in one run, or split them across
+        # the processes that this run may use
+        pages = dviPageCount(dvi)
+        if pages is None:
+            pages = len(self.images)
+        command = self.command.split()
+        processes = [subprocess.Popen(command + ['--page=%s' % ranges, 'images.dvi'],
+                                      cwd=directory)
+                     for ranges in self.pageRanges(pages, self.converterProcesses)]
         rc = 0
-        open('images.dvi', 'w').write(output.read())
-        page = 1
-        while 1:
-            filename = 'img%d.svg' % page
-            rc = os.system('dvisvgm --scale=1.6 --output=%s --page=%d images.dvi' % (filename, page))
-            if rc:
-                break
-            if not open(filename).read().strip():
-                os.remove(filename)
-                break
-            page += 1
+        for process in processes:
+            rc = process.wait() or rc
+
+        # Pages that could not be converted leave empty files
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            if re.match(r'^img\d+\.svg$', filename) and not os.path.getsize(path):
+                os.remove(path)
+
         return rc, None
 
+def dviPageCount(path):
+    """
+    Return the number of pages of a DVI file, from its postamble
+
+    Returns:
+    the number of pages, or None if the file could not be read
+
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            # The file ends with post_post, the pointer to the
+            # postamble, the DVI version and at least four 223s
+            f.seek(max(0, size - 64))
+            tail = bytearray(f.read())
+            end = len(tail)
+            while end and tail[end - 1] == 223:
+                end -= 1
+            if end < 6 or tail[end - 6] != 249:
+                return None
+            post = struct.unpack('>I', bytes(tail[end - 5:end - 1]))[0]
+            # post p[4] num[4] den[4] mag[4] l[4] u[4] s[2] t[2]
+            f.seek(post)
+            data = bytearray(f.read(29))
+            if len(data) < 29 or data[0] != 248:
+                return None
+            return struct.unpack('>H', bytes(data[27:29]))[0]
+    except (IOError, OSError, struct.error):
+        return None
+
 Imager = DVISVGM
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 from __future__ import absolute_import
-import os, sys
+import os, sys, subprocess
 from . import gspdfpng
 
 gs = 'gs'
@@ -12,10 +12,12 @@ class GSDVIPNG(gspdfpng.GSPDFPNG):
     compiler = 'latex'
     verification = '(%s --help && dvips --help)' % gs
 
-    def executeConverter(self, output):
-        open('images.dvi', 'w').write(output.read())
-        rc = os.system('dvips -o images.ps images.dvi')
+    def executeConverter(self, output, directory):
+        with open(os.path.join(directory, 'images.dvi'), 'wb') as f:
+            f.write(output.read())
+        rc = subprocess.call('dvips -o images.ps images.dvi', shell=True, cwd=directory)
         if rc: return rc, None
-        return gspdfpng.GSPDFPNG.executeConverter(self, open('images.ps'))
+        with open(os.path.join(directory, 'images.ps'), 'rb') as ps:
+            return gspdfpng.GSPDFPNG.executeConverter(self, ps, directory)
 
 Imager = GSDVIPNG
@@ -2,7 +2,7 @@ from __future__ import division
 #!/usr/bin/env python
 
 from plasTeX.Logging import getLogger
-import plasTeX.Imagers, glob, sys
+import plasTeX.Imagers, sys
 
 status = getLogger('status')
 
@@ -17,24 +17,16 @@ class GSPDFPNG(plasTeX.Imagers.Imager):
     compiler = 'pdflatex'
     fileExtension = '.png'
 
-    def executeConverter(self, output):
-        res = plasTeX.Imagers.Imager.executeConverter(self, output)
-        self.scaleImages()
-        return res
-
-    def scaleImages(self):
-        """ Scale images down and anti-alias """
-        if plasTeX.Imagers.PILImage is not None:
-            PILImage = plasTeX.Imagers.PILImage
-            scaledown = 2.2
-            for filename in glob.glob('img*.png'):
-                status.info('[%s]' % filename,)
-                img = plasTeX.Imagers.autoCrop(PILImage.open(filename), 
-                                               margin=3)[0]
-                width, height = [int(float(x)/scaledown) for x in img.size]
-                img = img.resize((width, height), PILImage.ANTIALIAS)
-                img = img.point(self.toWhite)
-                img.save(filename)
+    # Ghostscript renders at a higher resolution than the final images
+    # and they are scaled down to anti-alias them
+    scaledown = 2.2
+
+    def processImage(self, im):
+        """ Scale the image down and anti-alias """
+        im = plasTeX.Imagers.autoCrop(im, margin=3)[0]
+        width, height = [int(float(x)/self.scaledown) for x in im.size]
+        im = im.resize((width, height), plasTeX.Imagers.ANTIALIAS)
+        return im.point(self.toWhite)
 
     def toWhite(self, pixel):
         if pixel >= 245:
@@ -31,14 +31,15 @@ class pdftoppm(plasTeX.Imagers.Imager):
         return True
 
 
-    def executeConverter(self, output):
+    def executeConverter(self, output, directory):
         """
         We need to override this because plasTeX always puts the input
         file at the end of the command-line.  We also need to return the
         list of images.
 
         """
-        open('images.out', 'wb').write(output.read())
+        with open(os.path.join(directory, 'images.out'), 'wb') as f:
+            f.write(output.read())
         options = ''
         if self._configOptions:
             for opt, value in self._configOptions:
@@ -46,7 +47,8 @@ class pdftoppm(plasTeX.Imagers.Imager):
                 if ' ' in value:
                     value = '"%s"' % value
                 options += '%s %s ' % (opt, value)
-        rc = os.system('%s %s%s img' % (self.command, options, 'images.out'))
-        return rc, [f for f in os.listdir('.') if re.match(r'^img-\d+\.\w+$', f)]
+        rc = subprocess.call('%s %s%s img' % (self.command, options, 'images.out'),
+                             shell=True, cwd=directory)
+        return rc, [f for f in os.listdir(directory) if re.match(r'^img-\d+\.\w+$', f)]
 
 Imager = pdftoppm
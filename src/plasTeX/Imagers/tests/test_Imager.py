@@ -19,14 +19,25 @@ import unittest
 from hamcrest import assert_that
 from hamcrest import is_
 from hamcrest import has_length
+from hamcrest import is_not
+from hamcrest import same_instance
+from hamcrest import none
 from hamcrest.library.collection.is_empty import empty as is_empty
 
 import os
+import sys
+import shutil
 import importlib
 import glob
 import tempfile
 
 from .. import Imager
+from .. import VectorImager
+from .. import Image
+from .. import svgSize
+from .. import saveImage
+from .. import PILImage
+from ..dvisvgm import DVISVGM
 from plasTeX import TeXDocument
 
 class TestImagers(unittest.TestCase):
@@ -56,6 +67,416 @@ class TestImagers(unittest.TestCase):
             assert_that( new_imager._cache, is_empty() )
 
 
+    def test_equivalent_sources_share_image(self):
+        doc = TeXDocument()
+        doc.userdata['working-dir'] = tempfile.gettempdir()
+        imager = Imager(doc)
+
+        img = imager.newImage('$x^2$')
+        assert_that( imager.newImage('$x^{2}$'), is_( same_instance( img ) ) )
+        assert_that( imager.newImage('$ x^2 $ % comment\n'), is_( same_instance( img ) ) )
+        assert_that( imager.newImage('$x^2$'), is_( same_instance( img ) ) )
+        assert_that( imager.images, has_length( 1 ) )
+        assert_that( imager.deduplicated, is_( 2 ) )
+
+        # Grouping that changes the output is preserved
+        assert_that( imager.newImage('$x^{22}$'), is_not( same_instance( img ) ) )
+        assert_that( imager.images, has_length( 2 ) )
+
+    def test_canonical_source_keeps_verbatim(self):
+        doc = TeXDocument()
+        doc.userdata['working-dir'] = tempfile.gettempdir()
+        imager = Imager(doc)
+
+        assert_that( imager.canonicalSource('\\verb|a  b|'), is_( '\\verb|a  b|' ) )
+        source = '\\begin{verbatim}\na  b\n\\end{verbatim}'
+        assert_that( imager.canonicalSource(source), is_( source ) )
+        # Words that merely contain "verb" are not verbatim
+        assert_that( imager.canonicalSource('$ verb $'), is_( '$verb$' ) )
+        assert_that( imager.canonicalSource('\\mbox{a  b}'),
+                     is_( imager.canonicalSource('\\mbox{a b}') ) )
+
+    def test_canonical_source_keeps_text_spaces(self):
+        doc = TeXDocument()
+        doc.userdata['working-dir'] = tempfile.gettempdir()
+        imager = Imager(doc)
+        canonical = imager.canonicalSource
+
+        # Spaces in text mode change the output
+        for first, second in [('Hello $x$', 'Hello$x$'),
+                              ('\\fbox{ x }', '\\fbox{x}'),
+                              ('$x$ and', '$x$and'),
+                              ('$\\text{ if } x$', '$\\text{if} x$'),
+                              ('$\\makebox[1cm]{ a }$', '$\\makebox[1cm]{a}$'),
+                              ('$\\parbox{1cm}{ a }$', '$\\parbox{1cm}{a}$'),
+                              ('\\begin{equation}x\\end{equation} { a }',
+                               '\\begin{equation}x\\end{equation} {a}')]:
+            assert_that( canonical(first), is_not( canonical(second) ) )
+
+        # Spaces in math mode don't
+        for first, second in [('$$ x^{2} $$', '$$x^2$$'),
+                              ('\\[ a ^ {b} \\]', '\\[a^b\\]'),
+                              ('\\begin{align*} x & = { y } \\end{align*}',
+                               '\\begin{align*}x&={y}\\end{align*}'),
+                              ('$\\text{a} + { x }$', '$\\text{a}+{x}$')]:
+            assert_that( canonical(first), is_( canonical(second) ) )
+
+    def test_svg_size(self):
+        with tempfile.NamedTemporaryFile(suffix='.svg', mode='w') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<!-- width="99pt" -->\n'
+                    '<svg xmlns="http://www.w3.org/2000/svg" width="12.5pt" '
+                    'height="100%" viewBox="0 -8 12.5 1.2e1">'
+                    '<rect width="3" height="4"/></svg>')
+            f.flush()
+            assert_that( svgSize(f.name), is_( (12.5, 12.0) ) )
+
+            image = Image(os.path.basename(f.name), TeXDocument().config['images'])
+            image.path = f.name
+            image.crop()
+            assert_that( (image.width, image.height), is_( (12.5, 12.0) ) )
+
+        with tempfile.NamedTemporaryFile(suffix='.svg', mode='w') as f:
+            f.write('not svg')
+            f.flush()
+            assert_that( svgSize(f.name), is_( (0, 0) ) )
+
+    @unittest.skipIf(PILImage is None, 'PIL is not installed')
+    def test_crop_from_source(self):
+        directory = tempfile.mkdtemp()
+        try:
+            # A registration mark with its bottom edge on the baseline,
+            # and content that goes 10 pixels below it
+            source = os.path.join(directory, 'img1.png')
+            im = PILImage.new('RGB', (100, 60), 'white')
+            im.paste((0, 0, 0), (10, 20, 15, 30))
+            im.paste((64, 64, 64), (20, 10, 60, 40))
+            im.save(source)
+            with open(source, 'rb') as f:
+                data = f.read()
+
+            config = TeXDocument().config['images']
+            config['baseline-padding'] = 0
+            image = Image('images/img1.png', config)
+            image.path = os.path.join(directory, 'images', 'img1.png')
+            processed = []
+            def process(im):
+                processed.append(im.size)
+                return im
+            image.crop(source, process)
+
+            assert_that( processed, is_( [(100, 60)] ) )
+            assert_that( (image.width, image.height, image.depth), is_( (40, 30, -10) ) )
+            assert_that( PILImage.open(image.path).size, is_( (40, 30) ) )
+            # The converter output is left alone
+            with open(source, 'rb') as f:
+                assert_that( f.read(), is_( data ) )
+
+            # The Ghostscript imager scales the images down as they are cropped
+            from ..gspdfpng import GSPDFPNG
+            image = Image('img2.png', config)
+            image.path = os.path.join(directory, 'img2.png')
+            image.crop(source, GSPDFPNG.__new__(GSPDFPNG).processImage)
+            assert_that( image.width < 40, is_( True ) )
+        finally:
+            shutil.rmtree(directory)
+
+    @unittest.skipIf(PILImage is None, 'PIL is not installed')
+    def test_save_image(self):
+        directory = tempfile.mkdtemp()
+        try:
+            # An anti-aliased gray gradient on a white background
+            im = PILImage.new('RGB', (80, 20), 'white')
+            for x in range(60):
+                im.paste((x * 4,) * 3, (x + 10, 5, x + 11, 15))
+            path = os.path.join(directory, 'img.png')
+            config = TeXDocument().config['images']
+
+            # The defaults write the image as it is
+            saveImage(im, path, config)
+            saved = PILImage.open(path)
+            assert_that( saved.mode, is_( 'RGB' ) )
+            assert_that( list(saved.getdata()), is_( list(im.getdata()) ) )
+
+            config['grayscale'] = True
+            saveImage(im, path, config)
+            saved = PILImage.open(path)
+            assert_that( saved.mode, is_( 'L' ) )
+            assert_that( list(saved.getdata()), is_( list(im.convert('L').getdata()) ) )
+
+            config['palette'] = 8
+            config['transparent'] = True
+            config['optimize'] = True
+            saveImage(im, path, config)
+            saved = PILImage.open(path)
+            assert_that( saved.mode, is_( 'P' ) )
+            assert_that( saved.getcolors(), has_length( 8 ) )
+            # The background keeps its color and is the transparent one
+            index = saved.getpixel((0, 0))
+            assert_that( saved.info['transparency'], is_( index ) )
+            assert_that( saved.convert('RGB').getpixel((0, 0)), is_( (255, 255, 255) ) )
+
+            # Colored images use the color that is asked for
+            config['palette'] = 0
+            config['transparent-color'] = '#ff0000'
+            im.paste((255, 0, 0), (0, 0, 5, 5))
+            saveImage(im, path, config)
+            saved = PILImage.open(path)
+            assert_that( saved.mode, is_( 'P' ) )
+            assert_that( saved.info['transparency'], is_( saved.getpixel((0, 0)) ) )
+        finally:
+            shutil.rmtree(directory)
+
+    def test_dvisvgm_page_ranges(self):
+        doc = TeXDocument()
+        doc.userdata['working-dir'] = tempfile.gettempdir()
+        imager = DVISVGM(doc)
+        imager.pagesPerProcess = 50
+        doc.config['general']['jobs'] = 4
+        doc.config['images']['batch-size'] = 0
+        assert_that( imager.converterProcesses, is_( 4 ) )
+
+        assert_that( imager.pageRanges(0, 4), is_( ['1-'] ) )
+        assert_that( imager.pageRanges(99, 4), is_( ['1-'] ) )
+        assert_that( imager.pageRanges(150, 8), is_( ['1-50', '51-100', '101-'] ) )
+        assert_that( imager.pageRanges(3000, 4),
+                     is_( ['1-750', '751-1500', '1501-2250', '2251-'] ) )
+
+    @unittest.skipIf(PILImage is None or sys.platform.startswith('win'),
+                     'Needs PIL and executable scripts')
+    def test_batches(self):
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            # Stand-ins for LaTeX and the converter: the "compiled"
+            # output is the number of pages
+            compiler = os.path.join(directory, 'compiler')
+            converter = os.path.join(directory, 'converter')
+            with open(compiler, 'w') as f:
+                f.write('#!%s\nimport sys\n'
+                        'src = open(sys.argv[-1]).read()\n'
+                        'open("images.pdf", "w").write(str(src.count("begin{plasTeXimage}")))\n'
+                        % sys.executable)
+            with open(converter, 'w') as f:
+                f.write('#!%s\nimport sys\nfrom PIL import Image\n'
+                        'for i in range(int(open(sys.argv[-1]).read())):\n'
+                        '    Image.new("RGB", (10 + i, 5), "black").save("img%%d.png" %% (i + 1))\n'
+                        % sys.executable)
+            os.chmod(compiler, 0o755)
+            os.chmod(converter, 0o755)
+
+            doc = TeXDocument()
+            doc.userdata['working-dir'] = directory
+            doc.config['images']['compiler'] = compiler
+            doc.config['images']['batch-size'] = 2
+            doc.config['images']['baseline-padding'] = 0
+            imager = Imager(doc)
+            imager.command = converter
+            os.chdir(directory)
+
+            images = [imager.newImage('$x^{%d}$' % i) for i in range(5)]
+            # Two full batches were started while "rendering"
+            assert_that( imager._jobs, has_length( 2 ) )
+            assert_that( imager._batch, has_length( 1 ) )
+            # The batches share the pool's jobs, so each converter
+            # run starts one process
+            assert_that( imager.converterProcesses, is_( 1 ) )
+
+            imager.close()
+            assert_that( os.getcwd(), is_( directory ) )
+            assert_that( [os.path.isfile(image.path) and image._cropped for image in images],
+                         is_( [True] * 5 ) )
+            assert_that( imager._written, is_( sum([os.path.getsize(image.path) for image in images]) ) )
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+    def _standIns(self, directory, **converters):
+        """ Write a stand-in for LaTeX and the converters to `directory' """
+        scripts = {'compiler': 'import sys\n'
+                               'src = open(sys.argv[-1]).read()\n'
+                               'open("images.pdf", "w").write(str(src.count("begin{plasTeXimage}")))\n'}
+        scripts.update(converters)
+        paths = {}
+        for name, body in scripts.items():
+            path = paths[name] = os.path.join(directory, name)
+            with open(path, 'w') as f:
+                f.write('#!%s\n%s' % (sys.executable, body))
+            os.chmod(path, 0o755)
+        return paths
+
+    @unittest.skipIf(PILImage is None or sys.platform.startswith('win'),
+                     'Needs PIL and executable scripts')
+    def test_vector_batches(self):
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            # The bitmaps are slower than the vector images, so the
+            # vector batches are cropped first
+            scripts = self._standIns(directory,
+                bitmaps='import sys, time\nfrom PIL import Image\ntime.sleep(0.5)\n'
+                        'for i in range(int(open(sys.argv[-1]).read())):\n'
+                        '    im = Image.new("RGB", (12, 12), "white")\n'
+                        '    im.paste((0, 0, 0), (0, 4, 2, 6))\n'
+                        '    im.paste((0, 0, 0), (4, 1, 10, 9))\n'
+                        '    im.save("img%d.png" % (i + 1))\n',
+                vectors='import sys\n'
+                        'for i in range(int(open(sys.argv[-1]).read())):\n'
+                        '    open("img%d.svg" % (i + 1), "w").write(\n'
+                        '        \'<svg xmlns="http://www.w3.org/2000/svg" width="8" height="10"/>\')\n')
+
+            doc = TeXDocument()
+            doc.userdata['working-dir'] = directory
+            doc.config['images']['compiler'] = scripts['compiler']
+            doc.config['images']['batch-size'] = 2
+            doc.config['images']['baseline-padding'] = 0
+            os.chdir(directory)
+            imager = Imager(doc)
+            imager.command = scripts['bitmaps']
+            vectorImager = VectorImager(doc)
+            vectorImager.command = scripts['vectors']
+            assert_that( vectorImager.pipelined, is_( True ) )
+
+            images = []
+            for i in range(4):
+                vector = vectorImager.newImage('$x^{%d}$' % i)
+                vector.bitmap = imager.newImage('$x^{%d}$' % i)
+                images.append(vector)
+            # Let the vector batches finish while the bitmaps are made
+            for job in vectorImager._jobs:
+                job.get()
+            assert_that( [image._cropped for image in images], is_( [True] * 4 ) )
+
+            # Renderers close the imager before the vector imager
+            imager.close()
+            vectorImager.close()
+            for image in images:
+                assert_that( image.bitmap._cropped, is_( True ) )
+                assert_that( image.depth, is_( image.bitmap.depth ) )
+            assert_that( images[0].bitmap.depth, is_( -3 ) )
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+    @unittest.skipIf(PILImage is None or sys.platform.startswith('win'),
+                     'Needs PIL and executable scripts')
+    def test_converter_in_current_directory(self):
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            scripts = self._standIns(directory)
+
+            class OldImager(Imager):
+                # executeConverter() as it was written before batches
+                # were converted in the background
+                def executeConverter(self, output):
+                    for i in range(int(output.read())):
+                        PILImage.new('RGB', (10, 5), 'black').save('img%d.png' % (i + 1))
+                    return 0, None
+
+            doc = TeXDocument()
+            doc.userdata['working-dir'] = directory
+            doc.config['images']['compiler'] = scripts['compiler']
+            os.chdir(directory)
+            imager = OldImager(doc)
+            assert_that( imager.convertsInDirectory, is_( False ) )
+            assert_that( imager.pipelined, is_( False ) )
+            assert_that( Imager(doc).convertsInDirectory, is_( True ) )
+
+            images = [imager.newImage('$x^{%d}$' % i) for i in range(3)]
+            imager.close()
+            assert_that( os.getcwd(), is_( directory ) )
+            assert_that( [os.path.isfile(image.path) and image._cropped for image in images],
+                         is_( [True] * 3 ) )
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+    @unittest.skipIf(PILImage is None, 'PIL is not installed')
+    def test_static_images(self):
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            os.chdir(directory)
+            figure = os.path.join(directory, 'figure.jpg')
+            PILImage.new('RGB', (40, 20), 'blue').save(figure)
+
+            class Node(object):
+                imageoverride = figure
+                source = r'\includegraphics{figure}'
+
+            def render():
+                doc = TeXDocument()
+                doc.userdata['working-dir'] = directory
+                doc.config['images']['scale-factor'] = 0.5
+                doc.config['images']['static-resolutions'] = '2'
+                doc.config['images']['static-cache'] = cache
+                imager = Imager(doc)
+                image = imager.getImage(Node())
+                # The size is known before the image is written
+                assert_that( (image.width, image.height), is_( (20, 10) ) )
+                assert_that( imager.getImage(Node()), is_( same_instance( image ) ) )
+                imager.close()
+                return image
+
+            # The cache is only written when it is asked for
+            cache = False
+            render()
+            assert_that( os.path.exists(os.path.join(directory, '.cache', 'static-images')),
+                         is_( False ) )
+
+            cache = True
+            image = render()
+            large = image.resolutions[0][1]
+            assert_that( image.filename, is_( 'images/img-0001.png' ) )
+            assert_that( PILImage.open(image.path).size, is_( (20, 10) ) )
+            assert_that( PILImage.open(large.path).size, is_( (40, 20) ) )
+            assert_that( image.srcset,
+                         is_( 'images/img-0001.png 1x, images/img-0001@2x.png 2x' ) )
+
+            # The next run copies the results from the cache
+            cachedir = os.path.join(directory, '.cache', 'static-images')
+            assert_that( os.listdir(cachedir), has_length( 2 ) )
+            for name in os.listdir(cachedir):
+                with open(os.path.join(cachedir, name), 'wb') as f:
+                    f.write(b'cached')
+            image = render()
+            with open(image.path, 'rb') as f:
+                assert_that( f.read(), is_( b'cached' ) )
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+    @unittest.skipIf(PILImage is None, 'PIL is not installed')
+    def test_static_image_failure(self):
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            os.chdir(directory)
+            # The header can be read, but not the pixels
+            figure = os.path.join(directory, 'figure.png')
+            PILImage.new('RGB', (40, 20), 'blue').save(figure)
+            with open(figure, 'rb') as f:
+                data = f.read()
+            with open(figure, 'wb') as f:
+                f.write(data[:60])
+
+            class Node(object):
+                imageoverride = figure
+                source = r'\includegraphics{figure}'
+
+            doc = TeXDocument()
+            doc.userdata['working-dir'] = directory
+            doc.config['images']['scale-factor'] = 0.5
+            imager = Imager(doc)
+            image = imager.getImage(Node())
+            assert_that( image.srcset, is_( none() ) )
+            imager.close()
+            assert_that( imager._staticFailures, is_( [(figure, image.path)] ) )
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
 
 def _make_check(fname):
     pname = os.path.basename(fname)
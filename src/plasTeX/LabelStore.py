@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Indexed on-disk store of the labels of many documents
+
+Every render writes the persisted attributes of the labels of its
+document (see `Macro.persist') to a single SQLite database, indexed by
+renderer and label, so that other documents can refer to them.  Unlike
+the *.paux pickles, which are read completely and turned into macro
+instances whether or not they are referenced, a `LabelStore' is only
+queried when a label that the document does not define is looked up in
+`Context.labels'.
+
+A document's labels are replaced in a single transaction, so documents
+that are rendered at the same time can write to the same store.
+
+"""
+from __future__ import absolute_import
+
+import sqlite3
+
+from six.moves import cPickle as pickle
+
+from plasTeX.Logging import getLogger
+
+log = getLogger(__name__)
+
+# Seconds to wait for another process that is writing to the store
+TIMEOUT = 60
+
+class LabelStore(object):
+    """ Labels of many documents in one SQLite database """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS labels (
+            rtype TEXT NOT NULL,
+            label TEXT NOT NULL,
+            document TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (rtype, label, document)
+        )
+        """
+
+    def __init__(self, filename):
+        """
+        Required Arguments:
+        filename -- the database file.  It is created when labels are
+            first written to it.
+
+        """
+        self.filename = filename
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.filename, timeout=TIMEOUT)
+            self._connection.execute(self.schema)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def lookup(self, label, rtype='none', exclude=None):
+        """
+        Return the persisted attributes of `label'
+
+        Required Arguments:
+        label -- the label to look up
+
+        Keyword Arguments:
+        rtype -- the name of the renderer the label was written by
+        exclude -- the name of a document whose labels are ignored,
+            usually the one being processed
+
+        Returns:
+        dictionary of attributes, or None if no other document has
+        the label
+
+        """
+        row = self.connection.execute(
+            'SELECT data FROM labels WHERE rtype = ? AND label = ? '
+            'AND document != ? LIMIT 1',
+            (rtype, label, exclude or '')).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(bytes(row[0]))
+
+    def documents(self, rtype='none'):
+        """ Return the names of the documents that have labels in the store """
+        return [row[0] for row in self.connection.execute(
+                'SELECT DISTINCT document FROM labels WHERE rtype = ?', (rtype,))]
+
+    def update(self, document, labels, rtype='none'):
+        """
+        Replace all the labels of a document
+
+        Required Arguments:
+        document -- the name of the document, usually its jobname
+        labels -- dictionary mapping labels to their persisted attributes
+
+        Keyword Arguments:
+        rtype -- the name of the renderer that wrote the labels
+
+        """
+        rows = [(rtype, key, document,
+                 sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+                for key, value in labels.items()]
+        connection = self.connection
+        # Take the write lock before reading anything, so concurrent
+        # writers wait for each other instead of failing
+        connection.isolation_level = None
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('DELETE FROM labels WHERE rtype = ? AND document = ?',
+                                   (rtype, document))
+                connection.executemany('INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?)',
+                                       rows)
+            except:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+        finally:
+            connection.isolation_level = ''
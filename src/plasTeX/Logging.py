@@ -2,9 +2,17 @@
 from __future__ import absolute_import
 import textwrap, types
 import logging
-from logging import CRITICAL, DEBUG, Logger as _Logger, StreamHandler as _StreamHandler, Formatter
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict as ordereddict
+from logging import CRITICAL, DEBUG, INFO, WARNING, Logger as _Logger, StreamHandler as _StreamHandler, Formatter
 from logging import addLevelName, setLoggerClass, getLoggerClass
 
+from six.moves import queue as Queue
+
 
 MAX_WIDTH = 75
 LOG_FORMAT = '[%(name)s] %(levelname)s: %(message)s'
@@ -152,6 +160,9 @@ root = logging.getLogger("plasTeX")
 
 _loggers = {None:root}
 
+# Handlers attached by enableDiagnostics() to all plasTeX loggers
+_diagnostics = []
+
 def getLogger(name=None):
     """
     Return a logger with the specified name, creating it if necessary.
@@ -160,6 +171,9 @@ def getLogger(name=None):
     """
     if name and name != "plasTeX":
         logger = logging.getLogger(name)
+        if name not in _loggers and not name.startswith('plasTeX.'):
+            for handler in _diagnostics:
+                _attach(handler, logger)
         _loggers[name] = logger
         return logger
     else:
@@ -169,3 +183,246 @@ def disableLogging():
     """ Disable all logging """
     for logger in _loggers.values():
         logger.setLevel(CRITICAL)
+
+
+class BackgroundStream(object):
+    """
+    File-like object that writes to another stream from a background thread
+
+    Writes are queued and the worker thread writes everything that has
+    accumulated in one go, flushing the underlying stream once per batch
+    rather than once per record.  Calling flush() on this object does
+    not block; use drain() to wait until all queued output is written.
+
+    """
+
+    def __init__(self, stream=None):
+        """
+        Required Arguments:
+        stream -- the stream to write to.  Defaults to sys.stderr.
+
+        """
+        self.stream = stream if stream is not None else sys.stderr
+        self._queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='plasTeX-log-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, data):
+        self._queue.put(data)
+
+    def flush(self):
+        """ Output is flushed in batches by the writer thread """
+
+    def _run(self):
+        get, get_nowait = self._queue.get, self._queue.get_nowait
+        while True:
+            data = [get()]
+            # Gather everything else that is already waiting
+            while True:
+                try:
+                    data.append(get_nowait())
+                except Queue.Empty:
+                    break
+            closing = None in data
+            try:
+                self.stream.write(''.join([x for x in data if x is not None]))
+                self.stream.flush()
+            except Exception: # pragma: no cover
+                pass
+            for _ in data:
+                self._queue.task_done()
+            if closing:
+                return
+
+    def drain(self):
+        """ Block until all queued output has been written """
+        self._queue.join()
+
+    def close(self):
+        """ Write all pending output and stop the writer thread """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+class DiagnosticsHandler(logging.Handler):
+    """
+    Handler that buffers console output and deduplicates warnings
+
+    Status messages (from loggers named `status' or ending in `.status')
+    are written without line breaks, all other messages one per line.
+    Each distinct warning or error message is written at most `limit'
+    times; further occurrences are only counted.  Counts are kept per
+    phase (see phase()) and summarized at the end of each phase that
+    had any, or of every phase if `verbose' is set.
+
+    """
+
+    def __init__(self, stream=None, limit=1, level=INFO, verbose=False):
+        """
+        Keyword Arguments:
+        stream -- stream to write to.  Defaults to sys.stderr.
+        limit -- number of times each distinct warning is written
+        level -- minimum level of messages to write
+        verbose -- write the summaries of phases without warnings too
+
+        """
+        logging.Handler.__init__(self, level)
+        self.output = BackgroundStream(stream)
+        self.limit = limit
+        self.verbose = verbose
+        self._stream = StreamHandler(self.output)
+        self._stream.setFormatter(StreamFormatter(LOG_FORMAT))
+        self._status = StatusHandler(self.output)
+        self._status.setFormatter(StreamFormatter(STATUS_FORMAT))
+        self.counts = ordereddict()
+        self.summaries = []
+        self._phase = None
+        self._phaseStart = None
+
+    @staticmethod
+    def isStatus(record):
+        name = record.name
+        return name == 'status' or name.endswith('.status')
+
+    def emit(self, record):
+        if self.isStatus(record):
+            self._status.handle(record)
+            return
+        if record.levelno >= WARNING:
+            key = (record.name, record.levelname, record.getMessage())
+            count = self.counts[key] = self.counts.get(key, 0) + 1
+            if self.limit is not None and count > self.limit:
+                return
+        self._stream.handle(record)
+
+    def summary(self, name=None, elapsed=None):
+        """
+        Return a structured summary of the warnings counted so far
+
+        Keyword Arguments:
+        name -- name of the phase
+        elapsed -- number of seconds the phase took
+
+        Returns:
+        dictionary containing the phase name, elapsed time, total count
+        of messages by level, and a list of distinct messages with their
+        counts (most frequent first)
+
+        """
+        levels = {}
+        messages = []
+        for (logger, level, message), count in self.counts.items():
+            levels[level] = levels.get(level, 0) + count
+            messages.append({'logger': logger, 'level': level,
+                             'message': message, 'count': count})
+        messages.sort(key=lambda x: -x['count'])
+        return {'phase': name, 'elapsed': elapsed,
+                'levels': levels, 'messages': messages}
+
+    @staticmethod
+    def formatSummary(summary):
+        """ Return a plain text version of a summary dictionary """
+        lines = []
+        total = sum(summary['levels'].values())
+        header = 'Phase %s' % summary['phase']
+        if summary['elapsed'] is not None:
+            header += ' (%.2fs)' % summary['elapsed']
+        if not total:
+            return header + ': no warnings'
+        lines.append('%s: %s' % (header, ', '.join(['%d %s' % (v, k.lower())
+                                 for k, v in sorted(summary['levels'].items())])))
+        for item in summary['messages']:
+            if item['count'] > 1:
+                lines.append('  %6dx %s' % (item['count'], item['message']))
+            else:
+                lines.append('         %s' % item['message'])
+        return '\n'.join(lines)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Collect diagnostics for one phase of processing
+
+        The warning counts are reset when the phase starts.  When it
+        ends, the summary is appended to `summaries' and, if there was
+        anything to report or `verbose' is set, its text form is
+        written to the output.
+
+        Required Arguments:
+        name -- name of the phase (e.g. `parse', `render')
+
+        """
+        self.counts = ordereddict()
+        start = time.time()
+        try:
+            yield self
+        finally:
+            summary = self.summary(name, time.time() - start)
+            self.summaries.append(summary)
+            self.counts = ordereddict()
+            if self.verbose or summary['messages']:
+                self.output.write('\n%s\n' % self.formatSummary(summary))
+
+    def toJSON(self):
+        """ Return all phase summaries as a JSON string """
+        return json.dumps(self.summaries, indent=2, sort_keys=True)
+
+    def flush(self):
+        self.output.drain()
+
+    def close(self):
+        self.output.close()
+        logging.Handler.close(self)
+
+
+def enableDiagnostics(stream=None, limit=1, level=INFO, logger=None, verbose=False):
+    """
+    Send log output through a buffered, deduplicating DiagnosticsHandler
+
+    Keyword Arguments:
+    stream -- stream to write to.  Defaults to sys.stderr.
+    limit -- number of times each distinct warning is written
+    level -- minimum level of messages to write
+    logger -- logger to attach the handler to.  Defaults to the
+        plasTeX logger and the other top-level loggers made by
+        getLogger() (e.g. `status'), so that all plasTeX messages are
+        covered without touching the Python root logger.
+    verbose -- see DiagnosticsHandler
+
+    Returns:
+    the DiagnosticsHandler instance.  Pass it to disableDiagnostics()
+    to detach it again.
+
+    """
+    handler = DiagnosticsHandler(stream, limit=limit, level=level, verbose=verbose)
+    handler.loggers = []
+    if logger is None:
+        for logger in [root] + [x for x in _loggers.values()
+                                if x is not root and not x.name.startswith('plasTeX.')]:
+            _attach(handler, logger)
+        _diagnostics.append(handler)
+    else:
+        _attach(handler, logger)
+    return handler
+
+def _attach(handler, logger):
+    """ Attach a DiagnosticsHandler to a logger, remembering its level """
+    handler.loggers.append((logger, logger.level))
+    logger.addHandler(handler)
+    if logger.level == logging.NOTSET or logger.level > handler.level:
+        logger.setLevel(handler.level)
+
+def disableDiagnostics(handler):
+    """
+    Detach a handler made by enableDiagnostics() from its loggers,
+    restore their levels and write all pending output
+
+    """
+    if handler in _diagnostics:
+        _diagnostics.remove(handler)
+    for logger, level in handler.loggers:
+        logger.removeHandler(handler)
+        logger.setLevel(level)
+    handler.close()
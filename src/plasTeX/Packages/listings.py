@@ -2,9 +2,12 @@
 
 import sys, re, codecs
 from plasTeX import Base
+from plasTeX.Highlighting import Highlighter, pygments
 
-try: import pygments
-except: pygments = None
+from six import text_type
+
+# Single-line "listings" comments, see _format()
+_commentRE = re.compile(r'/\*@[^@]*@\*/')
 
 class listingsname(Base.Command):
     unicode = 'Listing'
@@ -25,7 +28,19 @@ class lstset(Base.Command):
             self.ownerDocument.context.current_language = \
                 self.attributes['arguments']['language']
 
-class lstlisting(Base.verbatim):
+class Listing(object):
+    """ Mixin for the macros whose listing is syntax highlighted """
+
+    _highlight = None
+
+    @property
+    def xhtml_listing(self):
+        """ The syntax highlighted XHTML version of `plain_listing' """
+        if self._highlight is None:
+            return None
+        return self._highlight.value
+
+class lstlisting(Listing, Base.verbatim):
     args = '[ arguments:dict ]'
     counter = 'listings'
 
@@ -35,13 +50,13 @@ class lstlisting(Base.verbatim):
         s = ''.join(Base.verbatim.invoke(self, tex)[1:]).replace('\r','').split('\n')
         _format(self, s)
 
-class lstinline(Base.verb):
+class lstinline(Listing, Base.verb):
     args = '[ arguments:dict ]'
 
     def invoke(self, tex):
         _format(self, ''.join(Base.verb.invoke(self, tex)[2:-1]))
 
-class lstinputlisting(Base.Command):
+class lstinputlisting(Listing, Base.Command):
     args = '[ arguments:dict ] file:str'
     counter = 'listings'
 
@@ -83,7 +98,7 @@ def _format(self, file):
 
     # Read the file, all the while respecting the "firstline" and
     # "lastline" arguments given in the document.
-    self.plain_listing = ''
+    lines = []
     for current_line_number, line in enumerate(file):
         current_line_number += 1
         if (current_line_number >= first_line_number) and \
@@ -91,16 +106,18 @@ def _format(self, file):
             # Remove single-line "listings" comments. Only
             # comments started by "/*@" and ended by "@*/" are
             # supported.
-            line = re.sub(r'/\*@[^@]*@\*/', '', line)
+            if '/*@' in line:
+                line = _commentRE.sub('', line)
 
             # Add the just-read line to the listing.
-            self.plain_listing += '\n' + line
+            lines.append(line)
+    self.plain_listing = ''.join('\n' + line for line in lines)
 
     # Create a syntax highlighted XHTML version of the file using Pygments
     if pygments is not None:
-        from pygments import lexers, formatters
         try:
-            lexer = lexers.get_lexer_by_name(self.ownerDocument.context.current_language.lower())
-        except Exception as msg:
-            lexer = lexers.TextLexer()
-        self.xhtml_listing = pygments.highlight(self.plain_listing, lexer, formatters.HtmlFormatter(linenos=linenos))
+            language = text_type(self.ownerDocument.context.current_language.lower())
+        except Exception:
+            language = ''
+        highlighter = Highlighter.forDocument(self.ownerDocument)
+        self._highlight = highlighter.get(self.plain_listing, language, linenos)
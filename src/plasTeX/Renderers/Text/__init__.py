@@ -13,6 +13,52 @@ except NameError: # py3
     unicode = str
 
 
+def fitWidths(minwidths, maxwidths, total):
+    """
+    Narrow the widest columns until all of them fit in `total'
+
+    This gives the same widths as taking one character at a time from
+    the widest column that is still wider than its minimum, but finds
+    the width that the widest columns end up with by bisection.
+
+    Required Arguments:
+    minwidths -- the minimum width of each column
+    maxwidths -- the maximum width of each column
+    total -- the sum of the widths to fit in.  This must be at
+        least the sum of `minwidths'.
+
+    Returns:
+    list of column widths
+
+    """
+    bounds = list(zip(minwidths, maxwidths))
+    def widths(level):
+        return [max(low, min(high, level)) for low, high in bounds]
+
+    # Find the highest level that all the wider columns can be cut to
+    low, high = 0, max(maxwidths)
+    while low < high:
+        level = (low + high + 1) // 2
+        if sum(widths(level)) <= total:
+            low = level
+        else:
+            high = level - 1
+    result = widths(low)
+
+    # Characters left over go to the last of the columns that would
+    # still be one wider, since the first of them are narrowed first
+    left = total - sum(result)
+    for i in range(len(result) - 1, -1, -1):
+        if not left:
+            break
+        if result[i] == low and bounds[i][1] > low and bounds[i][0] <= low:
+            result[i] += 1
+            left -= 1
+    return result
+
+# Placeholder of a block level element, see `TextRenderer.addBlock'
+_block_re = re.compile('(\\s*)\001\\[(\\d+)@+\\]')
+
 class TextRenderer(BaseRenderer):
     """ Renderer for plain text documents """
 
@@ -70,29 +116,56 @@ class TextRenderer(BaseRenderer):
         s = super(TextRenderer,self).processFileContent( document, s )
 
         # Put block level elements back in
-        block_re = re.compile('(\\s*)\001\\[(\\d+)@+\\]')
-        while 1:
-            m = block_re.search(s)
-            if not m:
-                break
-
-            space = ''
-            before = m.group(1)
-            if before is None:
-                before = ''
-            if '\n' in before:
-                spaces = before.split('\n')
-                space = spaces.pop()
-                before = '\n'.join(spaces) + '\n'
-
-            block = self.blocks[int(m.group(2))]
-            block = space + block.replace('\n', u'\n%s' % space)
-
-            s = block_re.sub('%s%s' % (before, block), s, 1)
+        s = self.expandBlocks(s)
 
         # Clean up newlines
         return re.sub(r'\s*\n\s*\n(\s*\n)+', r'\n\n\n', s)
 
+    def expandBlocks(self, s):
+        """
+        Replace the placeholders left by `addBlock' with their blocks
+
+        A block is indented by the whitespace that follows the last
+        line break before its placeholder.  Blocks can contain the
+        placeholders of other blocks, which are indented by the
+        whitespace before them plus that of the enclosing block.
+        Each character is looked at once.
+
+        Required Arguments:
+        s -- the string containing placeholders
+
+        Returns:
+        the string with all of the blocks put in
+
+        """
+        output = []
+        # Whitespace at the end of the output, after the last line break
+        # (if there is one in it)
+        newline, space = False, ''
+        # Strings still to be scanned and where to continue in each
+        stack = [(s, 0)]
+        while stack:
+            text, pos = stack.pop()
+            m = _block_re.search(text, pos)
+            end = m.start(2) - 2 if m else len(text)
+            chunk = text[pos:end]
+            if chunk:
+                output.append(chunk)
+                content = chunk.rstrip()
+                if content:
+                    newline, space = False, chunk[len(content):]
+                else:
+                    space += chunk
+                if '\n' in space:
+                    newline, space = True, space.rsplit('\n', 1)[1]
+            if m is None:
+                continue
+            stack.append((text, m.end()))
+            indent = space if newline else ''
+            block = self.blocks[int(m.group(2))]
+            stack.append((block.replace('\n', u'\n%s' % indent), 0))
+        return u''.join(output)
+
     def textDefault(self, node):
         return text_type(node)
 
@@ -161,20 +234,7 @@ class TextRenderer(BaseRenderer):
         elif sum(minwidths) > maxline:
             outwidths = minwidths
         else:
-            outwidths = list(maxwidths)
-            # If the minimum is also the maximum, take it out of the
-            # algorithm to determine lengths.
-            for i, item in enumerate(maxwidths):
-                if maxwidths[i] == minwidths[i]:
-                    maxwidths[i] = -1
-            # Iteratively subtract one from the longest line until the
-            # table will fit within maxline.
-            while sum(outwidths) > maxline:
-                index = maxwidths.index(max(maxwidths))
-                maxwidths[i] -= 1
-                outwidths[i] -= 1
-                if maxwidths[i] == minwidths[i]:
-                    maxwidths[i] = -1
+            outwidths = fitWidths(minwidths, maxwidths, maxline)
 
         # Render cells to correct widths
         rendered = []
@@ -425,12 +485,13 @@ class TextRenderer(BaseRenderer):
     # Quotations
 
     def do_quote(self, node):
+        # Mark line breaks with a character that block placeholders
+        # don't use
         backslash = self['\\']
-        self['\\'] = lambda *args: u'\001'
-        res = [x.strip() for x in text_type(node).split(u'\001')]
+        self['\\'] = lambda *args: u'\002'
         output = []
         for par in [x.strip() for x in text_type(node).split(u'\n\n')]:
-            for item in [x.strip() for x in par.split(u'\001')]:
+            for item in [x.strip() for x in par.split(u'\002')]:
                 output.append(self.fill(item, initial_indent='   ', subsequent_indent='      '))
             output.append('')
         output.pop()
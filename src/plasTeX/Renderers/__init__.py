@@ -11,6 +11,7 @@ from six.moves.urllib.parse import quote as url_quote
 from zope.dottedname.resolve import resolve as resolve_import
 
 from plasTeX.Filenames import Filenames
+from plasTeX.LabelStore import LabelStore
 from plasTeX.DOM import Node, Document
 from plasTeX.Logging import getLogger
 #from plasTeX.Imagers import Image, PILImage
@@ -95,7 +96,7 @@ def _as_unicode(child, val):
 
     log.warning('The renderer for %s returned a non-unicode string.  Using the default input encoding.',
                 type(child).__name__)
-    val = unicode(val, child.config['files']['input-encoding'])
+    val = unicode(val, child.config.snapshot.files.input_encoding)
     return val
 
 def render_children(r, childNodes):
@@ -173,7 +174,7 @@ def render_children(r, childNodes):
 
             # Write the file content
             with codecs.open(filename, 'w',
-                             child.config['files']['output-encoding'],
+                             child.config.snapshot.files.output_encoding,
                              errors=r.encodingErrors) as f:
                 f.write(val)
 
@@ -268,7 +269,7 @@ class RenderableMixin(object):
         if override is not None:
             return override
 
-        base = self.config['document']['base-url']
+        base = self.config.snapshot.document.base_url
         if base and base.endswith('/'):
             base = base[:-1]
 
@@ -355,7 +356,7 @@ class RenderableMixin(object):
             if not hasattr(self, 'config'):
                 return
 
-            level = getattr(self, 'splitlevel', self.config['files']['split-level'])
+            level = getattr(self, 'splitlevel', self.config.snapshot.files.split_level)
 
             # If our level doesn't invoke a split, don't return a filename
             if self.level > level:
@@ -481,22 +482,54 @@ class Renderer(dict):
         # Filename generator
         self.newFilename = None
 
-    def cacheFilenames(self, node):
+    def planFilenames(self, node):
         """
-        Generate filenames in order
+        Generate filenames in document order
 
         Since filenames are generated on demand, in order to make the
         nodes have a filename that corresponds to its position in the document,
         the filenames must be generated before rendering the document.
 
+        The document is walked in a single iterative pass and the
+        `filename' property is only consulted for the nodes that can
+        create a file: those at or above the split level, or that carry
+        a `splitlevel' or `filenameoverride' of their own.  Such nodes
+        may be nested anywhere, e.g. in a paragraph, so every element
+        is visited.
+
         Required Arguments:
         node -- the top-level node in the document
 
+        Returns:
+        dictionary mapping nodes to their filenames.  This is the
+        same object as the `files' attribute of the renderer.
+
         """
-        # Using the side-effect of the filename property
-        getattr(node, 'filename')
-        for child in node.childNodes:
-            self.cacheFilenames(child)
+        document = node.ownerDocument if node.ownerDocument is not None else node
+        split = document.config.snapshot.files.split_level
+        ELEMENT_NODE = Node.ELEMENT_NODE
+        DOCUMENT_NODE = Node.DOCUMENT_NODE
+
+        stack = [node]
+        pop, extend = stack.pop, stack.extend
+        while stack:
+            item = pop()
+            nodeType = item.nodeType
+            if nodeType == DOCUMENT_NODE:
+                extend(reversed(item.childNodes))
+                continue
+            if nodeType != ELEMENT_NODE:
+                continue
+            if item.level <= getattr(item, 'splitlevel', split) or \
+               getattr(item, 'filenameoverride', None) is not None:
+                # Using the side-effect of the filename property
+                getattr(item, 'filename')
+            if item.hasChildNodes():
+                extend(reversed(item.childNodes))
+
+        return self.files
+
+    cacheFilenames = planFilenames # BWC
 
     def render(self, document, postProcess=None):
         """
@@ -509,6 +542,34 @@ class Renderer(dict):
         document -- the document object to render
         postProcess -- a function that will be called with the content of
 
+        """
+        self.setUp(document)
+        try:
+            self.planFilenames(document)
+            self.createImagers(document)
+
+            # Invoke the rendering process
+            if self.renderMethod:
+                getattr(document, self.renderMethod)()
+            else:
+                unicode(document)
+
+            self.finish(document, postProcess=postProcess)
+        finally:
+            self.tearDown(document)
+
+    def setUp(self, document):
+        """
+        Prepare the document for rendering
+
+        This mixes the renderable class into the nodes and creates the
+        filename generator, which is all that is needed to compute
+        filenames and URLs.  Every call must be paired with a call
+        to `tearDown'.
+
+        Required Arguments:
+        document -- the document object to render
+
         """
         config = document.config
 
@@ -518,6 +579,13 @@ class Renderer(dict):
             log.warning('There are no keys in the renderer.  ' +
                         'All objects will use the default rendering method.')
 
+        # Create a filename generator
+        self.newFilename = Filenames(config['files'].get('filename', raw=True),
+                                     (config['files']['bad-chars'],
+                                      config['files']['bad-chars-sub']),
+                                     {'jobname':document.userdata.get('jobname', '')},
+                                     self.fileExtension)
+
         document.renderer = self # JAM: Make thread safe. See above
 
         # XXX JAM FIXME: Not thread safe because this manipulates
@@ -532,46 +600,66 @@ class Renderer(dict):
         # work on the proxy object. Obviously that's a design flaw
         # to rectify.
         mixin(Node, self.renderableClass)
-        try:
-
-            # Create a filename generator
-            self.newFilename = Filenames(config['files'].get('filename', raw=True),
-                                         (config['files']['bad-chars'],
-                                          config['files']['bad-chars-sub']),
-                                         {'jobname':document.userdata.get('jobname', '')},
-                                         self.fileExtension)
 
-            self.cacheFilenames(document)
+    def createImagers(self, document):
+        """ Instantiate the imager and the vector imager for `document' """
+        config = document.config
 
-            # Instantiate appropriate imager
-            self.imager = _create_imager(config, document, DefaultImager, self.imageTypes, self.imageUnits, self.imageAttrs)
+        # Instantiate appropriate imager
+        self.imager = _create_imager(config, document, DefaultImager, self.imageTypes, self.imageUnits, self.imageAttrs)
 
-            # Instantiate appropriate vector imager
-            self.vectorImager = _create_imager(config, document, DefaultVectorImager, self.vectorImageTypes, self.imageUnits, self.imageAttrs, kind='vector-imager')
+        # Instantiate appropriate vector imager
+        self.vectorImager = _create_imager(config, document, DefaultVectorImager, self.vectorImageTypes, self.imageUnits, self.imageAttrs, kind='vector-imager')
 
+    def finish(self, document, files=None, postProcess=None):
+        """
+        Finish rendering images, post-process the generated files and
+        write out the auxiliary information
 
-            # Invoke the rendering process
-            if self.renderMethod:
-                getattr(document, self.renderMethod)()
-            else:
-                unicode(document)
+        Required Arguments:
+        document -- the document object that was rendered
 
-            # Finish rendering images
-            self.imager.close()
-            self.vectorImager.close()
+        Keyword Arguments:
+        files -- the list of generated filenames.  By default these
+            are the filenames of all nodes in `self.files'.
+        postProcess -- see `cleanup'
 
-            # Run any cleanup activities
-            self.cleanup(document, list(self.files.values()), postProcess=postProcess)
+        """
+        config = document.config
 
-            # Write out auxilliary information
-            pauxname = os.path.join(document.userdata.get('working-dir','.'),
-                                    '%s.paux' % document.userdata.get('jobname',''))
-            rname = config['general']['renderer']
+        # Finish rendering images
+        self.imager.close()
+        self.vectorImager.close()
+
+        # Run any cleanup activities
+        if files is None:
+            files = list(self.files.values())
+        self.cleanup(document, files, postProcess=postProcess)
+
+        # Write out auxilliary information
+        workingdir = document.userdata.get('working-dir','.')
+        jobname = document.userdata.get('jobname','')
+        rname = config['general']['renderer']
+        storename = config['general']['label-store']
+        if storename:
+            store = LabelStore(os.path.join(workingdir, storename))
+            try:
+                document.context.persistLabels(store, jobname, rname)
+            finally:
+                store.close()
+        else:
+            pauxname = os.path.join(workingdir, '%s.paux' % jobname)
             document.context.persist(pauxname, rname)
-        finally:
-            # Remove mixins
-            unmix(Node, self.renderableClass)
-            del document.renderer
+
+    def tearDown(self, document):
+        """ Undo `setUp' """
+        # Remove mixins
+        unmix(Node, self.renderableClass)
+        del document.renderer
+
+        # Stop the processes that highlight listings
+        if getattr(document, 'highlighter', None) is not None:
+            document.highlighter.close()
 
     def processFileContent(self, document, s):
         return s
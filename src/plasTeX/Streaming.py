@@ -0,0 +1,653 @@
+#!/usr/bin/env python
+"""
+Section-at-a-time rendering of documents that are too large to be kept
+in memory as a whole
+
+A `DocumentStream' parses the document twice.  The first pass only
+collects what the rest of the document needs to know about each
+top-level section (part, chapter or section, whichever is used directly
+in the document environment): its labels, filenames, ids and table of
+contents entries.  As soon as a top-level section has been digested, it
+is replaced in the document by a `SectionStub' and its content is
+released.
+
+The second pass digests the document again with the labels of the first
+pass already defined, so references to later parts of the document
+resolve immediately.  Every top-level section is rendered and written
+out as soon as it is complete, then replaced by its stub from the first
+pass.  While a section is being rendered, the document "sees" the stubs
+of all the other sections, so navigation links and tables of contents
+are the same as if the whole document was in memory.  The document
+itself (front matter and table of contents) is rendered last.
+
+Peak memory is proportional to the largest top-level section rather
+than to the whole document.  Known limitations:
+
+* Filenames and generated ids must not depend on anything but the
+  document structure; both passes must parse the same input.
+* Top-level sections that don't create their own file are kept in the
+  document and rendered with it.
+* Citations are only resolved once the bibliography has been read in
+  the second pass, so those that precede it are not.
+* Renderers that define a `renderMethod' are rendered as a whole.
+
+Given the name of a build record (see plasTeX.Dependencies), the stream
+is incremental: the second pass records which input files were read
+while each top-level section was digested, the counters at its start
+and the labels it references.  On the next build, a section is only
+rendered again if one of its inputs changed, its counters changed, a
+label it references changed or its output is missing.  Everything is
+rendered again when the renderer, the configuration, the preamble or the
+outline (any section title, number, id or filename) changed, since every
+page shows the navigation.  If no input changed at all, nothing is parsed.
+The images of the sections that are not rendered again are kept by the
+image cache, which should be enabled.
+
+"""
+from __future__ import absolute_import
+
+import os
+from contextlib import contextmanager
+
+from six import text_type
+
+from hashlib import md5
+
+from plasTeX import Command
+from plasTeX.DOM import Node
+from plasTeX.Dependencies import BuildRecord
+from plasTeX.Dependencies import fileDigest
+from plasTeX.Logging import getLogger
+from plasTeX.TeX import inputPath
+from plasTeX._util import documentSection
+from plasTeX.Renderers import render_children
+from plasTeX.Base.LaTeX.Sectioning import SectionUtils
+
+log = getLogger(__name__)
+
+# Properties cached on the document section that describe the sections
+# it contains
+_DOCUMENT_CACHES = ('subsections', 'siblings', 'tocSections', 'tocEntries',
+                    'tableofcontents', 'fulltableofcontents', 'allSections',
+                    'documentSections', 'sectionEntries', 'footnotes',
+                    'glossary', 'navigationIndex', 'links')
+
+def _resetCaches(section):
+    """ Forget the cached views of the sections of `section' """
+    attrs = vars(section)
+    for name in _DOCUMENT_CACHES:
+        attrs.pop(name, None)
+
+def _within(node, ancestor):
+    """ Is `node' `ancestor' or one of its descendants? """
+    while node is not None:
+        if node is ancestor:
+            return True
+        node = node.parentNode
+    return False
+
+def _elements(node):
+    """ Iterate over `node' and all of its descendant elements """
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if item.nodeType != Node.ELEMENT_NODE:
+            continue
+        yield item
+        if item.hasChildNodes():
+            stack.extend(reversed(item.childNodes))
+
+def _rendered(value):
+    """ Render `value' if it is a node, see `Macro.persist' """
+    if isinstance(value, Node):
+        return text_type(value)
+    return value
+
+@contextmanager
+def _nophase(name):
+    yield
+
+class SectionStub(SectionUtils, Command):
+    """
+    Outline entry that stands in for a section whose content has been
+    released
+
+    A stub has the name, level, id, number, rendered titles, URL and
+    filename of the section it was created from, and the stubs of its
+    subsections as children, which is all that the navigation and the
+    tables of contents of other sections use.  Stubs render as nothing.
+
+    """
+
+    blockType = True
+    unicode = u''
+
+    # Was the id of the section generated rather than given by a label?
+    generatedId = False
+
+    @classmethod
+    def fromSection(cls, section):
+        """
+        Create the stubs for `section' and all of its subsections
+
+        This must be called at render time, since the titles are
+        rendered and the filenames and URLs are computed.
+
+        Required Arguments:
+        section -- the section to create the stub for
+
+        Returns:
+        `SectionStub' instance
+
+        """
+        stub = cls()
+        stub.ownerDocument = section.ownerDocument
+        stub.level = section.level
+        stub._stub_nodeName = section.nodeName
+        stub.id = section.id
+        stub.generatedId = getattr(section, '@hasgenid', None) is not None
+        stub._stub_filename = section.filename
+        stub.urloverride = section.url
+        for name in ('ref', 'title', 'fullTitle', 'tocEntry', 'fullTocEntry'):
+            try:
+                value = getattr(section, name)
+            except AttributeError:
+                continue
+            setattr(stub, name, _rendered(value))
+        for item in section.subsections:
+            stub.appendChild(cls.fromSection(item))
+        return stub
+
+    def outline(self):
+        """ Return nested tuples with the attributes of the stubs """
+        return (self.nodeName, self.id, self.ref,
+                getattr(self, 'title', None), self.tocEntry, self.filename,
+                self.urloverride,
+                tuple(x.outline() for x in self.subsections))
+
+    @property
+    def tagName(self):
+        return self._stub_nodeName
+    nodeName = tagName
+
+    @property
+    def filename(self):
+        return self._stub_filename
+
+class DocumentStream(object):
+    """
+    Render a document one top-level section at a time
+
+    See the module documentation for how this works.
+
+    """
+
+    def __init__(self, renderer, newDocument, directory=None, record=None):
+        """
+        Required Arguments:
+        renderer -- the renderer instance to use
+        newDocument -- callable that returns a new (document, tex)
+            pair, ready to be parsed.  It is called once for each pass,
+            so it must read the same input every time.
+
+        Keyword Arguments:
+        directory -- the directory that the output is written to.  The
+            document is parsed in the current directory.
+        record -- the filename of the build record.  If given, only
+            the sections that changed since the last build are
+            rendered.
+
+        """
+        self.renderer = renderer
+        self.newDocument = newDocument
+        self.directory = directory
+
+        # Persisted attributes of the labels, by label
+        self.labels = {}
+
+        # Stubs of the top-level sections, in document order
+        self.sections = []
+
+        # Filenames that have been written out
+        self.files = []
+
+        # Incremental builds
+        self.record = record
+        self.previous = None
+        self.current = None
+        self.upToDate = False
+        self.skipped = 0
+
+        self._document = None
+        self._documentInfo = None
+        self._position = 0
+        self._indexed = 0
+        self._idgen = None
+        self._highlighter = None
+
+    @contextmanager
+    def _output(self):
+        """ Run the body in the output directory """
+        cwd = os.getcwd()
+        if self.directory:
+            os.chdir(self.directory)
+        try:
+            yield
+        finally:
+            os.chdir(cwd)
+
+    def render(self, postProcess=None, phase=None):
+        """
+        Parse and render the document
+
+        Keyword Arguments:
+        postProcess -- see `Renderer.cleanup'
+        phase -- callable returning a context manager for each of
+            the phases ('collect' and 'render'), see
+            `plasTeX.Logging.DiagnosticHandler.phase'
+
+        """
+        if phase is None:
+            phase = _nophase
+        renderer = self.renderer
+
+        if renderer.renderMethod:
+            log.warning('The %s renderer can only render whole documents.',
+                        type(renderer).__name__)
+            document, tex = self.newDocument()
+            with phase('parse'):
+                tex.parse()
+            with phase('render'), self._output():
+                renderer.render(document, postProcess=postProcess)
+            return
+
+        with phase('collect'):
+            self.collect()
+        if self.upToDate:
+            log.info('Nothing changed since the last build.')
+            return
+        with phase('render'):
+            self.renderSections(postProcess=postProcess)
+
+    def collect(self):
+        """
+        First pass: collect the outline and the labels of the document
+
+        This sets up the renderer for the second pass, which must
+        follow.
+
+        """
+        renderer = self.renderer
+        document, tex = self.newDocument()
+        if self.record is not None:
+            self._startRecord(document)
+            if self.upToDate:
+                return
+        with self._output():
+            renderer.setUp(document)
+        try:
+            with self._output():
+                loadTemplates = getattr(renderer, 'loadTemplates', None)
+                if loadTemplates is not None:
+                    loadTemplates(document)
+                # The images of the titles are shared with the second pass
+                renderer.createImagers(document)
+
+            document.sectionHandler = self._collectSection
+            try:
+                tex.parse()
+            finally:
+                document.sectionHandler = None
+
+            docenv = documentSection(document)
+            if docenv is not None:
+                with self._output():
+                    self._planDocument(docenv)
+                    self._releaseLabels(docenv)
+            self._idgen = document.userdata.get('idgen')
+            if self.current is not None:
+                self.current.outline = tuple(x.outline() for x in self.sections)
+        except:
+            renderer.tearDown(document)
+            raise
+        del document.renderer
+        # The second pass reuses the listings highlighted in this one
+        self._highlighter = document.highlighter
+
+    def renderSections(self, postProcess=None):
+        """
+        Second pass: render each top-level section as soon as it is
+        complete, then the document
+
+        Keyword Arguments:
+        postProcess -- see `Renderer.cleanup'
+
+        """
+        renderer = self.renderer
+        document, tex = self.newDocument()
+        document.renderer = renderer
+        document.highlighter = self._highlighter
+        self._highlighter = None
+        try:
+            document.context.restoreLabels(self.labels)
+            if self._idgen is not None:
+                # Keep the generated ids unique across both passes
+                document.userdata['idgen'] = self._idgen
+            self._document = None
+            self._position = self._indexed = 0
+            if self.current is not None:
+                self._startTracking(tex)
+
+            document.sectionHandler = self._renderSection
+            try:
+                tex.parse()
+            finally:
+                document.sectionHandler = None
+
+            with self._output():
+                docenv = documentSection(document)
+                if docenv is not None:
+                    self._planDocument(docenv)
+                renderer.planFilenames(document)
+                text_type(document)
+
+                written = set(self.files)
+                files = self.files + [x for x in renderer.files.values()
+                                      if x not in written]
+                renderer.finish(document, files=files, postProcess=postProcess)
+
+                if self.current is not None:
+                    if docenv is not None and docenv.filename:
+                        self.current.outputs = [docenv.filename]
+                    self._saveRecord()
+        finally:
+            renderer.tearDown(document)
+
+    def _planDocument(self, docenv):
+        """
+        Assign the filename and id of the document section before any of
+        its sections
+
+        """
+        if self._document is docenv:
+            return
+        self._document = docenv
+
+        info = self._documentInfo
+        if info is None:
+            # First pass
+            filename = docenv.filename
+            self._documentInfo = (docenv.id,
+                                  getattr(docenv, '@hasgenid', None) is not None,
+                                  filename)
+            return
+
+        # Second pass: use the outline of the first pass
+        id, generated, filename = info
+        if generated:
+            setattr(docenv, '@hasgenid', True)
+        docenv.id = id
+        if filename:
+            self.renderer.files[docenv] = filename
+        for stub in self.sections:
+            stub.parentNode = docenv
+            for item in stub.allSections:
+                item.ownerDocument = docenv.ownerDocument
+
+    def _collectSection(self, docenv, section):
+        """ Section handler of the first pass """
+        if section is None:
+            return
+        with self._output():
+            self._planDocument(docenv)
+            self.renderer.planFilenames(section)
+            stub = SectionStub.fromSection(section)
+            self._releaseLabels(section)
+            self._release(docenv, section, stub)
+        self.sections.append(stub)
+
+    def _renderSection(self, docenv, section):
+        """ Section handler of the second pass """
+        if section is None:
+            if self.current is not None:
+                self.current.preamble = sorted(self._window())
+                self._counters = self._countersNow()
+            return
+
+        renderer = self.renderer
+        i = self._position
+        self._position += 1
+
+        stub = None
+        if i < len(self.sections):
+            stub = self.sections[i]
+        if stub is None or stub.nodeName != section.nodeName:
+            log.warning('The document changed since it was collected; '
+                        'rendering %s with the document.', section.nodeName)
+            self.sections.insert(i, section)
+            return
+
+        with self._output():
+            self._planDocument(docenv)
+            self._adopt(section, stub)
+            renderer.planFilenames(section)
+
+            entry = None
+            if self.current is not None:
+                entry = self._track(section)
+
+            if not section.filename:
+                # Rendered as part of the document
+                self.sections[i] = section
+                return
+
+            if entry is not None and not self._isDirty(i, entry):
+                entry['outputs'] = self.previous.sections[i]['outputs']
+                self.skipped += 1
+            else:
+                # Render the section as if all the other sections were there
+                vars(docenv)['subsections'] = tuple(self.sections[:i] + [section] +
+                                                    self.sections[i+1:])
+                render_children(renderer, [section])
+
+                files = renderer.files
+                outputs = []
+                for node in _elements(section):
+                    filename = files.get(node)
+                    if filename:
+                        outputs.append(filename)
+                self.files.extend(outputs)
+                if entry is not None:
+                    entry['outputs'] = outputs
+
+            self._releaseLabels(section)
+            self._release(docenv, section, stub)
+
+    def _startRecord(self, document):
+        """
+        Load the record of the last build and decide whether anything
+        has to be done at all
+
+        """
+        renderer = self.renderer
+        self._digests = {}
+        self.previous = previous = BuildRecord.load(self.record)
+        self.current = current = BuildRecord()
+        current.settings = md5(('%s.%s\n%r' % (type(renderer).__module__,
+                                               type(renderer).__name__,
+                                               document.config)).encode('utf-8')).hexdigest()
+
+        self._changed = set()
+        if previous is None or previous.settings != current.settings:
+            return
+        self._changed = previous.changedFiles(self._digests)
+        if self._changed:
+            return
+        with self._output():
+            for filename in previous.allOutputs():
+                if not os.path.isfile(filename):
+                    return
+        self.upToDate = True
+
+    def _startTracking(self, tex):
+        """ Compare the first pass with the last build before the second pass """
+        previous = self.previous
+        current = self.current
+        current.labels = dict(self.labels)
+
+        self._tex = tex
+        self._mark = 0
+        self._open = []
+        self._counters = {}
+
+        self._full = previous is None or \
+                     previous.settings != current.settings or \
+                     previous.outline != current.outline
+        self._changedLabels = set()
+        if previous is not None:
+            for key in set(previous.labels) | set(current.labels):
+                if previous.labels.get(key) != current.labels.get(key):
+                    self._changedLabels.add(key)
+
+    def _window(self):
+        """
+        Return the input files read since the last call, including the
+        ones that were still open at that time
+
+        """
+        tex = self._tex
+        inputs = set(self._open)
+        inputs.update(tex.inputFiles[self._mark:])
+        self._mark = len(tex.inputFiles)
+        self._open = [inputPath(t.filename) for t, _ in tex.inputs
+                      if t.filename not in ('<string>', '<tokens>')]
+        return inputs
+
+    def _countersNow(self):
+        counters = self._tex.ownerDocument.context.counters
+        return dict((name, c.value) for name, c in counters.items())
+
+    def _track(self, section):
+        """ Record what `section' was built from """
+        refs = set()
+        for node in _elements(section):
+            idref = getattr(node, '@idref', None)
+            if idref:
+                refs.update(x.id for x in idref.values()
+                            if getattr(x, '@id', None) is not None)
+        entry = {'name': section.nodeName,
+                 'inputs': sorted(self._window()),
+                 'counters': self._counters,
+                 'refs': sorted(refs),
+                 'outputs': []}
+        self._counters = self._countersNow()
+        self.current.sections.append(entry)
+        return entry
+
+    def _isDirty(self, i, entry):
+        """ Does the section described by `entry' have to be rendered? """
+        if self._full:
+            return True
+        previous = self.previous
+        if i >= len(previous.sections):
+            return True
+        old = previous.sections[i]
+        if old['name'] != entry['name'] or old['counters'] != entry['counters'] or \
+           old['inputs'] != entry['inputs']:
+            return True
+        if self._changed.intersection(entry['inputs']):
+            return True
+        if self._changedLabels.intersection(entry['refs']):
+            return True
+        for filename in old['outputs']:
+            if not os.path.isfile(filename):
+                return True
+        return False
+
+    def _saveRecord(self):
+        current = self.current
+        digests = self._digests
+        paths = set(current.preamble)
+        for entry in current.sections:
+            paths.update(entry['inputs'])
+        for path in paths:
+            if path not in digests:
+                digests[path] = fileDigest(path)
+            current.files[path] = digests[path]
+        current.save(self.record)
+        if self.skipped:
+            log.info('%d of %d section(s) did not change since the last build.',
+                     self.skipped, len(current.sections))
+
+    def _adopt(self, section, stub):
+        """ Give `section' the ids and filenames that were collected """
+        sections = section.allSections
+        stubs = stub.allSections
+        if len(sections) != len(stubs):
+            log.warning('The sections of %s changed since they were collected.',
+                        section.nodeName)
+        files = self.renderer.files
+        for item, recorded in zip(sections, stubs):
+            if recorded.generatedId:
+                setattr(item, '@hasgenid', True)
+            item.id = recorded.id
+            if recorded.filename:
+                files[item] = recorded.filename
+
+    def _releaseLabels(self, section):
+        """
+        Replace the labeled nodes of `section' by light-weight nodes that
+        only carry their persisted attributes
+
+        """
+        context = section.ownerDocument.context
+        persistentLabels = context.persistentLabels
+        released = {}
+        for node in _elements(section):
+            key = getattr(node, '@id', None)
+            if key is not None and persistentLabels.get(key) is node:
+                attrs = released[key] = node.persist()
+                # `persist' leaves out the attributes that render
+                # empty, which would read as None on the restored label
+                names = node.refAttributes
+                names += getattr(node, '_extraRefAttributes', lambda: ())()
+                for name in names:
+                    if name not in attrs and isinstance(getattr(node, name, None), Node):
+                        attrs[name] = u''
+        context.restoreLabels(released)
+        for key in released:
+            persistentLabels[key] = context.labels[key]
+        self.labels.update(released)
+
+    def _release(self, docenv, section, stub):
+        """ Replace `section' by `stub' and drop all references to it """
+        document = docenv.ownerDocument
+        userdata = document.userdata
+
+        # Index entries keep their node for the page references
+        index = userdata.get('index', ())
+        for entry in index[self._indexed:]:
+            node = entry.node
+            if _within(node, section):
+                node.urloverride = node.url
+                node.parentNode = None
+        self._indexed = len(index)
+
+        for name in ('footnotes', 'glossary'):
+            entries = userdata.get(name)
+            if entries:
+                entries[:] = [x for x in entries if not _within(x, section)]
+
+        # Unresolved references
+        for objs in document.context.refs.values():
+            for obj in objs:
+                if _within(obj, section):
+                    obj.parentNode = None
+
+        files = self.renderer.files
+        for node in _elements(section):
+            files.pop(node, None)
+
+        stub.ownerDocument = document
+        docenv.replaceChild(stub, section)
+        _resetCaches(docenv)
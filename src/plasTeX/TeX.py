@@ -23,6 +23,7 @@ import os
 import plasTeX
 import codecs
 import subprocess
+import sys
 
 from .Tokenizer import Tokenizer, Token, EscapeSequence, Other
 from plasTeX import TeXDocument
@@ -33,6 +34,9 @@ from plasTeX.Logging import getLogger, disableLogging
 
 from six import string_types
 from six import text_type
+from six import ensure_text
+
+from zope.cachedescriptors.property import Lazy as cachedproperty
 
 # Only export the TeX class
 __all__ = ['TeX']
@@ -42,6 +46,22 @@ status = getLogger('status')
 tokenlog = getLogger('parse.tokens')
 digestlog = getLogger('parse.digest')
 _type = type
+ELEMENT_NODE = Macro.ELEMENT_NODE
+
+# Category codes of the tokens that TeX.normalize() joins into text
+_groupCatcodes = frozenset([Token.CC_EGROUP, Token.CC_BGROUP])
+_textCatcodes = frozenset([Token.CC_LETTER, Token.CC_OTHER,
+                           Token.CC_EGROUP, Token.CC_BGROUP,
+                           Token.CC_SPACE])
+
+# Casts of list and dictionary items that only depend on their text
+_pureSubtypes = frozenset([None, 'str', str, 'chr', chr, 'char',
+                           'number', 'count', 'int', int])
+
+# Results of castList() and castDictionary() by the text of the tokens,
+# shared by all instances; cleared when it has _castCacheSize entries
+_castCache = {}
+_castCacheSize = 1000
 
 class bufferediter(object):
     """ Buffered iterator """
@@ -58,6 +78,82 @@ class bufferediter(object):
     def push(self, value):
         self._buffer.append(value)
 
+def inputPath(name):
+    """
+    Return the absolute path of the input file `name' as text
+
+    kpsewhich gives us bytes on Python 3.
+
+    """
+    return os.path.abspath(ensure_text(name, sys.getfilesystemencoding()))
+
+class DeferredSource(tuple):
+    """
+    TeX source of an expanded argument that is joined when it is used
+
+    The source of the macros in an argument is only needed when a node
+    is imaged or its `source' is asked for, so it isn't built while
+    the argument is read.  The parts are strings and the macro nodes
+    in between, which the argument keeps anyway; text_type() joins
+    them.
+
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return u''.join([x if isinstance(x, string_types) else x.source
+                         for x in self])
+
+    if str is bytes:
+        __unicode__ = __str__
+        def __str__(self):
+            return self.__unicode__().encode('utf-8')
+
+def _sourceHasChildren(node):
+    """ Does the source of a macro include the source of its child nodes? """
+    if not node.hasChildNodes():
+        return False
+    if getattr(node, 'macroMode', None) == Macro.MODE_BEGIN:
+        return True
+    return 'self' not in (getattr(node, 'attributes', None) or {})
+
+def deferredSource(tokens, before=None, after=None):
+    """
+    Return the TeX source of expanded tokens, leaving out their macros
+
+    Required Arguments:
+    tokens -- the expanded tokens
+
+    Keyword Arguments:
+    before -- token that came before the tokens, e.g. '{'
+    after -- token that came after the tokens, e.g. '}'
+
+    Returns:
+    `DeferredSource' if there are macros among the tokens, string
+    otherwise
+
+    """
+    parts = []
+    text = [before.source] if before is not None else []
+    for t in tokens:
+        # The source of grouping macros like \bf and of environments
+        # includes their child nodes, which are normalized later, so
+        # it has to be joined now
+        if t.nodeType == ELEMENT_NODE and not _sourceHasChildren(t):
+            if text:
+                parts.append(u''.join(text))
+                text = []
+            parts.append(t)
+        else:
+            text.append(t.source)
+    if after is not None:
+        text.append(after.source)
+    if not parts:
+        return u''.join(text)
+    if text:
+        parts.append(u''.join(text))
+    return DeferredSource(parts)
+
 class ArgumentContext(plasTeX.Macro):
     pass
 
@@ -80,44 +176,12 @@ class TeX(object):
         # (Tokenizer, iter(Tokenizer))
         self.inputs = []
 
+        # Absolute paths of the files read, in the order they were opened
+        self.inputFiles = []
+
         # Auxiliary files loaded
         self.auxFiles = []
 
-        # TeX arguments types and their casting functions
-        self.argtypes = {
-            'url': (self.castNone, {'#':12,'~':12}),
-            'str': self.castString,
-            str: self.castString,
-            'chr': self.castString,
-            chr: self.castString,
-            'char': self.castString,
-            'cs': self.castControlSequence,
-            'label': self.castLabel,
-            'id': self.castLabel,
-            'idref': self.castRef,
-            'ref': self.castRef,
-            'nox': lambda x,**y: x,
-            'list': self.castList,
-            list: self.castList,
-            'dict': self.castDictionary,
-            dict: self.castDictionary,
-
-            # LaTeX versions of TeX internal parameters
-            'dimen': self.castDimen,
-            'dimension': self.castDimen,
-            'length': self.castDimen,
-#           'mudimen': self.castMuDimen,
-#           'glue':  self.castGlue,
-#           'muglue': self.castMuGlue,
-            'number': self.castNumber,
-            'count': self.castNumber,
-            'int': self.castNumber,
-            int: self.castNumber,
-            'float': self.castDecimal,
-            float: self.castDecimal,
-            'double': self.castDecimal,
-        }
-
         # Starting parsing if a source was given
         self.currentInput = (0,0)
 
@@ -155,6 +219,8 @@ class TeX(object):
             elif hasattr(source, 'name'):
                 self.jobname = os.path.basename(os.path.splitext(source.name)[0])
         t = Tokenizer(source, self.ownerDocument.context)
+        if hasattr(source, 'name'):
+            self.inputFiles.append(inputPath(source.name))
         self.inputs.append((t, iter(t)))
         self.currentInput = self.inputs[-1]
         return self
@@ -224,6 +290,49 @@ class TeX(object):
 
         return True
 
+    @cachedproperty
+    def argtypes(self):
+        """
+        TeX arguments types and their casting functions
+
+        This is only built when it is used, since sub-processes
+        (see createSubProcess()) rarely need it.
+
+        """
+        return {
+            'url': (self.castNone, {'#':12,'~':12}),
+            'str': self.castString,
+            str: self.castString,
+            'chr': self.castString,
+            chr: self.castString,
+            'char': self.castString,
+            'cs': self.castControlSequence,
+            'label': self.castLabel,
+            'id': self.castLabel,
+            'idref': self.castRef,
+            'ref': self.castRef,
+            'nox': lambda x,**y: x,
+            'list': self.castList,
+            list: self.castList,
+            'dict': self.castDictionary,
+            dict: self.castDictionary,
+
+            # LaTeX versions of TeX internal parameters
+            'dimen': self.castDimen,
+            'dimension': self.castDimen,
+            'length': self.castDimen,
+#           'mudimen': self.castMuDimen,
+#           'glue':  self.castGlue,
+#           'muglue': self.castMuGlue,
+            'number': self.castNumber,
+            'count': self.castNumber,
+            'int': self.castNumber,
+            int: self.castNumber,
+            'float': self.castDecimal,
+            float: self.castDecimal,
+            'double': self.castDecimal,
+        }
+
     @property
     def filename(self):
         return self.currentInput[0].filename
@@ -479,6 +588,26 @@ class TeX(object):
             else:
                 self.inputs[-1][0].pushTokens(tokens)
 
+    def readRaw(self, ends):
+        """
+        Read the raw text of the current input up to one of `ends'
+
+        See Tokenizer.readRaw().  The text is not read past the end
+        of the current input, so callers should continue to read tokens
+        if no end string was found.
+
+        Required Arguments:
+        ends -- sequence of strings that end the text
+
+        Returns:
+        tuple containing the text and the end string that was found,
+        or None
+
+        """
+        if not self.inputs:
+            return u'', None
+        return self.inputs[-1][0].readRaw(ends)
+
     def source(self, tokens):
         """
         Return the TeX source representation of the tokens
@@ -508,10 +637,8 @@ class TeX(object):
         if tokens is None:
             return tokens
 
-        grouptokens = [Token.CC_EGROUP, Token.CC_BGROUP]
-        textTokens = [Token.CC_LETTER, Token.CC_OTHER,
-                      Token.CC_EGROUP, Token.CC_BGROUP,
-                      Token.CC_SPACE]
+        grouptokens = _groupCatcodes
+        textTokens = _textCatcodes
 
         try: iter(tokens)
         except TypeError: return tokens
@@ -791,10 +918,171 @@ class TeX(object):
 
         return res, source
 
-    def readToken(self, expanded=False, parentNode=None):
+    # Argument types that have their own reading method
+    _internalTypes = frozenset(['Dimen', 'Length', 'Dimension', 'MuDimen', 'MuLength',
+                                'Glue', 'Skip', 'MuGlue', 'MuSkip', 'Number', 'Int',
+                                'Integer', 'Token', 'Tok', 'XTok', 'XToken', 'Args',
+                                'any'])
+
+    def argumentPlan(self, macro):
+        """
+        Return the compiled readers of the arguments of a macro
+
+        The arguments of each macro class are compiled once (see
+        compileArgument()) and reused for every instance, by this and
+        every other TeX instance, including sub-processes.  Nothing
+        in a plan depends on the instance that compiled it.  Subclasses
+        that override readArgument() or readArgumentAndSource() get
+        readers that call them instead.
+
+        Required Arguments:
+        macro -- the macro instance whose arguments are read
+
+        Returns:
+        tuple of (Argument, reader) pairs.  Each reader takes the TeX
+        instance to read from and the node that the argument belongs
+        to, and returns the same (value, source) pair as
+        readArgumentAndSource(), except that the source may be a
+        `DeferredSource'.
+
+        """
+        tex = type(self)
+        if tex.readArgumentAndSource != TeX.readArgumentAndSource or \
+           tex.readArgument != TeX.readArgument:
+            return tuple((arg, _argumentReader(arg)) for arg in macro.arguments)
+
+        cls = type(macro)
+        try:
+            return cls.__dict__['@argumentPlan']
+        except KeyError:
+            pass
+        plan = tuple((arg, self.compileArgument(name=arg.name, **arg.options))
+                     for arg in macro.arguments)
+        setattr(cls, '@argumentPlan', plan)
+        return plan
+
+    def compileArgument(self, spec=None, type=None, subtype=None,
+                        delim=',', expanded=False, default=None, name=None,
+                        stripLeadingWhitespace=True):
+        """
+        Compile an argument specification into a reader
+
+        The reading method is looked up once instead of on every
+        call.  The casting function and the category codes are looked
+        up in the `argtypes' of the TeX instance that reads, since
+        each instance may have its own.
+
+        Optional Arguments:
+        see readArgumentAndSource()
+
+        Returns:
+        callable that takes the TeX instance to read from and the
+        node that the argument belongs to, and returns the same
+        (value, source) pair as readArgumentAndSource(), except that
+        the source may be a `DeferredSource'
+
+        """
+        if type in self._internalTypes:
+            def reader(tex, parentNode):
+                return tex.readArgumentAndSource(spec=spec, type=type,
+                                                 subtype=subtype, delim=delim,
+                                                 expanded=expanded, default=default,
+                                                 parentNode=parentNode, name=name,
+                                                 stripLeadingWhitespace=stripLeadingWhitespace)
+            return reader
+
+        if type == 'cs':
+            expanded = False
+
+        plain = type is None or type == 'nox'
+
+        if spec is None:
+            def read(tex, parentNode):
+                return tex.readToken(expanded, parentNode=parentNode, lazy=True)
+        elif len(spec) == 1:
+            def read(tex, parentNode):
+                return tex.readCharacter(spec)
+        elif len(spec) == 2:
+            def read(tex, parentNode):
+                return tex.readGrouping(spec, expanded, parentNode=parentNode,
+                                        lazy=True)
+        else:
+            raise ValueError('Unrecognized specifier "%s"' % spec)
+
+        disable, enable = ParameterCommand.disable, ParameterCommand.enable
+        DOCUMENT_FRAGMENT_NODE = Macro.DOCUMENT_FRAGMENT_NODE
+
+        def reader(tex, parentNode):
+            if stripLeadingWhitespace:
+                tex.readOptionalSpaces()
+
+            # Category codes and casting function for this argument type
+            catcodes = ()
+            caster = None
+            if type is not None:
+                caster = tex.argtypes.get(type)
+                if isinstance(caster, (list,tuple)):
+                    catcodes = caster[1].items()
+                    caster = caster[0]
+                if caster is None:
+                    log.warning('Could not find datatype "%s" from %s (in %r)',
+                                type, tex.argtypes, tex)
+
+            # Parameters can only be invoked while reading arguments that
+            # are expanded or cast by parsing them, so they don't have to
+            # be disabled for the others
+            toggle = expanded or not (plain or
+                                      getattr(caster, '__func__', None) in _plainCasts)
+            if toggle:
+                disable()
+
+            try:
+                if catcodes:
+                    context = tex.ownerDocument.context
+                    priorcodes = [(key, context.whichCode(key)) for key, _ in catcodes]
+                    for key, value in catcodes:
+                        context.catcode(key, value)
+                toks, source = read(tex, parentNode)
+            except Exception as msg:
+                log.error('Error while reading argument "%s" of %s%s (%s)' % \
+                              (name, parentNode.nodeName, tex.lineInfo, msg))
+                raise
+
+            if catcodes:
+                for key, value in priorcodes:
+                    context.catcode(key, value)
+
+            if toks is None:
+                if toggle:
+                    enable()
+                return default, ''
+
+            if caster is not None:
+                toks = caster(toks, subtype=subtype, delim=delim,
+                              parentNode=parentNode, name=name)
+
+            # Set parent node and normalize document fragments
+            if getattr(toks, 'nodeType', None) == DOCUMENT_FRAGMENT_NODE:
+                toks.parentNode = parentNode
+                if expanded:
+                    toks.normalize(getattr(tex.ownerDocument, 'charsubs', []))
+
+            if toggle:
+                enable()
+            return toks, source
+
+        return reader
+
+    def readToken(self, expanded=False, parentNode=None, lazy=False):
         """
         Read a token or token group
 
+        Keyword Arguments:
+        expanded -- boolean indicating whether the tokens are expanded
+        parentNode -- the node that the expanded tokens belong to
+        lazy -- if True, the source of the macros in expanded tokens
+            is only joined when it is used (see `DeferredSource')
+
         Returns:
         two element tuple containing the parsed tokens and the
         TeX code that they came from
@@ -835,7 +1123,12 @@ class TeX(object):
             # Expand macros and get the argument source string
             if expanded:
                 toks = self.expandTokens(toks, parentNode=parentNode)
-                if isgroup:
+                if lazy:
+                    if isgroup:
+                        source = deferredSource(toks, source[0], source[-1])
+                    else:
+                        source = deferredSource(toks)
+                elif isgroup:
                     s = self.source(toks)
                     source = u'%s%s%s' % (source[0].source, s,
                                           source[-1].source)
@@ -868,12 +1161,16 @@ class TeX(object):
                 break
         return None, ''
 
-    def readGrouping(self, chars, expanded=False, parentNode=None):
+    def readGrouping(self, chars, expanded=False, parentNode=None, lazy=False):
         """
         Read a group delimited by the given characters
 
         Keyword Arguments:
         chars -- the two characters that begin and end the group
+        expanded -- boolean indicating whether the tokens are expanded
+        parentNode -- the node that the expanded tokens belong to
+        lazy -- if True, the source of the macros in expanded tokens
+            is only joined when it is used (see `DeferredSource')
 
         Returns:
         two element tuple containing the parsed tokens and the
@@ -910,7 +1207,10 @@ class TeX(object):
                 break
             if expanded:
                 toks = self.expandTokens(toks, parentNode=parentNode)
-                source = begin + self.source(toks) + end
+                if lazy:
+                    source = deferredSource(toks, begin, end)
+                else:
+                    source = begin + self.source(toks) + end
             else:
                 source = self.source(source)
             return toks, source
@@ -966,27 +1266,23 @@ class TeX(object):
         object of the specified type
 
         """
-        argtypes = {}
-        for key, t in self.argtypes.items():
-            if isinstance(t, tuple):
-                argtypes[key] = t[0]
-            else:
-                argtypes[key] = t
-
         # No type specified
         if dtype is None:
             pass
 
         # Could not find specified type
-        elif dtype not in argtypes:
+        elif dtype not in self.argtypes:
             log.warning('Could not find datatype "%s" from %s (in %r)',
-                        dtype, argtypes, self)
+                        dtype, self.argtypes, self)
             pass
 
         # Casting to specified type
         else:
-            tokens = argtypes[dtype](tokens, subtype=subtype,
-                     delim=delim, parentNode=parentNode, name=name)
+            caster = self.argtypes[dtype]
+            if isinstance(caster, tuple):
+                caster = caster[0]
+            tokens = caster(tokens, subtype=subtype,
+                            delim=delim, parentNode=parentNode, name=name)
 
         # Set parent node as needed
         if getattr(tokens,'nodeType',None) == Macro.DOCUMENT_FRAGMENT_NODE:
@@ -1232,37 +1528,7 @@ class TeX(object):
         self.cast()
 
         """
-        delim = kwargs.get('delim')
-        if delim is None:
-            delim = ','
-        subtype = kwargs.get('subtype')
-        listarg = [[]]
-        while tokens:
-            current = tokens.pop(0)
-
-            # Item delimiter
-            if current == delim:
-                listarg.append([])
-
-            # Found grouping
-            elif current.catcode == Token.CC_BGROUP:
-                level = 1
-                listarg[-1].append(current)
-                while tokens:
-                    current = tokens.pop(0)
-                    if current.catcode == Token.CC_BGROUP:
-                        level += 1
-                    elif current.catcode == Token.CC_EGROUP:
-                        level -= 1
-                        if not level:
-                            break
-                    listarg[-1].append(current)
-                listarg[-1].append(current)
-
-            else:
-                listarg[-1].append(current)
-
-        return type([self.normalize(self.cast(x, subtype)) for x in listarg])
+        return self._castCached(self._parseList, tokens, type, kwargs)
 
     def castDictionary(self, tokens, type=dict, **kwargs):
         """
@@ -1283,16 +1549,94 @@ class TeX(object):
         self.readArgument()
         self.cast()
 
+        """
+        return self._castCached(self._parseDictionary, tokens, type, kwargs)
+
+    def _castCached(self, parse, tokens, type, kwargs):
+        """
+        Call `parse', reusing the result for tokens that were cast before
+
+        Options like those of \\includegraphics or \\lstset are often
+        repeated verbatim.  Results are only reused when the tokens are
+        plain characters and the items are cast to strings or numbers,
+        which does not depend on or change the context.
+
         """
         delim = kwargs.get('delim')
         if delim is None:
             delim = ','
         subtype = kwargs.get('subtype')
+
+        key = None
+        if subtype in _pureSubtypes:
+            try:
+                catcodes = tuple([t.catcode for t in tokens])
+            except AttributeError:
+                # Macros, which may expand differently each time
+                catcodes = None
+            if catcodes is not None and _textCatcodes.issuperset(catcodes):
+                key = (parse.__name__, type, delim, subtype, u''.join(tokens), catcodes)
+                cached = _castCache.get(key)
+                if cached is not None:
+                    return type(cached)
+
+        result = parse(tokens, type, delim, subtype)
+
+        if key is not None:
+            if len(_castCache) >= _castCacheSize:
+                _castCache.clear()
+            if isinstance(result, dict):
+                _castCache[key] = tuple(result.items())
+            else:
+                _castCache[key] = tuple(result)
+        return result
+
+    def _parseList(self, tokens, type, delim, subtype):
+        """ Split `tokens' into a list in one pass, see castList() """
+        item = []
+        listarg = [item]
+        tokens = iter(tokens)
+        for current in tokens:
+
+            # Macros are part of the current item
+            if current.nodeType == Macro.ELEMENT_NODE:
+                item.append(current)
+
+            # Item delimiter
+            elif current == delim:
+                item = []
+                listarg.append(item)
+
+            # Found grouping
+            elif current.catcode == Token.CC_BGROUP:
+                level = 1
+                item.append(current)
+                for current in tokens:
+                    if getattr(current, 'catcode', None) == Token.CC_BGROUP:
+                        level += 1
+                    elif getattr(current, 'catcode', None) == Token.CC_EGROUP:
+                        level -= 1
+                        if not level:
+                            break
+                    item.append(current)
+                item.append(current)
+
+            else:
+                item.append(current)
+
+        return type([self.normalize(self.cast(x, subtype)) for x in listarg])
+
+    def _parseDictionary(self, tokens, type, delim, subtype):
+        """ Split `tokens' into a dictionary in one pass, see castDictionary() """
         dictarg = type()
         currentkey = []
         currentvalue = None
-        while tokens:
-            current = tokens.pop(0)
+        tokens = list(tokens)
+        last = len(tokens) - 1
+        i = 0
+        while i <= last:
+            current = tokens[i]
+            i += 1
 
             if current.nodeType == Macro.ELEMENT_NODE:
                 currentvalue.append(current)
@@ -1302,11 +1646,12 @@ class TeX(object):
             elif current.catcode == Token.CC_BGROUP:
                 level = 1
                 currentvalue.append(current)
-                while tokens:
-                    current = tokens.pop(0)
-                    if current.catcode == Token.CC_BGROUP:
+                while i <= last:
+                    current = tokens[i]
+                    i += 1
+                    if getattr(current, 'catcode', None) == Token.CC_BGROUP:
                         level += 1
-                    elif current.catcode == Token.CC_EGROUP:
+                    elif getattr(current, 'catcode', None) == Token.CC_EGROUP:
                         level -= 1
                         if not level:
                             break
@@ -1332,7 +1677,7 @@ class TeX(object):
                 currentvalue.append(current)
 
             # Found end-of-value delimiter
-            if current == delim or not tokens:
+            if current == delim or i > last:
                 currentkey = self.normalize(currentkey)
                 currentvalue = self.normalize(self.cast(currentvalue, subtype))
                 if currentvalue is None:
@@ -1735,6 +2080,18 @@ class TeX(object):
             log.warning(msg)
         self.ownerDocument.context.warnOnUnrecognized = warn
 
+# Casting functions that neither expand nor parse their tokens
+_plainCasts = frozenset([getattr(x, '__func__', x) for x in
+                         (TeX.castNone, TeX.castString, TeX.castLabel,
+                          TeX.castRef, TeX.castControlSequence)])
+
+def _argumentReader(arg):
+    """ Return an uncompiled reader of `arg' (see `TeX.argumentPlan') """
+    def reader(tex, parentNode):
+        return tex.readArgumentAndSource(parentNode=parentNode, name=arg.name,
+                                         **arg.options)
+    return reader
+
 #   @property
 #   def jobname(self):
 #       """ Return the basename of the main input file """
@@ -229,6 +229,10 @@ class Tokenizer(object):
     tokenClasses[Token.CC_ACTIVE] = Active
     tokenClasses[Token.CC_COMMENT] = Comment
 
+    # Catcodes of pushed back tokens that readRaw() reads as their text
+    _rawCatcodes = frozenset([Token.CC_LETTER, Token.CC_OTHER,
+                              Token.CC_SPACE, Token.CC_EOL])
+
     def __init__(self, source, context):
         """
         Instantiate a tokenizer
@@ -268,6 +272,7 @@ class Tokenizer(object):
         self.seek = source.seek
         self.read = source.read
 #       self.readline = source.readline
+        self._readSourceLine = getattr(source, 'readline', None)
         self.tell = source.tell
         self.lineNumber = 1
 
@@ -354,6 +359,94 @@ class Tokenizer(object):
 
             yield classes[code](token)
 
+    def readRaw(self, ends):
+        """
+        Read the raw text up to the first of the given end strings
+
+        This is a much faster way to read text whose characters all
+        have category CC_LETTER or CC_OTHER (e.g. the body of a verbatim
+        environment) than tokenizing it, since the end string is
+        searched for in whole lines of the source instead of comparing
+        one token per character.  The end string is consumed as well.
+        Tokens that were pushed back are included as their text.
+
+        If the current category codes give any character a meaning
+        other than a letter or other character, or tokens that were
+        pushed back can not be turned back into their text (e.g.
+        expanded macros or paragraph breaks), nothing is read.
+
+        Required Arguments:
+        ends -- sequence of strings that end the text
+
+        Returns:
+        tuple containing the text before the end string and the end
+        string that was found.  The end string is None if the source
+        ended before any of them, or if the text could not be read raw.
+
+        """
+        categories = self.context.categories
+        for code, chars in enumerate(categories):
+            if chars and code != Token.CC_LETTER and code != Token.CC_OTHER:
+                return u'', None
+        readline = self._readSourceLine
+        tokens = self._tokBuffer
+        if readline is None:
+            return u'', None
+        pushed = []
+        for token in tokens:
+            if token.nodeType == Node.ELEMENT_NODE:
+                return u'', None
+            code = token.catcode
+            if code in Tokenizer._rawCatcodes:
+                pushed.append(token)
+            elif code == Token.CC_ESCAPE and token != 'par' and '::' not in token:
+                # Whatever followed the name is still in the character
+                # buffer, so unlike `source' no space is added
+                pushed.append(u'\\' + token)
+            else:
+                return u'', None
+
+        pushed = u''.join(pushed)
+        chunks = [pushed, u''.join(self._charBuffer)]
+        del tokens[:]
+        del self._charBuffer[:]
+        longest = max(len(x) for x in ends)
+        searched = pushed + chunks[1]
+        offset = 0 # position of `searched' in the text
+        end = None
+        while True:
+            found = [(searched.find(x), x) for x in ends]
+            found = [x for x in found if x[0] >= 0]
+            if found:
+                index, end = min(found, key=lambda x: (x[0], -len(x[1])))
+                index += offset
+                break
+            line = readline()
+            if not line:
+                break
+            chunks.append(line)
+            # Keep enough of what was searched to find an end string
+            # that spans two lines
+            tail = searched[-(longest - 1):] if longest > 1 else u''
+            offset += len(searched) - len(tail)
+            searched = tail + line
+
+        text = u''.join(chunks)
+        if end is None:
+            index = len(text)
+            consumed = text
+        else:
+            consumed = text[:index + len(end)]
+            # Put back what was read past the end string
+            rest = text[index + len(end):]
+            if rest:
+                self._charBuffer[:0] = list(rest)
+        # Pushed back tokens had their lines counted when first read
+        self.lineNumber += consumed.count(u'\n', len(pushed))
+        if consumed:
+            self.state = Tokenizer.STATE_M
+        return text[:index], end
+
     def pushChar(self, char):
         """
         Push a character back into the stream to be re-read
@@ -6,6 +6,7 @@ __version__ = '9.3'
 import string
 import re
 from .DOM import Element, Node, DocumentFragment, Document
+from .DOM import _invalidateNormalized
 from .Tokenizer import Token, BeginGroup, EndGroup
 from . import Logging
 
@@ -113,8 +114,9 @@ class Macro(Element):
     #: to produce the final set of attributes.
     refAttributes = ('macroName','ref','title','captionName','id','url')
 
-    # Source of the TeX macro arguments
-    argSource = ''
+    # Source of the TeX macro arguments: a string, or a list of the
+    # sources of each argument until `argSource' joins them
+    _argSource = ''
 
     # LaTeX argument template
     args = ''
@@ -436,6 +438,19 @@ class Macro(Element):
                 s += sourceChildren(self)
         return s
 
+    @property
+    def argSource(self):
+        source = self._argSource
+        if isinstance(source, string_types):
+            return source
+        # Join in place, parse() may still be appending to the list
+        source[:] = [''.join([text_type(x) for x in source])]
+        return source[0]
+
+    @argSource.setter
+    def argSource(self, value):
+        self._argSource = value
+
     @property
     def childrenSource(self):
         return sourceChildren(self)
@@ -461,15 +476,15 @@ class Macro(Element):
             self.postParse(tex)
             return
 
-        self.argSource = ''
+        # Argument sources that contain macros are only joined when
+        # argSource is used (see plasTeX.TeX.DeferredSource)
+        self._argSource = sources = []
         arg = None
         try:
-            for arg in self.arguments:
+            for arg, read in tex.argumentPlan(self):
                 self.preArgument(arg, tex)
-                output, source = tex.readArgumentAndSource(parentNode=self,
-                                                           name=arg.name,
-                                                           **arg.options)
-                self.argSource += source
+                output, source = read(tex, self)
+                sources.append(source)
                 self.attributes[arg.name] = output
                 self.postArgument(arg, output, tex)
         except:
@@ -477,6 +492,14 @@ class Macro(Element):
             log.error('Error while parsing argument "%s" of "%s"' %
                        (arg.name, self.nodeName))
 
+        # Keep the list only if the source of some macros was deferred
+        for source in sources:
+            if not isinstance(source, string_types):
+                break
+        else:
+            if self._argSource is sources:
+                self._argSource = ''.join(sources)
+
         self.postParse(tex)
 
         return self.attributes
@@ -565,7 +588,7 @@ class Macro(Element):
         """
         if self.counter:
             try:
-                secnumdepth = self.config['document']['sec-num-depth']
+                secnumdepth = self.config.snapshot['document']['sec-num-depth']
             except KeyError:
                 secnumdepth = 10
 
@@ -687,18 +710,33 @@ class Macro(Element):
         token -- the token of the requested type if it was found
 
         """
+        # Tables and lists can contain a very large number of children,
+        # so plain nodes are added to the child list directly rather
+        # than going through appendChild.
+        ELEMENT_NODE = Node.ELEMENT_NODE
+        DOCUMENT_FRAGMENT_NODE = Node.DOCUMENT_FRAGMENT_NODE
+        contextDepth = self.contextDepth
+        ownerDocument = self.ownerDocument
+        _invalidateNormalized(self)
+        append = self.childNodes.append
         for tok in tokens:
-            if tok.nodeType == Node.ELEMENT_NODE:
+            nodeType = tok.nodeType
+            if nodeType == ELEMENT_NODE:
                 if isinstance(tok, endclass):
                     tokens.push(tok)
                     return tok
                 tok.parentNode = self
                 tok.digest(tokens)
             # Stay within our context
-            if tok.contextDepth < self.contextDepth:
+            if tok.contextDepth < contextDepth:
                 tokens.push(tok)
                 break
-            self.appendChild(tok)
+            if nodeType == DOCUMENT_FRAGMENT_NODE:
+                self.appendChild(tok)
+                continue
+            append(tok)
+            tok.parentNode = self
+            tok.ownerDocument = ownerDocument
 
     @property
     def currentSection(self):
@@ -805,6 +843,15 @@ class TeXDocument(Document):
     """ TeX Document node """
     documentFragmentClass = TeXFragment
 
+    # Callable invoked with the document environment and each top-level
+    # section as soon as the section has been digested, and with the
+    # document environment and None when it begins (see
+    # plasTeX.Streaming).  None means the whole document is kept.
+    sectionHandler = None
+
+    # plasTeX.Highlighting.Highlighter of the listings in the document
+    highlighter = None
+
     # Character sequences that should be replaced by unicode
     charsubs = [
         ('``', unichr(8220)),
@@ -1327,26 +1374,31 @@ class ParameterCommand(Command):
     args = '= value:Number'
     value = count(0)
 
+    # Parameters only invoke if they are enabled and not in an
+    # argument that is being read (see disable()).  Assigning to
+    # class attributes is slow, since the attribute caches of all the
+    # subclasses are invalidated, so the two are kept separately and
+    # enable() and disable() only change one.
     enabled = True
     _enablelevel = 0
 
     def invoke(self, tex):
-        if ParameterCommand.enabled:
+        if ParameterCommand.enabled and ParameterCommand._enablelevel >= 0:
             # Disable invoke() in parameters nested in our arguments.
             # We don't want them to invoke, we want them to set our value.
             ParameterCommand.enabled = False
-            type(self).value = self.parse(tex)['value']
-            ParameterCommand.enabled = True
+            try:
+                type(self).value = self.parse(tex)['value']
+            finally:
+                ParameterCommand.enabled = True
 
     @classmethod
     def enable(cls):
         ParameterCommand._enablelevel += 1
-        ParameterCommand.enabled = ParameterCommand._enablelevel >= 0
 
     @classmethod
     def disable(cls):
         ParameterCommand._enablelevel -= 1
-        ParameterCommand.enabled = ParameterCommand._enablelevel >= 0
 
     def __dimen__(self):
         return dimen(type(self).value)
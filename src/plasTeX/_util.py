@@ -79,6 +79,24 @@ def issection(o):
     return o.level >= Node.DOCUMENT_LEVEL and o.level < Node.ENDSECTIONS_LEVEL
 
 
+def documentSection(o):
+    """ 
+    Return the document-level section (i.e. the document environment)
+    containing the given node, the node itself if it is one, or None.
+    For the document node, its document-level child is returned.
+    """
+    if o.nodeType == Node.DOCUMENT_NODE:
+        for item in o:
+            if item.level == Node.DOCUMENT_LEVEL:
+                return item
+        return None
+    while o.level != Node.DOCUMENT_LEVEL:
+        o = o.parentNode
+        if o is None:
+            return None
+    return o
+
+
 def macroName(o):
     """ 
     Return the macro name of the given object 
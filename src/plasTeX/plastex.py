@@ -23,8 +23,11 @@ import plasTeX
 from plasTeX.TeX import TeX
 import plasTeX.Renderers
 from plasTeX.Config import newConfig
+from plasTeX.DOM import normalizeStatistics
+from plasTeX.Streaming import DocumentStream
+from plasTeX.LabelStore import LabelStore
 
-from plasTeX.Logging import getLogger
+from plasTeX.Logging import getLogger, enableDiagnostics, disableDiagnostics, WARNING
 from zope.configuration import xmlconfig
 from zope.dottedname import resolve as dottedname
 
@@ -57,41 +60,126 @@ def main(argv=None):
 
     tex_file = args.pop(0)
 
-    # Create document instance that output will be put into
-    document = plasTeX.TeXDocument(config=config)
+    # Only warnings and errors are written, as before diagnostics were
+    # buffered; the phase summaries are only written if there is
+    # something to report or they are saved to a file
+    diagnostics = enableDiagnostics(limit=config['general']['warning-limit'],
+                                    level=WARNING,
+                                    verbose=bool(config['general']['diagnostics-file']))
+    try:
+        _process(config, tex_file, diagnostics)
+    finally:
+        disableDiagnostics(diagnostics)
 
-    # Instantiate the TeX processor and parse the document
-    tex = TeX(document, file=tex_file)
+    if as_main:
+        print("")
 
-    # Populate variables for use later
-    if config['document']['title']:
-        document.userdata['title'] = config['document']['title']
-    jobname = document.userdata['jobname'] = tex.jobname
-    cwd = document.userdata['working-dir'] = os.getcwd()
-    rname = config['general']['renderer']
+def _process(config, tex_file, diagnostics):
+    # Resolve before changing to the output directory
+    diagnostics_file = config['general']['diagnostics-file']
+    if diagnostics_file:
+        diagnostics_file = os.path.abspath(diagnostics_file)
 
-    # Load aux files for cross-document references
-    pauxname = '%s.paux' % jobname
-    for dirname in [cwd] + config['general']['paux-dirs']:
-        for fname in glob.glob(os.path.join(dirname, '*.paux')):
-            if os.path.basename(fname) == pauxname:
-                continue
-            document.context.restore(fname, rname)
+    cwd = os.getcwd()
+    rname = config['general']['renderer']
+    if config['general']['incremental']:
+        # Images of sections that are not rendered again must keep
+        # their names
+        config['images']['cache'] = True
+
+    storename = config['general']['label-store']
+    stores = []
+    if storename:
+        for dirname in [cwd] + config['general']['paux-dirs']:
+            fname = os.path.join(dirname, storename)
+            if os.path.isfile(fname):
+                stores.append(LabelStore(fname))
+
+    def newDocument():
+        # Create document instance that output will be put into
+        document = plasTeX.TeXDocument(config=config)
+
+        # Instantiate the TeX processor
+        tex = TeX(document, file=tex_file)
+
+        # Populate variables for use later
+        if config['document']['title']:
+            document.userdata['title'] = config['document']['title']
+        jobname = document.userdata['jobname'] = tex.jobname
+        document.userdata['working-dir'] = cwd
+
+        # Look up cross-document references in the label stores, or
+        # load the aux files of the other documents
+        if storename:
+            for store in stores:
+                document.context.addLabelStore(store, rname, exclude=jobname)
+        else:
+            pauxname = '%s.paux' % jobname
+            for dirname in [cwd] + config['general']['paux-dirs']:
+                for fname in glob.glob(os.path.join(dirname, '*.paux')):
+                    if os.path.basename(fname) == pauxname:
+                        continue
+                    document.context.restore(fname, rname)
+
+        return document, tex
+
+    document, tex = newDocument()
+    jobname = document.userdata['jobname']
+
+    if config['general']['stream'] or config['general']['incremental']:
+        record = None
+        if config['general']['incremental']:
+            record = os.path.join(cwd, '%s.pdep' % jobname)
+        documents = [(document, tex)]
+        del document, tex
+        _stream(config, documents, newDocument, jobname, rname, diagnostics,
+                record=record)
+    else:
+        _render(config, document, tex, jobname, rname, diagnostics)
+
+    if diagnostics_file:
+        with codecs.open(diagnostics_file, 'w', encoding='utf-8') as f:
+            f.write(diagnostics.toJSON())
+
+def _outputDirectory(config, jobname):
+    """ Create the directory to output to, if there is one """
+    outdir = config['files']['directory']
+    if outdir:
+        outdir = string.Template(outdir).substitute({'jobname':jobname})
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        log.info('Directing output files to directory: %s.', outdir)
+    return outdir
 
-    # Parse the document
-    tex.parse()
+def _loadRenderer(rname):
+    try:
+        return dottedname.resolve( 'plasTeX.Renderers.%s.Renderer' % rname )
+    except ImportError:
+        print('Could not import renderer "%s"   Make sure that it is installed correctly, and can be imported by Python.' % rname,
+              file=sys.stderr)
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
 
+def _setTEXINPUTS():
     # Set up TEXINPUTS to include the current directory for the renderer
     os.environ['TEXINPUTS'] = '%s%s%s%s' % (os.getcwd(), os.pathsep,
                                          os.environ.get('TEXINPUTS',''), os.pathsep)
 
+def _render(config, document, tex, jobname, rname, diagnostics):
+    # Parse the document
+    with diagnostics.phase('parse'):
+        normalized = dict(normalizeStatistics)
+        tex.parse()
+        log.info('Normalization rebuilt %d node(s) and skipped %d unchanged subtree(s)',
+                 normalizeStatistics['rebuilt'] - normalized['rebuilt'],
+                 normalizeStatistics['skipped'] - normalized['skipped'])
+
+    _setTEXINPUTS()
+
     # Change to specified directory to output to
-    outdir = config['files']['directory']
+    outdir = _outputDirectory(config, jobname)
     if outdir:
-        outdir = string.Template(outdir).substitute({'jobname':jobname})
-        if not os.path.isdir(outdir):
-            os.makedirs(outdir)
-        log.info('Directing output files to directory: %s.', outdir)
         os.chdir(outdir)
 
 
@@ -111,20 +199,32 @@ def main(argv=None):
     # it before the chdir, the renderer might not find its data files,
     # resulting in a bad render.
     # At least doing it after is an obvious failure
-    try:
-        Renderer = dottedname.resolve( 'plasTeX.Renderers.%s.Renderer' % rname )
-    except ImportError:
-        print('Could not import renderer "%s"   Make sure that it is installed correctly, and can be imported by Python.' % rname,
-              file=sys.stderr)
-        import traceback
-        traceback.print_exc()
-        sys.exit(1)
+    Renderer = _loadRenderer(rname)
 
     # Apply renderer
-    Renderer().render(document)
-
-    if as_main:
-        print("")
+    with diagnostics.phase('render'):
+        Renderer().render(document)
+
+def _stream(config, documents, newDocument, jobname, rname, diagnostics,
+            record=None):
+    # Parsing and rendering are interleaved, so the input is read from
+    # the current directory and the output is written to the output
+    # directory.  There is no complete document to dump as XML.
+    if config['general']['xml']:
+        log.warning('No XML is written when the document is streamed (--xml is ignored '
+                    'with --stream and --incremental)')
+    _setTEXINPUTS()
+    outdir = _outputDirectory(config, jobname)
+
+    def nextDocument():
+        if documents:
+            return documents.pop()
+        return newDocument()
+
+    Renderer = _loadRenderer(rname)
+    stream = DocumentStream(Renderer(), nextDocument, directory=outdir,
+                            record=record)
+    stream.render(phase=diagnostics.phase)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the time it takes to read the arguments of common macros
+through readArgumentAndSource() and through the compiled argument plans
+that Macro.parse() uses.
+
+Run with ``python -m plasTeX.tests.benchmark_arguments [count]``.
+
+.. $Id$
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+import sys
+import timeit
+
+from plasTeX.TeX import TeX
+from plasTeX.Tokenizer import Letter
+
+# Macro name and the source of the arguments of one invocation
+MACROS = [
+    ('textbf', '{bold text}'),
+    ('ref', '{sec:intro}'),
+    ('section', '*[Short]{A longer title}'),
+    ('includegraphics', '[width=3in]{figure.png}'),
+    ('url', '{http://example.com/~user/#top}'),
+]
+
+def _tex(source, count):
+    tex = TeX()
+    tex.disableLogging()
+    tex.input(r'\documentclass{article}\usepackage{graphicx}\usepackage{url}')
+    tex.parse()
+    tex.input(source * count)
+    return tex
+
+def _legacy(tex, macro):
+    for arg in macro.arguments:
+        tex.readArgumentAndSource(parentNode=macro, name=arg.name, **arg.options)
+
+def _compiled(tex, macro):
+    for arg, read in tex.argumentPlan(macro):
+        read(tex, macro)
+
+def _withoutReading(tex):
+    """
+    Make reading an argument return constant tokens, so that only the
+    per-invocation overhead around reading and casting is timed
+
+    """
+    tex.readOptionalSpaces = lambda: None
+    tex.readToken = lambda expanded=False, parentNode=None, lazy=False: ([Letter('x')], '{x}')
+    tex.readGrouping = lambda chars, expanded=False, parentNode=None, lazy=False: ([Letter('x')], '[x]')
+    tex.readCharacter = lambda char: (None, '')
+    return tex
+
+def _time(method, tex, name, count):
+    macro = tex.ownerDocument.createElement(name)
+    return min(timeit.repeat(lambda: method(tex, macro),
+                             number=count // 4, repeat=4))
+
+def run(count=20000):
+    """
+    Time `count' invocations of each macro in MACROS both ways
+
+    Returns:
+    list of (name, legacy seconds, compiled seconds, legacy overhead
+    seconds, compiled overhead seconds) tuples
+
+    """
+    results = []
+    for name, source in MACROS:
+        times = [name]
+        for method in (_legacy, _compiled):
+            times.append(_time(method, _tex(source, count), name, count))
+        for method in (_legacy, _compiled):
+            times.append(_time(method, _withoutReading(_tex('', 1)), name, count))
+        results.append(tuple(times))
+    return results
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 20000
+    print('Microseconds per invocation; overhead excludes reading the tokens')
+    print('%-16s %9s %9s %8s %9s %9s %8s' % ('macro', 'legacy', 'compiled', 'speedup',
+                                             'overhead', 'compiled', 'speedup'))
+    per = 1e6 / (count // 4)
+    for name, legacy, compiled, olegacy, ocompiled in run(count):
+        print('%-16s %9.2f %9.2f %7.1fx %9.2f %9.2f %7.1fx' % (
+              name, legacy * per, compiled * per, legacy / compiled,
+              olegacy * per, ocompiled * per, olegacy / ocompiled))
+
+if __name__ == '__main__':
+    main()
@@ -9,10 +9,14 @@ from plasTeX import dimen
 from plasTeX import glue
 from plasTeX import ParameterCommand
 from plasTeX.TeX import TeX
+from plasTeX.TeX import DeferredSource
 
 from hamcrest import assert_that
 from hamcrest import contains
 from hamcrest import is_
+from hamcrest import instance_of
+
+from six import text_type
 
 class ArgumentParsing(TestCase):
 
@@ -418,6 +422,147 @@ class ArgumentParsing(TestCase):
         keys.sort()
         assert keys == ['one', 'three', 'two']
 
+    def testListWithMacros(self):
+        s = TeX()
+        s.input(r'{a, \textbf{b} c, {d,e}}')
+        arg = s.readArgument(type='list', expanded=True)
+        arg = [getattr(x, 'source', x) for x in arg]
+        assert arg == ['a', r' \textbf{b} c', ' {d,e}'], arg
+
+    def testCastIsReused(self):
+        s = TeX()
+        s.input('{width=3in, keepaspectratio}{width=3in, keepaspectratio}')
+        first = s.readArgument(type='dict')
+        second = s.readArgument(type='dict')
+        assert first == second == {'width': '3in', 'keepaspectratio': True}, second
+        assert first is not second
+
+        # Casts that depend on the context are not reused
+        s.input(r'\newcount\mycount\mycount=1')
+        s.parse()
+        s.input(r'{\mycount, 2}')
+        assert s.readArgument(type='list', subtype='int') == [1, 2]
+        s.input(r'\mycount=5')
+        s.parse()
+        s.input(r'{\mycount, 2}')
+        assert s.readArgument(type='list', subtype='int') == [5, 2]
+
+
+class ArgumentPlans(TestCase):
+
+    source = r'''\newcount\mycount\mycount=120
+                 \foo*[opt \mycount]{a \textbf{b}}{\mycount}{x, y}{k=v}{lab}{http://x/~y#z} end'''
+
+    class foo(Macro):
+        args = '* [ opt ] text num:int items:list dict:dict ref:idref url:url'
+
+    def _parse(self, compiled):
+        tex = TeX()
+        tex.ownerDocument.context['foo'] = self.foo
+        tex.input(self.source)
+        tex.parse()
+        node = tex.ownerDocument.createElement('foo')
+        if compiled:
+            readers = [(arg, lambda parentNode, read=read: read(tex, parentNode))
+                       for arg, read in tex.argumentPlan(node)]
+        else:
+            readers = [(arg, lambda parentNode, options=arg.options, name=arg.name:
+                        tex.readArgumentAndSource(parentNode=parentNode, name=name,
+                                                  **options))
+                       for arg in node.arguments]
+        tex.input(self.source.split('\n')[1].strip()[4:])
+        results = []
+        for arg, read in readers:
+            value, source = read(node)
+            results.append((arg.name, getattr(value, 'source', value), text_type(source)))
+        assert ParameterCommand._enablelevel == 0
+        return results
+
+    def testSameAsReadArgument(self):
+        assert_that( self._parse(True), is_( self._parse(False) ) )
+
+    def testPlanIsCompiledOnce(self):
+        tex = TeX()
+        node = tex.ownerDocument.createElement('textbf')
+        plan = tex.argumentPlan(node)
+        assert_that( [arg.name for arg, _ in plan], contains( 'self' ) )
+        assert TeX().argumentPlan(node) is plan
+
+    def testPlanUsesArgtypesOfReader(self):
+        class upper(Macro):
+            args = 'self:upper'
+        first = TeX()
+        first.input(r'\upper{ab}')
+        first.ownerDocument.context['upper'] = upper
+        # The type is unknown to the instance that compiles the plan
+        node = first.parse().getElementsByTagName('upper')[0]
+        assert_that( node.attributes['self'].textContent, is_( 'ab' ) )
+
+        second = TeX()
+        second.argtypes['upper'] = lambda tokens, **kwargs: \
+            ''.join([text_type(x) for x in tokens]).upper()
+        second.input(r'\upper{ab}')
+        second.ownerDocument.context['upper'] = upper
+        node = second.parse().getElementsByTagName('upper')[0]
+        assert_that( node.attributes['self'], is_( 'AB' ) )
+
+    def testSubclassReadsArguments(self):
+        # Subclasses that read arguments themselves are not bypassed
+        class MyTeX(TeX):
+            def readArgumentAndSource(self, *args, **kwargs):
+                value, source = TeX.readArgumentAndSource(self, *args, **kwargs)
+                if kwargs.get('name') == 'self':
+                    value = 'mine'
+                return value, source
+        tex = MyTeX()
+        tex.input(r'\textbf{ab}')
+        node = tex.parse().getElementsByTagName('textbf')[0]
+        assert_that( node.attributes['self'], is_( 'mine' ) )
+        assert_that( node.argSource, is_( '{ab}' ) )
+
+    def testSourceIsJoinedOnUse(self):
+        tex = TeX()
+        tex.ownerDocument.context['foo'] = self.foo
+        tex.input(self.source)
+        node = tex.parse().getElementsByTagName('foo')[0]
+        # Only the arguments that contain macros are joined later
+        assert_that( node._argSource[2], instance_of( DeferredSource ) )
+        assert_that( node._argSource[4], is_( '{x, y}' ) )
+        assert_that( node.argSource,
+                     is_( r'*[opt \mycount ]{a \textbf{b}}{\mycount }{x, y}{k=v}'
+                          r'{lab}{http://x/~y#z}' ) )
+        assert_that( node._argSource, is_( [node.argSource] ) )
+
+    def testSourceOfNestedMacros(self):
+        tex = TeX()
+        tex.input(r'\textit{a--b {c--d} \textbf{e--f}}')
+        node = tex.parse().getElementsByTagName('textit')[0]
+        assert_that( node.argSource, is_( u'{a--b {c\u2013d} \\textbf{e--f}}' ) )
+
+    def testSourceOfGroupingMacros(self):
+        # \bf and \large take the rest of the group as their children,
+        # which get character substitutions when they are normalized
+        for source, name, expected in [
+                (r'\section{A \emph{b--c} \bf d--e}', 'section', r'{A \emph{b--c} \bf d--e}'),
+                (r'\textbf{\large x--y z}', 'textbf', r'{\large x--y z}')]:
+            nodes = []
+            for _ in range(2):
+                tex = TeX()
+                tex.input(source)
+                doc = tex.parse()
+                nodes.append((doc, doc.getElementsByTagName(name)[0]))
+            assert_that( nodes[0][1].argSource, is_( expected ) )
+            doc, node = nodes[1]
+            doc.normalize(doc.charsubs)
+            assert_that( node.argSource, is_( expected ) )
+
+    def testParameterInArgument(self):
+        tex = TeX()
+        tex.input(r'''\newcount\mycount\mycount=120
+                     \newcommand{\show}[1]{#1}\show{\mycount=5}''')
+        tex.parse()
+        assert ParameterCommand._enablelevel == 0
+        assert ParameterCommand.enabled
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests and benchmarks for array-like environments.
+
+The benchmarks only run at test level 3 (``zope-testrunner --all``).
+Running this module directly prints the timings.
+
+.. $Id$
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+logger = __import__('logging').getLogger(__name__)
+
+#disable: accessing protected members, too many methods
+#pylint: disable=W0212,R0904
+
+import time
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import is_
+from hamcrest import has_length
+
+from plasTeX.TeX import TeX
+
+def _parse(content, packages=()):
+    tex = TeX()
+    tex.disableLogging()
+    tex.input('\\documentclass{article}%s\\begin{document}%s\\end{document}'
+              % (''.join(['\\usepackage{%s}' % x for x in packages]), content))
+    return tex.parse()
+
+def _table(env, rows, cols, colspec=True):
+    row = ' & '.join(['c%d' % i for i in range(cols)])
+    body = ' \\\\\n'.join([row] * rows)
+    if colspec:
+        return '\\begin{%s}{%s}\n%s\n\\end{%s}' % (env, 'l' * cols, body, env)
+    return '\\begin{%s}\n%s\n\\end{%s}' % (env, body, env)
+
+class TestArrays(unittest.TestCase):
+
+    def test_cell_formatting_does_not_leak(self):
+        doc = _parse('\\begin{tabular}{ll}\\def\\x{A}\\x & \\x \\\\ \\x & b\\end{tabular}')
+        table = doc.getElementsByTagName('tabular')[0]
+        assert_that( table, has_length( 2 ) )
+        first, second = table
+        assert_that( first[0].textContent.strip(), is_( 'A' ) )
+        # \x was local to the first cell
+        assert_that( first[1].textContent.strip(), is_( '' ) )
+        assert_that( second[0].textContent.strip(), is_( '' ) )
+        assert_that( second[1].textContent.strip(), is_( 'b' ) )
+
+    def test_context_depth_is_restored(self):
+        tex = TeX()
+        tex.disableLogging()
+        tex.input('\\begin{tabular}{ll}a & b \\\\ c & d\\end{tabular}')
+        context = tex.ownerDocument.context
+        depth = len(context.contexts)
+        tex.parse()
+        assert_that( context.contexts, has_length( depth ) )
+
+    def test_pristine_group(self):
+        tex = TeX()
+        context = tex.ownerDocument.context
+        context.push()
+        top = context.top
+        assert_that( context.isPristineGroup, is_( True ) )
+
+        # Reusing a pristine grouping keeps the same context item
+        context.renewGroup()
+        assert_that( context.top, is_( top ) )
+
+        context.catcode('@', 11)
+        assert_that( context.isPristineGroup, is_( False ) )
+        context.renewGroup()
+        assert_that( context.isPristineGroup, is_( True ) )
+        context.pop()
+
+
+class TestArrayBenchmarks(unittest.TestCase):
+
+    level = 3
+
+    rows = 500
+    cols = 10
+
+    def _time(self, name, content, packages=(), tag=None):
+        start = time.time()
+        doc = _parse(content, packages)
+        elapsed = time.time() - start
+        logger.info('%s: %d cells in %.2fs', name, self.rows * self.cols, elapsed)
+        table = doc.getElementsByTagName(tag or name)[0]
+        assert_that( table, has_length( self.rows ) )
+        for row in table:
+            assert_that( row, has_length( self.cols ) )
+        return elapsed
+
+    def test_tabular(self):
+        self._time('tabular', _table('tabular', self.rows, self.cols))
+
+    def test_longtable(self):
+        self._time('longtable', _table('longtable', self.rows, self.cols),
+                   packages=('longtable',))
+
+    def test_eqnarray(self):
+        cols = self.cols
+        try:
+            self.cols = 3
+            self._time('eqnarray', _table('eqnarray', self.rows, self.cols, colspec=False))
+        finally:
+            self.cols = cols
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
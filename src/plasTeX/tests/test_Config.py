@@ -18,6 +18,8 @@ import unittest
 
 from hamcrest import assert_that
 from hamcrest import is_
+from hamcrest import is_not
+from hamcrest import same_instance
 
 from six.moves import cPickle as pickle
 
@@ -30,3 +32,50 @@ class TestConfig(unittest.TestCase):
         s = pickle.dumps( c, pickle.HIGHEST_PROTOCOL )
 
         assert_that( pickle.loads( s ), is_( c ) )
+
+    def test_can_pickle_with_snapshot(self):
+        c = newConfig( read_files=False )
+        c.snapshot
+        s = pickle.dumps( c, pickle.HIGHEST_PROTOCOL )
+        assert_that( pickle.loads( s ).snapshot.files.split_level, is_( 2 ) )
+
+    def test_snapshot(self):
+        c = newConfig( read_files=False )
+        snapshot = c.snapshot
+        assert_that( snapshot.files.input_encoding, is_( 'utf-8' ) )
+        assert_that( snapshot['files']['input-encoding'], is_( 'utf-8' ) )
+        assert_that( snapshot.images.scale_factor, is_( 1.0 ) )
+        assert_that( snapshot.general.paux_dirs, is_( () ) )
+        # Cross-document labels go to *.paux files unless a store is named
+        assert_that( snapshot.general.label_store, is_( '' ) )
+        assert_that( c.snapshot, is_( same_instance( snapshot ) ) )
+
+        with self.assertRaises(TypeError):
+            snapshot.files['split-level'] = 3
+        with self.assertRaises(AttributeError):
+            snapshot.files.no_such_option
+
+    def test_snapshot_invalidation(self):
+        c = newConfig( read_files=False )
+        snapshot = c.snapshot
+
+        c['files']['split-level'] = 5
+        assert_that( c.snapshot, is_not( same_instance( snapshot ) ) )
+        assert_that( c.snapshot.files.split_level, is_( 5 ) )
+
+        c.getopt(['--toc-depth=7', 'foo.tex'])
+        assert_that( c.snapshot.document.toc_depth, is_( 7 ) )
+
+        copy = c.copy()
+        copy.snapshot
+        c['files']['split-level'] = 1
+        assert_that( c.snapshot.files.split_level, is_( 1 ) )
+        assert_that( copy.snapshot.files.split_level, is_( 5 ) )
+
+        # Lists changed in place need an explicit invalidation
+        c['general']['paux-dirs'] = ['a']
+        assert_that( c.snapshot.general.paux_dirs, is_( ('a',) ) )
+        c['general']['paux-dirs'].append('b')
+        assert_that( c.snapshot.general.paux_dirs, is_( ('a',) ) )
+        c.invalidate()
+        assert_that( c.snapshot.general.paux_dirs, is_( ('a', 'b') ) )
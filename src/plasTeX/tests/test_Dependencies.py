@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+.. $Id$
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+logger = __import__('logging').getLogger(__name__)
+
+#disable: accessing protected members, too many methods
+#pylint: disable=W0212,R0904
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import has_item
+from hamcrest import is_not
+from hamcrest import contains_string
+
+from six import text_type
+
+from plasTeX import TeXDocument
+from plasTeX.TeX import TeX
+from plasTeX.Renderers import Renderer
+from plasTeX.Streaming import DocumentStream
+from plasTeX.Dependencies import BuildRecord
+from plasTeX.Dependencies import fileDigest
+
+MAIN = r'''
+\documentclass{report}
+\begin{document}
+\input{%(directory)s/one.tex}
+\input{%(directory)s/two.tex}
+\input{%(directory)s/three.tex}
+\input{%(directory)s/four.tex}
+\end{document}
+'''
+
+ONE = r'''
+\chapter{One}\label{ch:one}
+a
+'''
+
+TWO = r'''
+\chapter{Two}\label{ch:two}
+b \section{Two A}\label{sec:twoa} c
+\begin{equation}\label{eq:two} x \end{equation}
+'''
+
+THREE = r'''
+\chapter{Three}
+see \ref{sec:twoa} and \ref{eq:two}
+'''
+
+FOUR = r'''
+\chapter{Four}
+d
+'''
+
+class _Renderer(Renderer):
+    """ Counts the chapters it renders """
+
+    fileExtension = '.txt'
+
+    def __init__(self):
+        Renderer.__init__(self)
+        self['chapter'] = self['section'] = self.section
+        self['ref'] = lambda node: text_type(node.idref['label'].ref)
+        self.rendered = []
+
+    def section(self, node):
+        self.rendered.append(text_type(node.title))
+        return '%s\n%s' % (node.fullTitle, text_type(node))
+
+class TestIncrementalStream(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'out')
+        os.mkdir(self.output)
+        self.record = os.path.join(self.directory, 'main.pdep')
+        for name, content in (('main', MAIN), ('one', ONE),
+                              ('two', TWO), ('three', THREE),
+                              ('four', FOUR)):
+            self._write(name, content % {'directory': self.directory}
+                        if name == 'main' else content)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, content):
+        with io.open(os.path.join(self.directory, name + '.tex'), 'w') as f:
+            f.write(content)
+
+    def _newDocument(self):
+        document = TeXDocument()
+        # The inputs are given by their absolute path
+        document.config['general']['kpsewhich'] = 'echo'
+        tex = TeX(document, file=os.path.join(self.directory, 'main.tex'))
+        tex.disableLogging()
+        document.config['images']['imager'] = 'none'
+        document.config['images']['vector-imager'] = 'none'
+        document.config['files']['split-level'] = 1
+        document.userdata['working-dir'] = self.directory
+        return document, tex
+
+    def _build(self):
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        try:
+            renderer = _Renderer()
+            stream = DocumentStream(renderer, self._newDocument,
+                                    directory=self.output, record=self.record)
+            stream.render()
+        finally:
+            os.chdir(cwd)
+        return stream, renderer
+
+    def _read(self, name):
+        with io.open(os.path.join(self.output, name)) as f:
+            return f.read()
+
+    def test_first_build(self):
+        stream, renderer = self._build()
+        assert_that( stream.upToDate, is_( False ) )
+        assert_that( renderer.rendered, has_item( 'Three' ) )
+
+        record = BuildRecord.load(self.record)
+        assert_that( [x['name'] for x in record.sections],
+                     is_( ['chapter'] * 4 ) )
+        two = os.path.join(self.directory, 'two.tex')
+        assert_that( record.sections[1]['inputs'], has_item( two ) )
+        assert_that( record.sections[2]['refs'], is_( ['eq:two', 'sec:twoa'] ) )
+        assert_that( record.files[two], is_( fileDigest(two) ) )
+
+    def test_nothing_changed(self):
+        self._build()
+        stream, renderer = self._build()
+        assert_that( stream.upToDate, is_( True ) )
+        assert_that( renderer.rendered, is_( [] ) )
+
+    def test_changed_section(self):
+        self._build()
+        self._write('one', ONE.replace('\na\n', '\nchanged\n'))
+        stream, renderer = self._build()
+        assert_that( stream.upToDate, is_( False ) )
+        assert_that( renderer.rendered, is_( ['One'] ) )
+        assert_that( self._read('ch_one.txt'), contains_string( 'changed' ) )
+
+        # The record is up to date again
+        stream, renderer = self._build()
+        assert_that( stream.upToDate, is_( True ) )
+
+    def test_changed_label(self):
+        self._build()
+        # A new equation changes the reference that chapter three uses,
+        # but not the outline
+        self._write('two', TWO.replace(r'\begin{equation}',
+                                       r'\begin{equation} y \end{equation}\begin{equation}'))
+        _, renderer = self._build()
+        assert_that( renderer.rendered, has_item( 'Three' ) )
+        assert_that( renderer.rendered, is_not( has_item( 'Four' ) ) )
+        assert_that( self._read('sect0001.txt'), contains_string( 'see 2.1 and 2' ) )
+
+    def test_missing_output(self):
+        self._build()
+        os.remove(os.path.join(self.output, 'ch_one.txt'))
+        stream, renderer = self._build()
+        assert_that( stream.upToDate, is_( False ) )
+        assert_that( renderer.rendered, is_( ['One'] ) )
+
+class TestBuildRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        filename = os.path.join(self.directory, 'test.pdep')
+        assert_that( BuildRecord.load(filename), is_( none() ) )
+
+        source = os.path.join(self.directory, 'source.tex')
+        with io.open(source, 'w') as f:
+            f.write('a')
+
+        record = BuildRecord()
+        record.files[source] = fileDigest(source)
+        record.outputs = ['index.html']
+        record.sections.append({'name': 'chapter', 'inputs': [source],
+                                'counters': {}, 'refs': [],
+                                'outputs': ['one.html']})
+        record.save(filename)
+
+        record = BuildRecord.load(filename)
+        assert_that( record.allOutputs(), is_( ['index.html', 'one.html'] ) )
+        assert_that( record.changedFiles(), is_( set() ) )
+
+        with io.open(source, 'w') as f:
+            f.write('b')
+        assert_that( record.changedFiles(), is_( {source} ) )
+
+    def test_input_files(self):
+        source = os.path.join(self.directory, 'source.tex')
+        with io.open(source, 'w') as f:
+            f.write('a')
+        tex = TeX()
+        tex.disableLogging()
+        tex.ownerDocument.config['general']['kpsewhich'] = 'echo'
+        tex.input(r'\input{%s} b' % source)
+        tex.parse()
+        assert_that( tex.inputFiles, is_( [source] ) )
+
+if __name__ == '__main__':
+    unittest.main()
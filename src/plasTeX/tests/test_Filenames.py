@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+.. $Id$
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+logger = __import__('logging').getLogger(__name__)
+
+#disable: accessing protected members, too many methods
+#pylint: disable=W0212,R0904
+
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import is_
+from hamcrest import has_entries
+from hamcrest import has_length
+
+from plasTeX.Filenames import Filenames
+from plasTeX.TeX import TeX
+from plasTeX.DOM import Node
+from plasTeX.Renderers import Renderer
+from plasTeX.Renderers import RenderableMixin
+from plasTeX.Renderers import mixin
+from plasTeX.Renderers import unmix
+
+class TestFilenames(unittest.TestCase):
+
+    def test_static_then_wildcard(self):
+        gen = Filenames('index [$id, sect$num(4)]', extension='.html')
+        assert_that( gen(), is_( 'index.html' ) )
+        gen.vars['id'] = 'intro'
+        assert_that( gen(), is_( 'intro.html' ) )
+        assert_that( gen(), is_( 'sect0001.html' ) )
+        assert_that( gen(), is_( 'sect0002.html' ) )
+
+    def test_charsub_and_word_limit(self):
+        gen = Filenames('$title(2)', charsub=(' .', '_'), extension='.html')
+        gen.vars['title'] = 'A long title.'
+        assert_that( gen(), is_( 'A_long_title_.html' ) )
+
+        gen = Filenames('index [$title(2), sect$num(4)]', extension='.html')
+        gen()
+        gen.vars['title'] = 'A long title'
+        assert_that( gen(), is_( 'A long.html' ) )
+
+    def test_invalid_names_skipped(self):
+        gen = Filenames('img$num(2)', extension='.png', invalid={'img01.png': None})
+        assert_that( gen(), is_( 'img02.png' ) )
+
+
+class TestPlanFilenames(unittest.TestCase):
+
+    def test_plan_sections(self):
+        tex = TeX()
+        tex.disableLogging()
+        tex.input(r'''\documentclass{report}\begin{document}
+                   \chapter{Intro}\label{intro} text \textbf{bold}
+                   \section{First} more
+                   \chapter{Second} y
+                   \end{document}''')
+        doc = tex.parse()
+        doc.config['files']['split-level'] = 0
+        doc.config['files']['filename'] = 'index [$id, sect$num(4)]'
+
+        renderer = Renderer()
+        renderer.newFilename = Filenames(doc.config['files'].get('filename', raw=True),
+                                         extension='.html')
+        doc.renderer = renderer
+        mixin(Node, RenderableMixin)
+        try:
+            files = renderer.planFilenames(doc)
+        finally:
+            unmix(Node, RenderableMixin)
+            del doc.renderer
+
+        assert_that( files, is_( renderer.files ) )
+        assert_that( files, has_length( 3 ) )
+        names = dict((node.nodeName + ':' + (node.attributes.get('title').textContent
+                                              if node.attributes.get('title') is not None
+                                              else ''),
+                      name)
+                     for node, name in files.items())
+        assert_that( names, has_entries( {'document:': 'index.html',
+                                          'chapter:Intro': 'intro.html',
+                                          'chapter:Second': 'sect0001.html'} ) )
+
+    def test_plan_nested(self):
+        # A node that creates a file may be nested in inline markup;
+        # it still gets its filename in document order
+        tex = TeX()
+        tex.disableLogging()
+        tex.input(r'''\documentclass{report}\begin{document}
+                   \chapter{Intro} text \emph{in \textbf{bold}}
+                   \chapter{Second} y
+                   \end{document}''')
+        doc = tex.parse()
+        doc.config['files']['split-level'] = 0
+        doc.config['files']['filename'] = 'index [sect$num(4)]'
+        bold = doc.getElementsByTagName('textbf')[0]
+        bold.splitlevel = bold.level
+
+        renderer = Renderer()
+        renderer.newFilename = Filenames(doc.config['files'].get('filename', raw=True),
+                                         extension='.html')
+        doc.renderer = renderer
+        mixin(Node, RenderableMixin)
+        try:
+            files = renderer.planFilenames(doc)
+        finally:
+            unmix(Node, RenderableMixin)
+            del doc.renderer
+
+        intro, second = doc.getElementsByTagName('chapter')
+        assert_that( files[intro], is_( 'sect0001.html' ) )
+        assert_that( files[bold], is_( 'sect0002.html' ) )
+        assert_that( files[second], is_( 'sect0003.html' ) )
+
+if __name__ == '__main__':
+    unittest.main()
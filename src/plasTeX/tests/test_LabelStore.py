@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+.. $Id$
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+logger = __import__('logging').getLogger(__name__)
+
+#disable: accessing protected members, too many methods
+#pylint: disable=W0212,R0904
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import has_property
+from hamcrest import contains_inanyorder
+
+from plasTeX.TeX import TeX
+from plasTeX.Context import Context
+from plasTeX.LabelStore import LabelStore
+
+class _Persistable(object):
+
+    def __init__(self, ref):
+        self.ref = ref
+
+    def persist(self):
+        return {'ref': self.ref}
+
+class TestLabelStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = LabelStore(os.path.join(self.directory, 'labels.db'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_update_and_lookup(self):
+        store = self.store
+        store.update('one', {'a': {'ref': '1'}, 'b': {'ref': '2'}})
+        store.update('two', {'c': {'ref': '3'}}, rtype='XHTML')
+
+        assert_that( store.lookup('a'), is_( {'ref': '1'} ) )
+        assert_that( store.lookup('a', exclude='one'), is_( none() ) )
+        assert_that( store.lookup('c'), is_( none() ) )
+        assert_that( store.lookup('c', rtype='XHTML'), is_( {'ref': '3'} ) )
+
+        # The labels of a document are replaced as a whole
+        store.update('one', {'b': {'ref': '4'}})
+        assert_that( store.lookup('a'), is_( none() ) )
+        assert_that( store.lookup('b'), is_( {'ref': '4'} ) )
+        assert_that( store.documents(), is_( ['one'] ) )
+
+    def test_concurrent_writers(self):
+        other = LabelStore(self.store.filename)
+        try:
+            self.store.update('one', {'a': {'ref': '1'}})
+            other.update('two', {'b': {'ref': '2'}})
+            assert_that( self.store.lookup('b'), is_( {'ref': '2'} ) )
+            assert_that( other.documents(), contains_inanyorder( 'one', 'two' ) )
+        finally:
+            other.close()
+
+    def test_context_loads_labels_lazily(self):
+        context = Context()
+        context.persistentLabels['a'] = _Persistable('1')
+        context.persistentLabels['b'] = _Persistable('2')
+        context.persistLabels(self.store, 'one')
+
+        context = Context()
+        context.addLabelStore(self.store, exclude='two')
+        assert_that( dict(context.labels), is_( {} ) )
+
+        assert_that( 'a' in context.labels, is_( True ) )
+        assert_that( context.labels['a'], has_property( 'ref', '1' ) )
+        assert_that( list(context.labels), is_( ['a'] ) )
+
+        assert_that( 'missing' in context.labels, is_( False ) )
+        assert_that( context.labels.get('missing'), is_( none() ) )
+        self.assertRaises(KeyError, context.labels.__getitem__, 'missing')
+
+    def test_ref_to_other_document(self):
+        self.store.update('other', {'sec:other': {'ref': '7', 'id': 'sec:other'}})
+
+        tex = TeX()
+        tex.disableLogging()
+        tex.ownerDocument.context.addLabelStore(self.store, exclude='this')
+        tex.input(r'\documentclass{article}\begin{document}'
+                  r'\section{A}\label{sec:a} \ref{sec:other} \ref{sec:a}'
+                  r'\end{document}')
+        document = tex.parse()
+
+        first, second = document.getElementsByTagName('ref')
+        assert_that( first.idref['label'].ref, is_( '7' ) )
+        assert_that( second.idref['label'].ref.textContent, is_( '1' ) )
+        assert_that( sorted(tex.ownerDocument.context.labels),
+                     is_( ['sec:a', 'sec:other'] ) )
+
+if __name__ == '__main__':
+    unittest.main()
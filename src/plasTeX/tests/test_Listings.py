@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+.. $Id$
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+logger = __import__('logging').getLogger(__name__)
+
+#disable: accessing protected members, too many methods
+#pylint: disable=W0212,R0904
+
+import io
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+import warnings
+
+from hamcrest import assert_that
+from hamcrest import is_
+from hamcrest import is_not
+from hamcrest import none
+from hamcrest import same_instance
+from hamcrest import contains_string
+
+from plasTeX.TeX import TeX
+from plasTeX.Logging import enableDiagnostics
+from plasTeX.Renderers import Renderer
+from plasTeX.Highlighting import highlight
+from plasTeX.Highlighting import Highlighter
+from plasTeX.Highlighting import pygments
+
+SOURCE = r'''
+\documentclass{article}
+\usepackage{listings}
+\begin{document}
+\lstset{language=Python}
+\begin{lstlisting}
+def f(x):
+    return x  /*@ hidden @*/
+\end{lstlisting}
+\begin{lstlisting}
+def f(x):
+    return x  /*@ hidden @*/
+\end{lstlisting}
+\end{document}
+'''
+
+class TestListings(unittest.TestCase):
+
+    def test_escape_sequence_first(self):
+        # The lookahead for the optional argument pushes back \foo
+        tex = TeX()
+        tex.disableLogging()
+        tex.input(r'''
+\documentclass{article}
+\usepackage{listings}
+\begin{document}
+\begin{lstlisting}
+\foo  bar
+\end{lstlisting}
+\end{document}
+''')
+        listing, = tex.parse().getElementsByTagName('lstlisting')
+        assert_that( listing.plain_listing, is_( '\n\\foo  bar\n' ) )
+
+@unittest.skipIf(pygments is None, 'Pygments is not installed')
+class TestHighlighting(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        self.documents = []
+        self.poolThreshold = Highlighter.poolThreshold
+
+    def tearDown(self):
+        Highlighter.poolThreshold = self.poolThreshold
+        for document in self.documents:
+            if document.highlighter is not None:
+                document.highlighter.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def _parse(self, jobs=1, cache=False):
+        tex = TeX()
+        tex.disableLogging()
+        tex.ownerDocument.config['general']['jobs'] = jobs
+        tex.ownerDocument.config['general']['highlight-cache'] = cache
+        tex.input(SOURCE)
+        self.documents.append(tex.ownerDocument)
+        return tex.parse().getElementsByTagName('lstlisting')
+
+    def test_highlight(self):
+        first, second = self._parse()
+        assert_that( first.plain_listing, is_( '\ndef f(x):\n    return x  \n' ) )
+        expected = highlight(first.plain_listing, 'python', False)
+        assert_that( expected, contains_string( '<span class="k">def</span>' ) )
+        assert_that( first.xhtml_listing, is_( expected ) )
+        # Repeated listings are highlighted once
+        assert_that( second._highlight, is_( same_instance( first._highlight ) ) )
+        # Nothing is cached unless asked for
+        assert_that( first._highlight.path, is_( none() ) )
+        assert_that( os.path.exists('.cache'), is_( False ) )
+
+    def test_few_listings(self):
+        # Starting a pool for a few listings takes longer than
+        # highlighting them here
+        first, _ = self._parse(jobs=2)
+        assert_that( first.ownerDocument.highlighter._pool, is_( none() ) )
+        assert_that( first._highlight._result, is_( none() ) )
+        assert_that( first.xhtml_listing,
+                     is_( highlight(first.plain_listing, 'python', False) ) )
+
+    def test_cache(self):
+        first, _ = self._parse(cache=True)
+        path = first._highlight.path
+        assert_that( os.path.isfile(path), is_( False ) )
+        value = first.xhtml_listing
+        assert_that( os.path.isfile(path), is_( True ) )
+
+        # The next run reads the cache instead of highlighting
+        with open(path, 'w') as f:
+            f.write('cached')
+        first, _ = self._parse(cache=True)
+        assert_that( first._highlight._result, is_( none() ) )
+        assert_that( first.xhtml_listing, is_( 'cached' ) )
+        assert_that( value, is_not( 'cached' ) )
+
+    def test_pool(self):
+        Highlighter.poolThreshold = 0
+        first, _ = self._parse(jobs=2)
+        highlighter = first.ownerDocument.highlighter
+        expected = highlight(first.plain_listing, 'python', False)
+        if highlighter._pool:
+            assert_that( first._highlight._result, is_not( none() ) )
+            assert_that( first._highlight._result.get(), is_( expected ) )
+
+        # Each document has its own highlights and pool
+        other, _ = self._parse(jobs=2)
+        assert_that( other.ownerDocument.highlighter, is_not( same_instance( highlighter ) ) )
+        assert_that( other._highlight, is_not( same_instance( first._highlight ) ) )
+
+        # The renderer stops the pool without waiting for the
+        # listings, which are highlighted here if they are read
+        other.ownerDocument.highlighter.close()
+        assert_that( other._highlight._result, is_( none() ) )
+        assert_that( other._highlight._value, is_( none() ) )
+        assert_that( other.xhtml_listing, is_( expected ) )
+
+        document = first.ownerDocument
+        renderer = Renderer()
+        renderer.setUp(document)
+        renderer.tearDown(document)
+        assert_that( highlighter._pool, is_( none() ) )
+        assert_that( first._highlight._result, is_( none() ) )
+        assert_that( first.xhtml_listing, is_( expected ) )
+
+    def test_pool_with_diagnostics(self):
+        # The workers must not be forked while the diagnostics
+        # writer thread is running
+        Highlighter.poolThreshold = 0
+        stream = io.StringIO()
+        log = logging.getLogger('plasTeX.tests.listings')
+        log.propagate = False
+        diagnostics = enableDiagnostics(stream, logger=log)
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                first, _ = self._parse(jobs=2)
+                log.warning('a diagnostic')
+                value = first.xhtml_listing
+        finally:
+            log.removeHandler(diagnostics)
+            log.propagate = True
+            diagnostics.close()
+        assert_that( value, is_( highlight(first.plain_listing, 'python', False) ) )
+        assert_that( [x for x in caught if 'fork' in str(x.message)], is_( [] ) )
+        assert_that( stream.getvalue(), contains_string( 'a diagnostic' ) )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+.. $Id$
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+logger = __import__('logging').getLogger(__name__)
+
+#disable: accessing protected members, too many methods
+#pylint: disable=W0212,R0904
+
+import json
+import logging
+import unittest
+
+from io import StringIO
+
+from hamcrest import assert_that
+from hamcrest import is_
+from hamcrest import has_length
+from hamcrest import has_entries
+from hamcrest import contains_string
+from hamcrest import has_item
+from hamcrest import is_not
+
+from plasTeX.Logging import getLogger
+from plasTeX.Logging import enableDiagnostics
+from plasTeX.Logging import disableDiagnostics
+from plasTeX.Logging import WARNING
+
+class TestDiagnostics(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = StringIO()
+        self.log = getLogger('plasTeX.tests.diagnostics')
+        self.status = getLogger('plasTeX.tests.diagnostics.status')
+        self.handler = enableDiagnostics(self.stream, limit=2, logger=self.log)
+        self.log.propagate = False
+
+    def tearDown(self):
+        self.log.removeHandler(self.handler)
+        self.log.propagate = True
+        self.handler.close()
+
+    def test_repeated_warnings_are_counted(self):
+        with self.handler.phase('parse'):
+            for _ in range(5):
+                self.log.warning('unrecognized command/environment: %s', 'foo')
+            self.log.warning('unrecognized command/environment: %s', 'bar')
+        self.handler.flush()
+
+        output = self.stream.getvalue()
+        assert_that( output.count('unrecognized command/environment: foo'), is_( 3 ) ) # twice + summary
+        assert_that( output, contains_string( '5x unrecognized command/environment: foo' ) )
+
+        summaries = json.loads(self.handler.toJSON())
+        assert_that( summaries, has_length( 1 ) )
+        assert_that( summaries[0], has_entries( {'phase': 'parse',
+                                                 'levels': {'WARNING': 6}} ) )
+        assert_that( summaries[0]['messages'][0],
+                     has_entries( {'count': 5,
+                                   'message': 'unrecognized command/environment: foo'} ) )
+
+    def test_counts_reset_per_phase(self):
+        with self.handler.phase('parse'):
+            self.log.warning('one')
+        with self.handler.phase('render'):
+            pass
+        self.handler.flush()
+        assert_that( self.handler.summaries[1]['levels'], is_( {} ) )
+        # Phases without warnings are only summarized when verbose
+        assert_that( self.stream.getvalue(), contains_string( 'Phase parse' ) )
+        assert_that( self.stream.getvalue(), is_not( contains_string( 'Phase render' ) ) )
+        self.handler.verbose = True
+        with self.handler.phase('render'):
+            pass
+        self.handler.flush()
+        assert_that( self.stream.getvalue(), contains_string( 'Phase render' ) )
+
+    def test_status_has_no_newlines(self):
+        self.status.info('[a]')
+        self.status.info('[b]')
+        self.handler.flush()
+        assert_that( self.stream.getvalue(), is_( '[a][b]' ) )
+
+class TestEnableDiagnostics(unittest.TestCase):
+
+    def test_plasTeX_loggers_only(self):
+        python = logging.getLogger()
+        plastex = getLogger()
+        status = getLogger('status')
+        levels = (python.level, plastex.level, status.level)
+        stream = StringIO()
+        handler = enableDiagnostics(stream, level=WARNING)
+        try:
+            assert_that( python.handlers, is_not( has_item( handler ) ) )
+            assert_that( python.level, is_( levels[0] ) )
+            getLogger('plasTeX.tests.enable').warning('from plasTeX')
+            getLogger('tests.enable.new').warning('from a new logger')
+            logging.getLogger('tests.enable.other').warning('from elsewhere')
+            status.info('not written')
+            handler.flush()
+        finally:
+            disableDiagnostics(handler)
+        output = stream.getvalue()
+        assert_that( output, contains_string( 'from plasTeX' ) )
+        assert_that( output, contains_string( 'from a new logger' ) )
+        assert_that( output, is_not( contains_string( 'from elsewhere' ) ) )
+        assert_that( output, is_not( contains_string( 'not written' ) ) )
+        assert_that( (python.level, plastex.level, status.level), is_( levels ) )
+        assert_that( getLogger('tests.enable.new').handlers, is_( [] ) )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+.. $Id$
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+logger = __import__('logging').getLogger(__name__)
+
+#disable: accessing protected members, too many methods
+#pylint: disable=W0212,R0904
+
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import is_
+from hamcrest import has_length
+from hamcrest import none
+from hamcrest import same_instance
+
+from plasTeX.TeX import TeX
+from plasTeX.DOM import Node
+from plasTeX.Filenames import Filenames
+from plasTeX.Renderers import Renderer
+from plasTeX.Renderers import RenderableMixin
+from plasTeX.Renderers import mixin
+from plasTeX.Renderers import unmix
+from plasTeX._util import documentSection
+
+class _RenderTimeTest(unittest.TestCase):
+    """
+    Parses a document and sets up the renderer state that section
+    utilities rely on (filenames) without writing any files.
+
+    """
+
+    split_level = 1
+    content = ''
+
+    def setUp(self):
+        tex = TeX()
+        tex.disableLogging()
+        tex.input('\\documentclass{report}\\begin{document}%s\\end{document}' % self.content)
+        self.doc = doc = tex.parse()
+        doc.config['files']['split-level'] = self.split_level
+        renderer = Renderer()
+        renderer.newFilename = Filenames(doc.config['files'].get('filename', raw=True),
+                                         extension='.html')
+        doc.renderer = renderer
+        mixin(Node, RenderableMixin)
+        renderer.planFilenames(doc)
+        self.document = doc.getElementsByTagName('document')[0]
+
+    def tearDown(self):
+        unmix(Node, RenderableMixin)
+        del self.doc.renderer
+
+class TestLinks(_RenderTimeTest):
+
+    content = r'''
+        \chapter{One} a \section{One A} b \section{One B} c
+        \subsection{One B i} d
+        \chapter{Two} e \section{Two A} f
+        '''
+
+    def test_prev_next(self):
+        one, two = self.document.subsections
+        onea, oneb = one.subsections
+        twoa, = two.subsections
+
+        assert_that( oneb.links['prev'], is_( same_instance( onea ) ) )
+        assert_that( oneb.links['next'], is_( same_instance( two ) ) )
+        assert_that( self.document.links['prev'], is_( none() ) )
+        assert_that( twoa.links['next'], is_( none() ) )
+        assert_that( twoa.links['last'], is_( same_instance( twoa ) ) )
+
+        # Subsections don't create files; they are linked after the last file
+        subsub, = oneb.subsections
+        assert_that( subsub.filename, is_( none() ) )
+        assert_that( subsub.links['prev'], is_( same_instance( twoa ) ) )
+        assert_that( subsub.links['next'], is_( none() ) )
+
+    def test_breadcrumbs(self):
+        one = self.document.subsections[0]
+        oneb = one.subsections[1]
+        subsub = oneb.subsections[0]
+        links = subsub.links
+        assert_that( links['breadcrumbs'], is_( [self.document, one, oneb, subsub] ) )
+        assert_that( links['chapter'], is_( same_instance( one ) ) )
+        assert_that( links['section'], is_( same_instance( oneb ) ) )
+        assert_that( links['up'], is_( same_instance( oneb ) ) )
+        assert_that( links['top'], is_( same_instance( self.document ) ) )
+
+    def test_document_section(self):
+        one = self.document.subsections[0]
+        assert_that( documentSection(one.subsections[1]), is_( same_instance( self.document ) ) )
+        assert_that( documentSection(self.document), is_( same_instance( self.document ) ) )
+        assert_that( documentSection(self.doc), is_( same_instance( self.document ) ) )
+        assert_that( documentSection(self.doc.createElement('chapter')), is_( none() ) )
+
+    def test_index_is_shared(self):
+        one = self.document.subsections[0]
+        assert_that( one.navigationIndex,
+                     is_( same_instance( self.document.navigationIndex ) ) )
+        assert_that( one.navigationIndex.sections, has_length( 6 ) )
+
+    def test_config_links(self):
+        self.doc.config['links']['glossary-title'] = 'Glossary'
+        self.doc.config['links']['next-url'] = 'ignored.html'
+        links = self.document.links
+        assert_that( links['glossary'], is_( {'title': 'Glossary'} ) )
+        assert_that( links['next'], is_( same_instance( self.document.subsections[0] ) ) )
+
+class TestTableOfContents(_RenderTimeTest):
+
+    split_level = 2
+    content = TestLinks.content
+
+    def test_depth_limit(self):
+        self.doc.config['document']['toc-depth'] = 2
+        toc = self.document.tableofcontents
+        assert_that( toc, has_length( 2 ) )
+        one = toc[0]
+        assert_that( one.depth, is_( 1 ) )
+        assert_that( one.tableofcontents, has_length( 2 ) )
+        assert_that( one.tableofcontents[1].depth, is_( 2 ) )
+        assert_that( one.tableofcontents[1].tableofcontents, is_( () ) )
+
+        full = self.document.fulltableofcontents
+        assert_that( full[0].tableofcontents[1].tableofcontents, has_length( 1 ) )
+
+    def test_entries_are_shared(self):
+        one = self.document.fulltableofcontents[0]
+        assert_that( one.tableofcontents, is_( same_instance( one.tableofcontents ) ) )
+
+        chapter = self.document.subsections[0]
+        assert_that( chapter.tocEntries,
+                     is_( same_instance( self.document.tocEntries ) ) )
+
+    def test_attributes_of_section(self):
+        chapter = self.document.subsections[0]
+        one = self.document.fulltableofcontents[0]
+        assert_that( one.url, is_( chapter.url ) )
+        assert_that( one.fullTocEntry, is_( same_instance( chapter.fullTocEntry ) ) )
+        assert_that( isinstance(one, type(chapter)), is_( True ) )
+
+class TestFootnotes(_RenderTimeTest):
+
+    split_level = 0
+    content = r'''
+        \chapter{One} a\footnote{first} \section{One A} b\footnote{second}
+        \chapter{Two} c\footnote{third}
+        '''
+
+    def test_footnotes_grouped_by_file(self):
+        one, two = self.document.subsections
+        onea, = one.subsections
+        assert_that( onea.filename, is_( none() ) )
+
+        assert_that( one.footnotes, has_length( 2 ) )
+        assert_that( two.footnotes, has_length( 1 ) )
+        assert_that( onea.footnotes, is_( () ) )
+        assert_that( self.document.footnotes, is_( () ) )
+
+        assert_that( [f.textContent.strip() for f in one.footnotes],
+                     is_( ['first', 'second'] ) )
+
+    def test_numbering_restarts_per_file(self):
+        one, two = self.document.subsections
+        assert_that( [f.mark.attributes['num'] for f in one.footnotes], is_( [1, 2] ) )
+        assert_that( [f.mark.attributes['num'] for f in two.footnotes], is_( [1] ) )
+
+    def test_entries_are_shared(self):
+        one = self.document.subsections[0]
+        assert_that( one.sectionEntries,
+                     is_( same_instance( self.document.sectionEntries ) ) )
+
+if __name__ == '__main__':
+    unittest.main()
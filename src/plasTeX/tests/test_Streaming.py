@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+.. $Id$
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+logger = __import__('logging').getLogger(__name__)
+
+#disable: accessing protected members, too many methods
+#pylint: disable=W0212,R0904
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import is_
+from hamcrest import has_entry
+from hamcrest import has_key
+from hamcrest import contains_string
+
+from six import text_type
+
+from plasTeX.TeX import TeX
+from plasTeX.Renderers import Renderer
+from plasTeX.Renderers.Text import Renderer as TextRenderer
+from plasTeX.Streaming import DocumentStream
+from plasTeX.Streaming import SectionStub
+
+SOURCE = r'''
+\documentclass{report}
+\begin{document}
+See \ref{sec:late}.
+\chapter{One}\label{ch:one}
+a\footnote{first} see \ref{ch:two}
+\section{One A}\label{sec:oa} b
+\section{One B} c
+\subsection{One B i} d
+\chapter{Two}\label{ch:two}
+e\footnote{second} see \ref{sec:oa}
+\section{Two A}\label{sec:late} f
+\end{document}
+'''
+
+def _title(node):
+    if node is None:
+        return '-'
+    return text_type(node.title)
+
+class _OutlineRenderer(Renderer):
+    """ Writes the navigation and the table of contents of each section """
+
+    fileExtension = '.txt'
+
+    def __init__(self):
+        Renderer.__init__(self)
+        self['chapter'] = self['section'] = self['subsection'] = self.section
+        self['ref'] = lambda node: text_type(node.idref['label'].ref)
+        self['footnote'] = lambda node: ''
+        self.kinds = {}
+
+    def section(self, node):
+        links = node.links
+        document = links['document']
+        toc = ','.join(_title(x) for x in document.fulltableofcontents)
+        self.kinds[_title(node)] = [type(x).__name__ for x in document.subsections]
+        return '%s prev=%s next=%s toc=%s footnotes=%s\n%s' % (
+            node.fullTitle, _title(links['prev']), _title(links['next']), toc,
+            len(node.footnotes), text_type(node))
+
+class TestDocumentStream(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = SOURCE
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _newDocument(self):
+        tex = TeX()
+        tex.disableLogging()
+        document = tex.ownerDocument
+        document.config['images']['imager'] = 'none'
+        document.config['images']['vector-imager'] = 'none'
+        document.config['files']['split-level'] = 1
+        document.userdata['jobname'] = 'test'
+        document.userdata['working-dir'] = self.directory
+        tex.input(self.source)
+        return document, tex
+
+    def _read(self, directory):
+        result = {}
+        for name in os.listdir(directory):
+            with open(os.path.join(directory, name)) as f:
+                result[name] = f.read()
+        return result
+
+    def _render(self, stream, renderer=None):
+        directory = os.path.join(self.directory, 'stream' if stream else 'whole')
+        os.mkdir(directory)
+        renderer = renderer or _OutlineRenderer()
+        if stream:
+            DocumentStream(renderer, self._newDocument, directory=directory).render()
+        else:
+            document, tex = self._newDocument()
+            tex.parse()
+            cwd = os.getcwd()
+            os.chdir(directory)
+            try:
+                renderer.render(document)
+            finally:
+                os.chdir(cwd)
+        return renderer, self._read(directory)
+
+    def test_same_output_as_whole_document(self):
+        _, whole = self._render(False)
+        _, streamed = self._render(True)
+        assert_that( streamed, is_( whole ) )
+
+        assert_that( streamed, has_key( 'ch_one.txt' ) )
+        one = streamed['ch_one.txt']
+        assert_that( one, contains_string( '1 One prev= next=One A toc=One,Two footnotes=1' ) )
+        assert_that( one, contains_string( 'see 2' ) )
+        assert_that( streamed['index.txt'], contains_string( 'See 2.1' ) )
+
+    def test_empty_ref(self):
+        # Released labels keep the attributes that render empty
+        self.source = r'''
+\documentclass{report}
+\begin{document}
+\chapter{One}
+\renewcommand{\thefigure}{}
+\begin{figure}a picture\caption{c}\label{fig:x}\end{figure}
+\chapter{Two}
+pictured in Figure \ref{fig:x}.
+\end{document}
+'''
+        _, whole = self._render(False, TextRenderer())
+        _, streamed = self._render(True, TextRenderer())
+        assert_that( streamed, is_( whole ) )
+        assert_that( ''.join(streamed.values()), contains_string( 'pictured in Figure .' ) )
+
+    def test_other_sections_are_stubs(self):
+        renderer, _ = self._render(True)
+        assert_that( renderer.kinds, has_entry( 'One', ['chapter', 'SectionStub'] ) )
+        assert_that( renderer.kinds, has_entry( 'Two', ['SectionStub', 'chapter'] ) )
+
+    def test_collect(self):
+        stream = DocumentStream(_OutlineRenderer(), self._newDocument,
+                                directory=self.directory)
+        stream.collect()
+        try:
+            assert_that( [x.nodeName for x in stream.sections], is_( ['chapter', 'chapter'] ) )
+            one = stream.sections[0]
+            assert_that( isinstance(one, SectionStub), is_( True ) )
+            assert_that( one.filename, is_( 'ch_one.txt' ) )
+            assert_that( [x.title for x in one.subsections], is_( ['One A', 'One B'] ) )
+            assert_that( one.unicode, is_( '' ) )
+
+            assert_that( stream.labels, has_entry( 'sec:late',
+                                                  has_entry( 'url', 'sec_late.txt' ) ) )
+            assert_that( stream.labels['sec:oa']['ref'], is_( '1.1' ) )
+        finally:
+            stream.renderSections()
+
+if __name__ == '__main__':
+    unittest.main()
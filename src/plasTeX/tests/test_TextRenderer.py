@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+.. $Id$
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+logger = __import__('logging').getLogger(__name__)
+
+#disable: accessing protected members, too many methods
+#pylint: disable=W0212,R0904
+
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import is_
+
+from plasTeX.Renderers.Text import TextRenderer
+from plasTeX.Renderers.Text import fitWidths
+
+class TestBlocks(unittest.TestCase):
+
+    def test_indentation(self):
+        renderer = TextRenderer()
+        block = renderer.addBlock('one\ntwo')
+        assert_that( renderer.expandBlocks('a\n  %s\nb' % block),
+                     is_( 'a\n  one\n  two\nb' ) )
+        # Without a line break before it, a block is not indented
+        assert_that( renderer.expandBlocks('a %s' % block), is_( 'a one\ntwo' ) )
+
+    def test_nested(self):
+        renderer = TextRenderer()
+        inner = renderer.addBlock('x\ny')
+        outer = renderer.addBlock('quote\n  %s\nend' % inner)
+        assert_that( renderer.expandBlocks('text\n    %s\n' % outer),
+                     is_( 'text\n    quote\n      x\n      y\n    end\n' ) )
+
+    def test_whitespace_before_is_shared(self):
+        renderer = TextRenderer()
+        first = renderer.addBlock('a\nb\n')
+        second = renderer.addBlock('c\nd')
+        # The second block follows the line break at the end of the first
+        assert_that( renderer.expandBlocks('\n %s  %s' % (first, second)),
+                     is_( '\n a\n b\n   c\n   d' ) )
+
+    def test_backslashes_are_literal(self):
+        renderer = TextRenderer()
+        block = renderer.addBlock(r'C:\new \1')
+        assert_that( renderer.expandBlocks(block), is_( r'C:\new \1' ) )
+
+class TestFitWidths(unittest.TestCase):
+
+    def test_widest_columns_are_narrowed(self):
+        assert_that( fitWidths([2, 2, 2], [10, 30, 20], 30), is_( [10, 10, 10] ) )
+        assert_that( fitWidths([2, 2, 2], [10, 30, 20], 35), is_( [10, 12, 13] ) )
+
+    def test_minimums(self):
+        assert_that( fitWidths([8, 2, 5], [8, 40, 40], 20), is_( [8, 6, 6] ) )
+        assert_that( fitWidths([1, 1], [5, 5], 2), is_( [1, 1] ) )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -119,5 +119,37 @@ class TestTokenizing(TestCase):
         # XXX: Bad test
         self.assertTrue(tokens)
 
+    def testReadRaw(self):
+        tex = TeX().input('a%b\n{c}\\end{x}\\end{x}d')
+        tex.ownerDocument.context.setVerbatimCatcodes()
+        self.assertEqual(tex.readRaw(['\\end{x}', '\\endx']), ('a%b\n{c}', '\\end{x}'))
+        self.assertEqual(tex.lineNumber, 2)
+        # What was read past the end is read again
+        tokens = [x for x in tex.itertokens()]
+        self.assertEqual(tokens, list('\\end{x}d'))
+
+    def testReadRawAcrossLines(self):
+        tex = TeX().input('one\ntwo\nthree')
+        tex.ownerDocument.context.setVerbatimCatcodes()
+        tex.pushToken(Other('0'))
+        self.assertEqual(tex.readRaw(['o\nth']), ('0one\ntw', 'o\nth'))
+        self.assertEqual(tex.readRaw(['x']), ('ree', None))
+        self.assertEqual(tex.lineNumber, 3)
+
+    def testReadRawPushedEscapeSequences(self):
+        tex = TeX().input(' bar\nbaz')
+        tex.ownerDocument.context.setVerbatimCatcodes()
+        tex.pushToken(EscapeSequence('foo'))
+        self.assertEqual(tex.readRaw(['\n']), ('\\foo bar', '\n'))
+        # Paragraph breaks can not be read raw
+        tex.pushToken(EscapeSequence('par'))
+        self.assertEqual(tex.readRaw(['z']), ('', None))
+
+    def testReadRawNeedsVerbatimCatcodes(self):
+        tex = TeX().input(r'a \end')
+        self.assertEqual(tex.readRaw([r'\end']), ('', None))
+        tokens = [x for x in tex.itertokens()]
+        self.assertEqual(tokens, [Letter('a'), Space(' '), EscapeSequence('end')])
+
 if __name__ == '__main__':
     unittest.main()
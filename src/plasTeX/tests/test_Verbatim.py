@@ -37,7 +37,59 @@ class Verbatim(TestCase):
         text = ''.join(output.childNodes[1].childNodes)
         assert intext == text, '"%s" != "%s"' % (intext, text)
 
+    def testEndInsideLine(self):
+        input = 'hi \\begin{verbatim}a {b} \\c %d\\end{verbatim} bye\nnext'
+        s = TeX()
+        s.input(input)
+        output = s.parse()
+        output.normalize()
+        text = ''.join(output.childNodes[1].childNodes)
+        assert text == 'a {b} \\c %d', text
+        assert output.childNodes[2] == ' bye next', output.childNodes[2]
+
+    def testEndVerbatim(self):
+        intext = 'line one\n' * 20
+        input = 'hi \\verbatim %s\\endverbatim bye' % intext
+        s = TeX()
+        s.input(input)
+        output = s.parse()
+        output.normalize()
+        text = ''.join(output.childNodes[1].childNodes)
+        assert text == ' ' + intext, text
+        assert output.childNodes[2] == ' bye', output.childNodes[2]
+
+    def testEndVerbatimInsideEnvironment(self):
+        # \endverbatim only ends verbatim when it was started with \verbatim
+        intext = '\nUse \\verbatim ... \\endverbatim in plain TeX\n'
+        input = '\\begin{verbatim}%s\\end{verbatim} bye' % intext
+        s = TeX()
+        s.input(input)
+        output = s.parse()
+        output.normalize()
+        text = ''.join(output.childNodes[0].childNodes)
+        assert text == intext, text
+        assert output.childNodes[1] == ' bye', output.childNodes[1]
+
+    def testEmptyEndInNextInput(self):
+        s = TeX()
+        s.input('\\end{verbatim} bye')
+        s.input('hi \\begin{verbatim}')
+        output = s.parse()
+        output.normalize()
+        assert output.childNodes[1].nodeName == 'verbatim', output.childNodes
+        text = ''.join(output.childNodes[1].childNodes)
+        assert text == '', text
+        assert output.childNodes[2] == ' bye', output.childNodes[2]
+
+    def testLineNumbers(self):
+        input = 'a\n\\begin{verbatim}\n1\n2\n\\end{verbatim}\n\\foo'
+        s = TeX()
+        s.input(input)
+        for tok in s:
+            if tok.nodeName == 'foo':
+                break
+        assert s.lineNumber == 6, s.lineNumber
+
 
 if __name__ == '__main__':
     unittest.main()
-